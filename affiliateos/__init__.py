@@ -0,0 +1,10 @@
+# Load the Celery app with Django so @shared_task and autodiscovery use it.
+# Celery is only installed where TASK_BACKEND is 'celery'.
+try:
+    from .celery import app as celery_app
+except ModuleNotFoundError as e:
+    if e.name != 'celery':
+        raise
+    celery_app = None
+
+__all__ = ('celery_app',)
@@ -0,0 +1,254 @@
+# affiliateos/cache.py
+"""
+Two-tier cache and versioned key namespaces.
+
+TieredCache is a cache backend that keeps a small per-process LRU (L1) in
+front of a shared cache alias (L2, Redis in production). Reads are served
+from L1 for at most ``LOCAL_TIMEOUT`` seconds, so a value changed by another
+process is seen within that window; writes and deletes go to both tiers.
+``add`` and ``incr`` always go to L2 so locks and counters stay atomic
+across processes.
+
+Namespaces group an app's keys under a version stored in the shared cache:
+
+    products = namespace('product')
+    products.get_or_set(f'commission:{pk}', compute, timeout)
+    products.clear()   # every key in the namespace is retired at once
+
+Versions are counters created with ``add`` and bumped with ``incr`` in the
+shared cache, so every process agrees on them. They are stored without a
+timeout; with Redis, use a ``volatile-*`` eviction policy (or none) so they
+are never evicted and reset to an old value.
+"""
+from collections import OrderedDict
+import pickle
+import threading
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_missing = object()
+
+# Django creates a cache backend instance per thread; the L1 stores are kept
+# here so all threads of a process share one, keyed by LOCATION
+_local_stores = {}
+_local_stores_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """
+    LOCATION names the per-process store, like LocMemCache.
+
+    OPTIONS:
+        SHARED: alias of the shared (L2) cache, default 'shared'
+        LOCAL_MAX_ENTRIES: size of the per-process LRU, default 1000
+        LOCAL_TIMEOUT: longest an L1 entry is trusted, default 5 seconds
+    """
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        super().__init__({k: v for k, v in params.items() if k != 'OPTIONS'})
+        with _local_stores_lock:
+            if location not in _local_stores:
+                _local_stores[location] = (OrderedDict(), threading.Lock())
+            self._local, self._lock = _local_stores[location]
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    # Per-process tier. Values are pickled so callers can't mutate them.
+
+    def _local_key(self, key, version):
+        return self.shared.make_key(key, version=version)
+
+    def _local_get(self, local_key):
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is None:
+                return _missing
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._local[local_key]
+                return _missing
+            self._local.move_to_end(local_key)
+        return pickle.loads(value)
+
+    def _local_set(self, local_key, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self.local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            if timeout <= 0:
+                self._local_delete(local_key)
+                return
+            ttl = min(ttl, timeout)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[local_key] = (time.monotonic() + ttl, data)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self.local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, local_key):
+        with self._lock:
+            self._local.pop(local_key, None)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        local_key = self._local_key(key, version)
+        value = self._local_get(local_key)
+        if value is not _missing:
+            return value
+        value = self.shared.get(key, _missing, version=version)
+        if value is _missing:
+            return default
+        self._local_set(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._local_get(self._local_key(key, version))
+            if value is _missing:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            shared_values = self.shared.get_many(missing, version=version)
+            for key, value in shared_values.items():
+                self._local_set(self._local_key(key, version), value)
+            found.update(shared_values)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout=timeout, version=version)
+        self._local_set(self._local_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout=timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._local_set(self._local_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self._local_key(key, version)
+        added = self.shared.add(key, value, timeout=timeout, version=version)
+        if added:
+            self._local_set(local_key, value, timeout)
+        else:
+            # Another process owns the key; don't trust a local copy of it
+            self._local_delete(local_key)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(self._local_key(key, version))
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self._local_key(key, version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local_delete(self._local_key(key, version))
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._local_get(self._local_key(key, version)) is not _missing:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._local_set(self._local_key(key, version), value)
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def clear_local(self):
+        """Drop this process's L1 entries only"""
+        with self._lock:
+            self._local.clear()
+
+
+class CacheNamespace:
+    """
+    Keys of one app, prefixed with ``name`` and the namespace version.
+    ``clear()`` bumps the version, so old keys are never read again and
+    simply expire.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.version_key = f'ns:{name}:version'
+
+    @property
+    def version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            version = self._seed()
+        return version
+
+    def _seed(self):
+        """
+        Create the version counter. add() and incr() run in the shared
+        tier, so processes seeding at the same time end up on one value.
+        """
+        cache.add(self.version_key, 0, timeout=None)
+        return cache.incr(self.version_key)
+
+    def make_key(self, key):
+        return f'{self.name}:{self.version}:{key}'
+
+    def get(self, key, default=None):
+        return cache.get(self.make_key(key), default)
+
+    def get_many(self, keys):
+        keyed = {self.make_key(key): key for key in keys}
+        return {keyed[k]: value for k, value in cache.get_many(list(keyed)).items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        cache.set(self.make_key(key), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT):
+        return cache.add(self.make_key(key), value, timeout)
+
+    def delete(self, key):
+        cache.delete(self.make_key(key))
+
+    def get_or_set(self, key, compute, timeout=DEFAULT_TIMEOUT):
+        """Return the cached value, computing and storing it on a miss"""
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = compute()
+            self.set(key, value, timeout)
+        return value
+
+    def clear(self):
+        """Retire every key in the namespace"""
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            self._seed()
+
+
+_namespaces = {}
+
+
+def namespace(name):
+    """Return the CacheNamespace called ``name``"""
+    if name not in _namespaces:
+        _namespaces[name] = CacheNamespace(name)
+    return _namespaces[name]
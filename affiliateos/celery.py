@@ -0,0 +1,27 @@
+# affiliateos/celery.py
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'affiliateos.settings')
+
+app = Celery('affiliateos')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+# Importing each app's tasks.py registers its tasks with affiliateos.tasks
+app.autodiscover_tasks()
+
+
+@app.task(bind=True, name='affiliateos.run_task', acks_late=True)
+def run_task(self, name, args, kwargs, idempotency_key=None):
+    """Run an affiliateos.tasks Task by name, retrying with its own backoff"""
+    from .tasks import registry
+
+    task = registry[name]
+    try:
+        task.run(args, kwargs, idempotency_key)
+    except Exception as exc:
+        raise self.retry(
+            exc=exc,
+            countdown=task.backoff(self.request.retries + 1),
+            max_retries=task.max_retries,
+        )
@@ -0,0 +1,225 @@
+# affiliateos/counters.py
+"""
+Buffered counter columns (download counts, view counts).
+
+A hit increments a counter in the shared cache instead of writing the row,
+and ``flush()`` later adds the collected amounts to the database with one
+``UPDATE ... SET field = field + n`` per distinct amount. Rows are never
+read back and rewritten, so concurrent hits can't overwrite each other and
+the rest of the row (``auto_now`` columns included) is left alone.
+
+    class Resource(models.Model):
+        counter_fields = ('download_count', 'view_count')
+
+    counters.register(Resource)               # in AppConfig.ready()
+    counters.incr(Resource, pk, 'view_count')
+
+Flushes are triggered by the hits themselves, at most once every
+``COUNTER_FLUSH_INTERVAL`` seconds across all processes, through the
+background task backend. ``manage.py flush_counters`` writes whatever is
+still pending, e.g. when the application is shut down.
+
+Counters live in the shared cache, which must be Redis (``REDIS_URL``) as
+soon as more than one process serves requests: the LocMem stand-in is per
+process, and a flush only sees the hits of the process it runs in.
+``manage.py check --deploy`` warns about this. Counters that a flush
+brings back to zero leave the index and expire after ``IDLE_TIMEOUT``.
+"""
+from collections import defaultdict
+import logging
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import F
+
+from .tasks import task
+
+logger = logging.getLogger(__name__)
+
+VALUE_KEY = 'counters:{label}:{field}:{pk}'
+INDEX_KEY = 'counters:{label}:index'
+INDEX_LOCK_KEY = 'counters:index-lock'
+FLUSH_LOCK_KEY = 'counters:flush-lock'
+FLUSH_DUE_KEY = 'counters:flush-due'
+
+DEFAULT_FLUSH_INTERVAL = 30
+LOCK_TIMEOUT = 60
+# How long a counter flushed down to zero is kept for further hits
+IDLE_TIMEOUT = 60 * 60 * 24
+
+# model -> counter field names
+registry = {}
+
+
+def _store():
+    """
+    The shared tier of a TieredCache: counters must never be read from a
+    per-process copy
+    """
+    return getattr(cache, 'shared', cache)
+
+
+def _value_key(model, pk, field):
+    return VALUE_KEY.format(label=model._meta.label_lower, field=field, pk=pk)
+
+
+def _index_key(model):
+    return INDEX_KEY.format(label=model._meta.label_lower)
+
+
+def register(model):
+    """Buffer increments of the fields listed in ``model.counter_fields``"""
+    registry[model] = tuple(model.counter_fields)
+
+
+def _update_index(model, change):
+    """Apply ``change`` to the set of indexed pks under the index lock"""
+    store = _store()
+    for _ in range(50):
+        if store.add(INDEX_LOCK_KEY, True, timeout=5):
+            try:
+                index = store.get(_index_key(model)) or set()
+                change(index)
+                store.set(_index_key(model), index, timeout=None)
+            finally:
+                store.delete(INDEX_LOCK_KEY)
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _add_to_index(model, pk):
+    """Remember a row with pending counts so flush() can find it"""
+    if not _update_index(model, lambda index: index.add(pk)):
+        logger.error(f"Could not index counter row {model._meta.label} {pk}, flushing it may be delayed")
+
+
+def incr(model, pk, field, amount=1):
+    """Add ``amount`` to a counter column of one row"""
+    if field not in registry.get(model, ()):
+        raise ValueError(f"{model._meta.label}.{field} is not a registered counter")
+
+    store = _store()
+    key = _value_key(model, pk, field)
+    try:
+        value = store.incr(key, amount)
+    except ValueError:
+        value = None
+    if value == amount:
+        # First hit since a flush brought the counter to zero and left it
+        # to expire; keep it and index the row again
+        if not store.touch(key, timeout=None):
+            value = None
+        else:
+            _add_to_index(model, pk)
+    if value is None:
+        # First hit since the counter was created, expired or evicted
+        if store.add(key, amount, timeout=None):
+            _add_to_index(model, pk)
+        else:
+            store.incr(key, amount)
+
+    interval = getattr(settings, 'COUNTER_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+    if store.add(FLUSH_DUE_KEY, True, timeout=interval):
+        flush_counters.delay()
+
+
+def pending(model, pk, field):
+    """Amount counted for a row but not yet written to the database"""
+    return _store().get(_value_key(model, pk, field)) or 0
+
+
+def _flush_model(model, fields):
+    store = _store()
+    pks = store.get(_index_key(model)) or set()
+    if not pks:
+        return 0
+
+    keys = {(pk, field): _value_key(model, pk, field) for pk in pks for field in fields}
+    values = store.get_many(list(keys.values()))
+
+    # One UPDATE per field and amount; most rows share small amounts
+    by_amount = defaultdict(list)
+    for (pk, field), key in keys.items():
+        amount = values.get(key)
+        if amount:
+            by_amount[field, amount].append(pk)
+
+    updated = 0
+    with transaction.atomic():
+        for (field, amount), amount_pks in by_amount.items():
+            updated += model._base_manager.filter(pk__in=amount_pks).update(**{field: F(field) + amount})
+
+    # Subtract what was written, keeping hits that arrived meanwhile
+    for (field, amount), amount_pks in by_amount.items():
+        for pk in amount_pks:
+            try:
+                store.decr(_value_key(model, pk, field), amount)
+            except ValueError:
+                # Expired or evicted since it was read; the amount is written
+                pass
+
+    _drop_idle(model, fields, pks)
+    return updated
+
+
+def _drop_idle(model, fields, pks):
+    """
+    Take rows whose counters are all zero (or gone) out of the index and
+    let their keys expire. A hit arriving meanwhile re-indexes the row (see
+    incr), which waits for the index lock held here.
+    """
+    store = _store()
+    dropped = set()
+
+    def drop(index):
+        keys = {(pk, field): _value_key(model, pk, field) for pk in pks for field in fields}
+        values = store.get_many(list(keys.values()))
+        for pk in pks:
+            pk_keys = [keys[pk, field] for field in fields]
+            if not any(values.get(key) for key in pk_keys):
+                for key in pk_keys:
+                    store.touch(key, timeout=IDLE_TIMEOUT)
+                index.discard(pk)
+                dropped.add(pk)
+
+    if not _update_index(model, drop):
+        logger.warning(f"Could not lock the counter index of {model._meta.label}, idle rows are kept")
+    return dropped
+
+
+def flush():
+    """
+    Write pending counts to the database. Returns the number of row
+    updates, or None when another process is already flushing.
+    """
+    store = _store()
+    if not store.add(FLUSH_LOCK_KEY, True, timeout=LOCK_TIMEOUT):
+        return None
+    try:
+        return sum(_flush_model(model, fields) for model, fields in registry.items())
+    finally:
+        store.delete(FLUSH_LOCK_KEY)
+
+
+@task(max_retries=1)
+def flush_counters():
+    """Write buffered counter columns to the database"""
+    flush()
+
+
+@checks.register(deploy=True)
+def check_shared_store(app_configs, **kwargs):
+    """Counters need a cache every process shares"""
+    if registry and isinstance(_store(), LocMemCache):
+        return [checks.Warning(
+            "Buffered counters are kept in a per-process LocMem cache.",
+            hint="Set REDIS_URL so every process counts into the same store; "
+                 "otherwise flushes miss the hits of other processes.",
+            id='affiliateos.W001',
+        )]
+    return []
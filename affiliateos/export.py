@@ -0,0 +1,202 @@
+# affiliateos/export.py
+"""
+Streaming CSV and XLSX exports of a viewset's filtered queryset.
+
+    class EarningsViewSet(ExportMixin, viewsets.ModelViewSet):
+        export_filename = 'earnings'
+        export_fields = [
+            ('ID', 'id'),
+            ('Partner', 'partner__name'),
+            ...
+        ]
+
+adds ``GET <list url>/export/?export_format=csv|xlsx``. The rows go through
+the viewset's own ``get_queryset`` and filter backends, so every list filter
+applies to the export too, and are read with ``values_list(...).iterator()``
+and written out as they arrive. Memory use doesn't depend on the number of
+rows.
+
+XLSX files are written with the standard library: a zip streamed without
+seeking, holding a single worksheet of inline strings and numbers.
+"""
+import csv
+from datetime import date, datetime
+from decimal import Decimal
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+
+EXPORT_CHUNK_SIZE = 2000
+
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Cells starting with these are run as formulas by spreadsheet apps
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# Control characters XML 1.0 doesn't allow
+ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def cell_text(value):
+    """Text of a cell: ISO dates, plain decimals, empty for None"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat() if timezone.is_aware(value) else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+class Echo:
+    """File-like object that hands back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    text = cell_text(value)
+    # Keep text that looks like a formula from being run when opened
+    if isinstance(value, str) and text.startswith(FORMULA_PREFIXES):
+        return "'" + text
+    return text
+
+
+def csv_stream(header, rows):
+    writer = csv.writer(Echo())
+    # BOM so Excel opens the file as UTF-8
+    yield '\ufeff' + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([csv_cell(value) for value in row])
+
+
+class ChunkSink:
+    """Write-only, unseekable file collecting zip output between yields"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def xlsx_cell(value):
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c t="n"><v>{value}</v></c>'
+    text = ILLEGAL_XML_CHARS.sub('', cell_text(value))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def xlsx_stream(header, rows, rows_per_chunk=500):
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        yield sink.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(('<row>' + ''.join(xlsx_cell(value) for value in header) + '</row>').encode())
+            for count, row in enumerate(rows, start=1):
+                sheet.write(('<row>' + ''.join(xlsx_cell(value) for value in row) + '</row>').encode())
+                if count % rows_per_chunk == 0:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+EXPORT_FORMATS = {
+    'csv': ('csv', CSV_CONTENT_TYPE, csv_stream),
+    'xlsx': ('xlsx', XLSX_CONTENT_TYPE, xlsx_stream),
+}
+
+
+class ExportMixin:
+    """
+    Adds an ``export`` list action to a viewset. Set ``export_fields`` to
+    (column header, ``values_list`` lookup) pairs and ``export_filename``.
+    """
+    export_fields = []
+    export_filename = 'export'
+    export_chunk_size = EXPORT_CHUNK_SIZE
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'export_format': f"Choose one of: {', '.join(EXPORT_FORMATS)}"})
+        extension, content_type, stream = EXPORT_FORMATS[export_format]
+
+        header = [title for title, _ in self.export_fields]
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .values_list(*[lookup for _, lookup in self.export_fields])
+            .iterator(chunk_size=self.export_chunk_size)
+        )
+
+        filename = f'{self.export_filename}-{timezone.localdate().isoformat()}.{extension}'
+        response = StreamingHttpResponse(stream(header, rows), content_type=content_type)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
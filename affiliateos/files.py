@@ -0,0 +1,257 @@
+# affiliateos/files.py
+"""
+Delivery of stored files (documents, resources) after the view has done its
+permission checks.
+
+    return files.serve(request, document.file, filename, content_type='application/pdf')
+
+``FILE_DELIVERY_BACKEND`` in settings picks how the bytes are sent:
+
+- ``django``: a FileResponse. Under gunicorn the response goes through
+  ``wsgi.file_wrapper``, which sends the file with ``os.sendfile``, but the
+  worker is still busy until the transfer ends.
+- ``x-accel-redirect``: an empty response with ``X-Accel-Redirect`` for nginx.
+  The storage name is appended to ``FILE_DELIVERY_ACCEL_PREFIX``, which must
+  be an ``internal`` location aliased to MEDIA_ROOT:
+
+      location /protected/ {
+          internal;
+          alias /srv/affiliateos/media/;
+      }
+
+- ``x-sendfile``: an empty response with ``X-Sendfile`` holding the absolute
+  path, for Apache mod_xsendfile and lighttpd.
+
+Proxy backends need files on the local filesystem; anything else (e.g. a
+remote storage) is streamed with FileResponse.
+
+Every response carries a strong ETag built from the file's size and mtime
+and a Last-Modified header, and conditional requests are answered with 304
+before any backend runs. A single ``Range: bytes=...`` is answered with 206
+(by the proxy for the proxy backends, which see the original request
+headers); requests for several ranges are rejected with 416.
+"""
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+DEFAULT_BACKEND = 'django'
+DEFAULT_ACCEL_PREFIX = '/protected/'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def _local_path(field_file):
+    """Absolute path of a stored file, or None when the storage isn't local"""
+    try:
+        return os.path.abspath(field_file.path)
+    except NotImplementedError:
+        return None
+
+
+def validators(field_file):
+    """Return (etag, last_modified timestamp, size) for a stored file"""
+    path = _local_path(field_file)
+    if path is not None:
+        stat = os.stat(path)
+        size, mtime_ns = stat.st_size, stat.st_mtime_ns
+    else:
+        size = field_file.size
+        try:
+            mtime_ns = int(field_file.storage.get_modified_time(field_file.name).timestamp() * 10**9)
+        except NotImplementedError:
+            mtime_ns = 0
+    etag = f'"{size:x}-{mtime_ns:x}"'
+    return etag, (mtime_ns // 10**9) or None, size
+
+
+def parse_range(header, size):
+    """
+    Return the (first, last) byte positions asked for by a Range header, or
+    None to send the whole file. Malformed headers (including a last byte
+    before the first) are ignored as RFC 9110 allows; several ranges or one
+    past the end raise RangeNotSatisfiable.
+    """
+    if not header:
+        return None
+    if ',' in header:
+        raise RangeNotSatisfiable
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if size == 0:
+        raise RangeNotSatisfiable
+    if first == '':
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable
+    last = min(int(last), size - 1) if last else size - 1
+    return first, last
+
+
+def _if_range_matches(request, etag, last_modified):
+    """A Range only applies while If-Range, if sent, still matches the file"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return last_modified is not None and parse_http_date_safe(if_range) == last_modified
+
+
+class FileRange:
+    """Reads at most ``length`` bytes of an open file from its position"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class StoredFile:
+    """A file in a storage that isn't attached to a model field"""
+
+    def __init__(self, name, storage=None):
+        self.name = name
+        self.storage = storage or default_storage
+
+    @property
+    def path(self):
+        return self.storage.path(self.name)
+
+    @property
+    def size(self):
+        return self.storage.size(self.name)
+
+    def open(self, mode='rb'):
+        return self.storage.open(self.name, mode)
+
+
+class FileResponseBackend:
+    """Streams the file through the worker"""
+
+    def serve(self, field_file, filename, content_type, as_attachment, byte_range=None, size=None):
+        if byte_range is None:
+            response = FileResponse(field_file.open('rb'), content_type=content_type)
+        else:
+            first, last = byte_range
+            file = field_file.open('rb')
+            file.seek(first)
+            # No fileno(), so the WSGI server reads the range instead of sendfile()-ing the whole file
+            response = FileResponse(FileRange(file, last - first + 1), content_type=content_type, status=206)
+            response['Content-Length'] = last - first + 1
+            response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+        return response
+
+
+class ProxyBackend:
+    """Hands the transfer to the front proxy with a single header"""
+    header = None
+
+    def location(self, field_file, path):
+        raise NotImplementedError
+
+    def serve(self, field_file, filename, content_type, as_attachment, byte_range=None, size=None):
+        path = _local_path(field_file)
+        if path is None:
+            return FileResponseBackend().serve(
+                field_file, filename, content_type, as_attachment, byte_range, size
+            )
+
+        response = HttpResponse(content_type=content_type)
+        response[self.header] = self.location(field_file, path)
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+        return response
+
+
+class XAccelRedirectBackend(ProxyBackend):
+    header = 'X-Accel-Redirect'
+
+    def location(self, field_file, path):
+        prefix = getattr(settings, 'FILE_DELIVERY_ACCEL_PREFIX', DEFAULT_ACCEL_PREFIX)
+        return prefix.rstrip('/') + '/' + quote(field_file.name.lstrip('/'))
+
+
+class XSendfileBackend(ProxyBackend):
+    header = 'X-Sendfile'
+
+    def location(self, field_file, path):
+        return path
+
+
+BACKENDS = {
+    'django': FileResponseBackend,
+    'x-accel-redirect': XAccelRedirectBackend,
+    'x-sendfile': XSendfileBackend,
+}
+
+
+def get_backend():
+    """Return the backend named by FILE_DELIVERY_BACKEND"""
+    return BACKENDS[getattr(settings, 'FILE_DELIVERY_BACKEND', DEFAULT_BACKEND)]()
+
+
+def serve(request, field_file, filename=None, content_type=None, as_attachment=True):
+    """
+    Return a response delivering ``field_file``. Call only after the
+    permission checks; the proxy serves the bytes without asking again.
+
+    ``response.byte_range`` holds the (first, last) positions of a Range
+    request that will be answered with part of the file, whichever backend
+    sends it, and None otherwise.
+    """
+    filename = os.path.basename(filename or field_file.name)
+    content_type = content_type or 'application/octet-stream'
+    etag, last_modified, size = validators(field_file)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    byte_range = None
+    if response is None:
+        if request.method in ('GET', 'HEAD') and _if_range_matches(request, etag, last_modified):
+            try:
+                byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+        if response is None:
+            response = get_backend().serve(
+                field_file, filename, content_type, as_attachment, byte_range, size
+            )
+
+    response.byte_range = byte_range
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    return response
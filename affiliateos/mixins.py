@@ -0,0 +1,54 @@
+class TrackedFieldsMixin:
+    """
+    Model mixin that snapshots the values of ``tracked_fields`` as they were
+    loaded from the database, so saves can detect changes without reading
+    the row again.
+
+    Instances that were not loaded from the database (or whose tracked field
+    was deferred) have no snapshot, and their fields never count as changed.
+    The snapshot is refreshed after every save.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _snapshot_tracked_fields(self, update_fields=None):
+        if update_fields is None:
+            self._loaded_values = {}
+        for name in self.tracked_fields:
+            field = self._meta.get_field(name)
+            if update_fields is not None and not {field.name, field.attname} & set(update_fields):
+                continue
+            # Skip deferred fields rather than triggering a query
+            if field.attname in self.__dict__:
+                self.loaded_values[field.attname] = self.__dict__[field.attname]
+
+    @property
+    def loaded_values(self):
+        """Tracked values as loaded from the database, keyed by attname"""
+        if not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+        return self._loaded_values
+
+    def previous_value(self, field_name):
+        """Return the loaded value of a tracked field, or None without a snapshot"""
+        return self.loaded_values.get(self._meta.get_field(field_name).attname)
+
+    def has_changed(self, field_name):
+        """Return True if a tracked field differs from its loaded value"""
+        attname = self._meta.get_field(field_name).attname
+        if attname not in self.loaded_values:
+            return False
+        return getattr(self, attname) != self.loaded_values[attname]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_tracked_fields(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_tracked_fields(fields)
@@ -0,0 +1,161 @@
+from base64 import b64decode, b64encode
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination over ``(ordering_field, pk)``, newest first.
+
+    Each page filters on the last row of the previous one instead of using
+    OFFSET, so every page costs the same as the first when a composite
+    index on ``(ordering_field, id)`` exists. ``?count=true`` adds an exact
+    total, which is otherwise skipped.
+    """
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering_field, page_size=None, max_page_size=None):
+        self.ordering_field = ordering_field
+        if page_size is not None:
+            self.page_size = page_size
+        if max_page_size is not None:
+            self.max_page_size = max_page_size
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            field = queryset.model._meta.get_field(self.ordering_field)
+            pk_field = queryset.model._meta.pk
+            return (
+                field.to_python(data['v']),
+                pk_field.to_python(data['pk']),
+                bool(data.get('r')),
+            )
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse=False):
+        value = getattr(item, self.ordering_field)
+        data = {
+            'v': value.isoformat() if hasattr(value, 'isoformat') else value,
+            'pk': item.pk,
+        }
+        if reverse:
+            data['r'] = 1
+        encoded = b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+
+        field = self.ordering_field
+        cursor = self.decode_cursor(request, queryset)
+        reverse = bool(cursor and cursor[2])
+
+        if cursor is None:
+            queryset = queryset.order_by(f'-{field}', '-pk')
+        elif not reverse:
+            value, pk, _ = cursor
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+            ).order_by(f'-{field}', '-pk')
+        else:
+            value, pk, _ = cursor
+            queryset = queryset.filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+            ).order_by(field, 'pk')
+
+        # One extra row tells whether there is another page in this direction
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_item = results[-1] if results and (has_more or reverse) else None
+        self.previous_item = results[0] if results and cursor and (has_more or not reverse) else None
+        return results
+
+    def get_next_link(self):
+        if self.next_item is None:
+            return None
+        return self.encode_cursor(self.next_item)
+
+    def get_previous_link(self):
+        if self.previous_item is None:
+            return None
+        return self.encode_cursor(self.previous_item, reverse=True)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+
+class OptionalKeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination that switches to KeysetPagination when the
+    request passes ``?pagination=keyset`` or a keyset ``cursor``.
+    The view names the keyset column in ``keyset_ordering_field``; keyset
+    pages ignore ``?ordering=`` and are always newest first.
+    """
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    keyset = None
+
+    def use_keyset(self, request, view):
+        if not getattr(view, 'keyset_ordering_field', None):
+            return False
+        return (
+            request.query_params.get('pagination') == 'keyset'
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request, view):
+            self.keyset = KeysetPagination(
+                view.keyset_ordering_field,
+                page_size=self.page_size,
+                max_page_size=self.max_page_size,
+            )
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
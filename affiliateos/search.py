@@ -0,0 +1,276 @@
+# affiliateos/search.py
+"""
+Full-text search over the text columns of registered models.
+
+The backend is picked from the database vendor: Postgres matches against a
+GIN expression index on ``to_tsvector``, SQLite against an FTS5 table kept
+in sync by save/delete signals, and anything else falls back to OR-ed
+``icontains`` filters. ``SEARCH_BACKEND`` in settings overrides the choice.
+
+Every search term becomes a prefix match on each of its words, so typing
+part of a name, email or phone number behaves the same on every backend.
+Matches are annotated with ``search_rank`` (higher is better) and ordered
+by it.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections, migrations, router
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from rest_framework.filters import BaseFilterBackend
+
+# No stemming: prefix matches on raw words work for names, emails and phones
+POSTGRES_SEARCH_CONFIG = 'simple'
+FTS5_TOKENIZER = 'unicode61 remove_diacritics 2'
+
+# model -> indexed field names
+registry = {}
+
+# database alias -> backend. Backends keep the alias, not the connection:
+# connection objects belong to the thread that opened them.
+_backends = {}
+
+
+def search_words(term):
+    """Split a user search term into lowercase words"""
+    return re.findall(r'\w+', (term or '').lower())
+
+
+class IcontainsSearchBackend:
+    """Sequential-scan fallback for databases without full-text support"""
+    name = 'icontains'
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def connection(self):
+        """The calling thread's connection for this database"""
+        return connections[self.alias]
+
+    def search(self, queryset, fields, words):
+        query = Q()
+        for word in words:
+            word_query = Q()
+            for field in fields:
+                word_query |= Q(**{f'{field}__icontains': word})
+            query &= word_query
+        return queryset.filter(query)
+
+    def create_index(self, schema_editor, model, fields, index_name):
+        pass
+
+    def drop_index(self, schema_editor, model, fields, index_name):
+        pass
+
+    def index_objects(self, model, objects, created=False):
+        pass
+
+    def remove_objects(self, model, pks):
+        pass
+
+    def rebuild_index(self, model):
+        # Nothing is stored outside the table itself
+        return None
+
+
+class PostgresSearchBackend(IcontainsSearchBackend):
+    """to_tsvector matching backed by a GIN expression index"""
+    name = 'postgres'
+
+    def vector(self, fields):
+        from django.contrib.postgres.search import SearchVector
+
+        return SearchVector(*fields, config=POSTGRES_SEARCH_CONFIG)
+
+    def search(self, queryset, fields, words):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        query = SearchQuery(
+            ' & '.join(f'{word}:*' for word in words),
+            search_type='raw',
+            config=POSTGRES_SEARCH_CONFIG,
+        )
+        # The vector expression must compile exactly like the index one
+        return queryset.alias(search_vector=self.vector(fields)).filter(
+            search_vector=query
+        ).annotate(search_rank=SearchRank(self.vector(fields), query))
+
+    def create_index(self, schema_editor, model, fields, index_name):
+        from django.contrib.postgres.indexes import GinIndex
+
+        schema_editor.add_index(model, GinIndex(self.vector(fields), name=index_name))
+
+    def drop_index(self, schema_editor, model, fields, index_name):
+        from django.contrib.postgres.indexes import GinIndex
+
+        schema_editor.remove_index(model, GinIndex(self.vector(fields), name=index_name))
+
+
+class SQLiteFTSSearchBackend(IcontainsSearchBackend):
+    """FTS5 table per model, keyed by the model's primary key as rowid"""
+    name = 'sqlite_fts5'
+
+    def fts_table(self, model):
+        return f'{model._meta.db_table}_fts'
+
+    def search(self, queryset, fields, words):
+        quote = self.connection.ops.quote_name
+        fts_table = quote(self.fts_table(queryset.model))
+        match = ' '.join(f'"{word}"*' for word in words)
+        pk_column = f'{quote(queryset.model._meta.db_table)}.{quote(queryset.model._meta.pk.column)}'
+        # Joining the FTS table lets it drive the query; bm25 is negative,
+        # lower meaning a better match
+        return queryset.extra(
+            select={'search_rank': f'-bm25({fts_table})'},
+            tables=[self.fts_table(queryset.model)],
+            where=[f'{fts_table} MATCH %s', f'{fts_table}.rowid = {pk_column}'],
+            params=[match],
+        )
+
+    def create_index(self, schema_editor, model, fields, index_name):
+        quote = schema_editor.quote_name
+        columns = ', '.join(quote(field) for field in fields)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {quote(self.fts_table(model))} "
+            f"USING fts5({columns}, tokenize='{FTS5_TOKENIZER}')"
+        )
+        self._populate(schema_editor.connection, model, fields)
+
+    def drop_index(self, schema_editor, model, fields, index_name):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {schema_editor.quote_name(self.fts_table(model))}')
+
+    def _populate(self, connection, model, fields):
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(model._meta.get_field(field).column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {quote(self.fts_table(model))}')
+            cursor.execute(
+                f'INSERT INTO {quote(self.fts_table(model))} (rowid, {", ".join(quote(f) for f in fields)}) '
+                f'SELECT {quote(model._meta.pk.column)}, {columns} FROM {quote(model._meta.db_table)}'
+            )
+            return cursor.rowcount
+
+    def index_objects(self, model, objects, created=False):
+        fields = registry[model]
+        rows = [[obj.pk] + [getattr(obj, field) or '' for field in fields] for obj in objects]
+        if not rows:
+            return
+        table = self.connection.ops.quote_name(self.fts_table(model))
+        columns = ', '.join(self.connection.ops.quote_name(field) for field in fields)
+        placeholders = ', '.join(['%s'] * (len(fields) + 1))
+        if not created:
+            self.remove_objects(model, [row[0] for row in rows])
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} (rowid, {columns}) VALUES ({placeholders})', rows
+            )
+
+    def remove_objects(self, model, pks):
+        table = self.connection.ops.quote_name(self.fts_table(model))
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [[pk] for pk in pks])
+
+    def rebuild_index(self, model):
+        return self._populate(self.connection, model, registry[model])
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (IcontainsSearchBackend, PostgresSearchBackend, SQLiteFTSSearchBackend)
+}
+
+
+def _sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def get_backend(connection):
+    """Return the search backend for a database connection"""
+    backend = _backends.get(connection.alias)
+    if backend is not None:
+        return backend
+
+    name = getattr(settings, 'SEARCH_BACKEND', None)
+    if name is None:
+        if connection.vendor == 'postgresql':
+            name = PostgresSearchBackend.name
+        elif connection.vendor == 'sqlite' and _sqlite_has_fts5(connection):
+            name = SQLiteFTSSearchBackend.name
+        else:
+            name = IcontainsSearchBackend.name
+    backend = _backends[connection.alias] = BACKENDS[name](connection.alias)
+    return backend
+
+
+def _backend_for(model):
+    return get_backend(connections[router.db_for_write(model)])
+
+
+def search(queryset, term):
+    """Filter a registered model's queryset to rows matching ``term``, best first"""
+    words = search_words(term)
+    if not words:
+        return queryset
+    backend = get_backend(connections[queryset.db])
+    queryset = backend.search(queryset, registry[queryset.model], words)
+    if backend.name == IcontainsSearchBackend.name:
+        return queryset
+    return queryset.order_by('-search_rank', '-pk')
+
+
+def index_objects(model, objects, created=False):
+    """
+    Index objects written without save signals, e.g. by bulk_create.
+    Pass created=True for new rows to skip clearing their old entries.
+    """
+    _backend_for(model).index_objects(model, objects, created=created)
+
+
+def rebuild_index(model):
+    """Reindex every row of a registered model; returns the row count, or None if the backend keeps no separate index"""
+    return _backend_for(model).rebuild_index(model)
+
+
+def _index_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(registry[sender]):
+        return
+    index_objects(sender, [instance], created=created)
+
+
+def _remove_deleted(sender, instance, **kwargs):
+    _backend_for(sender).remove_objects(sender, [instance.pk])
+
+
+def register(model):
+    """Index the model's ``search_index_fields`` and keep them in sync on save/delete"""
+    registry[model] = tuple(model.search_index_fields)
+    post_save.connect(_index_saved, sender=model, dispatch_uid=f'search_index_{model._meta.label}')
+    post_delete.connect(_remove_deleted, sender=model, dispatch_uid=f'search_remove_{model._meta.label}')
+
+
+def create_search_index(app_label, model_name, fields, index_name):
+    """Migration operation creating (and filling) the search index for a model"""
+    def forwards(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        get_backend(schema_editor.connection).create_index(schema_editor, model, fields, index_name)
+
+    def backwards(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        get_backend(schema_editor.connection).drop_index(schema_editor, model, fields, index_name)
+
+    return migrations.RunPython(forwards, backwards)
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """DRF filter backend running ``?search=`` through the search index"""
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param)
+        if not term:
+            return queryset
+        return search(queryset, term)
@@ -0,0 +1,190 @@
+# affiliateos/tasks.py
+"""
+Background tasks for side effects that don't need to finish inside the
+request: emails, activity logs, derived rows.
+
+    @task(max_retries=3)
+    def send_something(user_id):
+        ...
+
+    send_something.delay(user.pk, idempotency_key=f'something:{user.pk}')
+
+``delay`` queues the call once the surrounding transaction commits, so a
+task never sees uncommitted rows or runs for a rolled back request.
+Arguments must be JSON-friendly (ids, not model instances).
+
+``TASK_BACKEND`` in settings picks where tasks run:
+
+- ``celery``: sent to the Celery workers (``celery -A affiliateos worker``).
+  The default when ``CELERY_BROKER_URL`` or ``REDIS_URL`` is set.
+- ``thread``: an in-process worker thread, for local runs only
+  (``TASK_BACKEND=thread``). Queued tasks are lost if the process exits.
+- ``eager``: run straight away on commit, in the calling thread. The default
+  without a broker; tests use it with ``captureOnCommitCallbacks(execute=True)``.
+
+Failed tasks are retried up to ``max_retries`` times with exponential
+backoff. An ``idempotency_key`` makes repeated calls with the same key run
+at most once while the key is remembered (``IDEMPOTENCY_TTL``).
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY = 'tasks:idempotency:{key}'
+IDEMPOTENCY_TTL = 60 * 60 * 24
+
+DEFAULT_BACKEND = 'eager'
+
+# name -> Task, so Celery workers can find tasks by name
+registry = {}
+
+
+class Task:
+    def __init__(self, func, name=None, max_retries=3, retry_delay=5):
+        self.func = func
+        self.name = name or f'{func.__module__}.{func.__name__}'
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.__doc__ = func.__doc__
+        registry[self.name] = self
+
+    def __call__(self, *args, **kwargs):
+        """Run synchronously, without retries or idempotency checks"""
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, idempotency_key=None, **kwargs):
+        """Queue the task to run after the current transaction commits"""
+        backend = get_backend()
+        transaction.on_commit(
+            lambda: backend.enqueue(self, args, kwargs, idempotency_key)
+        )
+
+    def backoff(self, attempt):
+        """Seconds to wait before retry number ``attempt`` (1-based)"""
+        return self.retry_delay * 2 ** (attempt - 1)
+
+    def run(self, args, kwargs, idempotency_key=None):
+        """
+        Run once, honouring the idempotency key. Returns False if the key
+        was already claimed and the call was skipped.
+        """
+        key = IDEMPOTENCY_KEY.format(key=idempotency_key) if idempotency_key else None
+        if key and not cache.add(key, 'running', IDEMPOTENCY_TTL):
+            logger.info(f"Skipping task {self.name}: {idempotency_key} already ran")
+            return False
+        try:
+            self.func(*args, **kwargs)
+        except Exception:
+            # Release the key so a retry can claim it again
+            if key:
+                cache.delete(key)
+            raise
+        if key:
+            cache.set(key, 'done', IDEMPOTENCY_TTL)
+        return True
+
+
+def task(func=None, **options):
+    """Turn a function into a Task; usable with or without arguments"""
+    if func is None:
+        return lambda f: Task(f, **options)
+    return Task(func, **options)
+
+
+class EagerBackend:
+    """Runs tasks in the calling thread, retrying without sleeping"""
+
+    def enqueue(self, task, args, kwargs, idempotency_key):
+        for attempt in range(task.max_retries + 1):
+            try:
+                task.run(args, kwargs, idempotency_key)
+                return
+            except Exception:
+                if attempt == task.max_retries:
+                    logger.exception(f"Task {task.name} failed after {attempt + 1} attempts")
+                else:
+                    logger.warning(f"Task {task.name} failed, retrying ({attempt + 1}/{task.max_retries})")
+
+
+class ThreadBackend:
+    """A single daemon worker thread fed from an in-memory queue"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def enqueue(self, task, args, kwargs, idempotency_key, attempt=0):
+        self.ensure_worker()
+        self.queue.put((task, args, kwargs, idempotency_key, attempt))
+
+    def ensure_worker(self):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.work, name='affiliateos-tasks', daemon=True)
+                self.worker.start()
+
+    def work(self):
+        while True:
+            task, args, kwargs, idempotency_key, attempt = self.queue.get()
+            close_old_connections()
+            try:
+                task.run(args, kwargs, idempotency_key)
+            except Exception:
+                if attempt >= task.max_retries:
+                    logger.exception(f"Task {task.name} failed after {attempt + 1} attempts")
+                else:
+                    delay = task.backoff(attempt + 1)
+                    logger.warning(f"Task {task.name} failed, retrying in {delay}s")
+                    timer = threading.Timer(
+                        delay, self.enqueue, (task, args, kwargs, idempotency_key, attempt + 1)
+                    )
+                    timer.daemon = True
+                    timer.start()
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+    def join(self, timeout=None):
+        """Wait until queued tasks are done (retries scheduled later are not waited for)"""
+        deadline = time.monotonic() + timeout if timeout else None
+        while self.queue.unfinished_tasks:
+            if deadline and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+class CeleryBackend:
+    """Sends tasks to Celery through the generic run_task task"""
+
+    def enqueue(self, task, args, kwargs, idempotency_key):
+        from .celery import run_task
+
+        run_task.apply_async((task.name, list(args), kwargs, idempotency_key))
+
+
+BACKENDS = {
+    'eager': EagerBackend,
+    'thread': ThreadBackend,
+    'celery': CeleryBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the backend named by TASK_BACKEND, one instance per name"""
+    name = getattr(settings, 'TASK_BACKEND', DEFAULT_BACKEND)
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
@@ -0,0 +1,103 @@
+# authentication/roles.py
+from django.db import transaction
+
+from affiliateos.cache import namespace
+
+# Staff in this group are scoped like support agents
+SUPPORT_AGENT_GROUP = 'Support Agents'
+
+roles_cache = namespace('roles')
+
+# Shared cache lifetime; user, group and partner profile changes also
+# invalidate it, so this only bounds how stale a missed signal can be
+ROLES_TTL = 60
+
+
+class Roles:
+    """
+    A user's effective roles, resolved once and reused by permission
+    classes and querysets. Plain values only, so it pickles into the cache.
+    """
+
+    def __init__(self, user_id=None, is_staff=False, is_superuser=False, user_type=None,
+                 is_support_agent=False, partner_profile_id=None, permissions=frozenset()):
+        self.user_id = user_id
+        self.is_staff = is_staff
+        self.is_superuser = is_superuser
+        self.user_type = user_type
+        self.is_support_agent = is_support_agent
+        self.partner_profile_id = partner_profile_id
+        self.permissions = permissions
+
+    @property
+    def is_admin(self):
+        return self.is_staff and self.user_type == 'admin'
+
+    @property
+    def is_partner(self):
+        return self.partner_profile_id is not None
+
+    def has_perm(self, perm):
+        """Same answer as User.has_perm for an active user"""
+        return self.is_superuser or perm in self.permissions
+
+
+ANONYMOUS_ROLES = Roles()
+
+
+def compute_roles(user):
+    """Resolve roles from the database"""
+    from partner.models import PartnerProfile
+
+    group_names = set(user.groups.values_list('name', flat=True))
+    partner_profile_id = PartnerProfile.objects.filter(user_id=user.pk).values_list('id', flat=True).first()
+    # Only staff checks look at model permissions
+    permissions = frozenset()
+    if user.is_staff and not user.is_superuser:
+        permissions = frozenset(user.get_all_permissions())
+
+    return Roles(
+        user_id=user.pk,
+        is_staff=user.is_staff,
+        is_superuser=user.is_superuser,
+        user_type=user.user_type,
+        is_support_agent=user.is_staff and (
+            user.user_type == 'support_agent' or SUPPORT_AGENT_GROUP in group_names
+        ),
+        partner_profile_id=partner_profile_id,
+        permissions=permissions,
+    )
+
+
+def roles_for_user(user):
+    """Return a user's roles from the shared cache, computing them on a miss"""
+    if user is None or not user.is_authenticated:
+        return ANONYMOUS_ROLES
+
+    return roles_cache.get_or_set(user.pk, lambda: compute_roles(user), ROLES_TTL)
+
+
+def get_roles(request):
+    """
+    Return the roles of the request's user, resolved at most once per request.
+    Works with both DRF and plain Django requests.
+    """
+    django_request = getattr(request, '_request', request)
+    user = getattr(request, 'user', None)
+    user_id = getattr(user, 'pk', None)
+
+    cached = getattr(django_request, '_roles', None)
+    # Authentication may swap the user after an early lookup
+    if cached is None or cached.user_id != user_id:
+        cached = django_request._roles = roles_for_user(user)
+    return cached
+
+
+def invalidate_user(user_id):
+    """Drop one user's cached roles once the current transaction commits"""
+    transaction.on_commit(lambda: roles_cache.delete(user_id))
+
+
+def invalidate_all():
+    """Drop every user's cached roles, e.g. after a group's permissions change"""
+    transaction.on_commit(roles_cache.clear)
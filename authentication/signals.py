@@ -0,0 +1,45 @@
+# authentication/signals.py
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import roles
+from .models import User
+
+M2M_ACTIONS = ('post_add', 'post_remove', 'post_clear')
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which no role depends on
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    roles.invalidate_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_m2m_changed(sender, instance, action, reverse, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if reverse:
+        # Changed from the group/permission side, possibly for many users
+        roles.invalidate_all()
+    else:
+        roles.invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Group)
+def group_changed(sender, instance, **kwargs):
+    roles.invalidate_all()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action, **kwargs):
+    if action in M2M_ACTIONS:
+        roles.invalidate_all()
+
+
+@receiver([post_save, post_delete], sender='partner.PartnerProfile')
+def partner_profile_changed(sender, instance, **kwargs):
+    roles.invalidate_user(instance.user_id)
@@ -0,0 +1,16 @@
+# authentication/tasks.py
+from django.conf import settings
+from django.core.mail import send_mail
+
+from affiliateos.tasks import task
+
+
+@task(max_retries=5, retry_delay=30)
+def send_password_reset_email(email, reset_url):
+    send_mail(
+        'Password Reset Request',
+        f'Reset your password: {reset_url}',
+        settings.DEFAULT_FROM_EMAIL,
+        [email],
+        fail_silently=False,
+    )
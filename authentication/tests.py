@@ -1,3 +1,49 @@
-from django.test import TestCase
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
 
-# Create your tests here.
+from partner.models import PartnerProfile
+
+from .models import User
+from .roles import SUPPORT_AGENT_GROUP, get_roles, roles_for_user
+
+
+class RolesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='staff@example.com', password='pass', is_staff=True)
+
+    def test_roles_are_resolved_once_per_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+
+        # Groups, partner profile, and user + group permissions for staff
+        with self.assertNumQueries(4):
+            roles = get_roles(request)
+        with self.assertNumQueries(0):
+            self.assertIs(get_roles(request), roles)
+
+        # A new request for the same user is served from the shared cache
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(0):
+            self.assertTrue(get_roles(request).is_staff)
+
+    def test_group_membership_invalidates_cached_roles(self):
+        self.assertFalse(roles_for_user(self.user).is_support_agent)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(Group.objects.create(name=SUPPORT_AGENT_GROUP))
+
+        self.assertTrue(roles_for_user(self.user).is_support_agent)
+
+    def test_partner_profile_invalidates_cached_roles(self):
+        self.assertFalse(roles_for_user(self.user).is_partner)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = PartnerProfile.objects.create(
+                user=self.user, name='Partner', email='profile@example.com',
+                phone='000', role='Consultant'
+            )
+
+        self.assertEqual(roles_for_user(self.user).partner_profile_id, profile.pk)
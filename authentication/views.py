@@ -2,7 +2,6 @@ import logging
 from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
 from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from rest_framework import generics, permissions, status
@@ -12,6 +11,7 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import User
+from .tasks import send_password_reset_email
 from .serializers import (
     UserCreateSerializer,
     MyTokenObtainPairSerializer,
@@ -85,12 +85,9 @@ class PasswordResetRequestView(APIView):
             uid = urlsafe_base64_encode(force_bytes(user.pk))
             token = default_token_generator.make_token(user)
             reset_url = f"{settings.FRONTEND_URL}/reset-password?token={token}&uid={uid}"
-            send_mail(
-                'Password Reset Request',
-                f'Reset your password: {reset_url}',
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-                fail_silently=False,
+            # The same token is only mailed once
+            send_password_reset_email.delay(
+                email, reset_url, idempotency_key=f'password-reset:{user.pk}:{token}'
             )
             return Response({'detail': 'Password reset link sent.'}, status=200)
         except User.DoesNotExist:
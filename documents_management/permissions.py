@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from authentication.roles import get_roles
+
 class IsOwnerOrStaff(permissions.BasePermission):
     """
     Custom permission to only allow owners of a document to view or edit it,
@@ -18,18 +20,19 @@ class IsOwnerOrStaff(permissions.BasePermission):
         - For unsafe methods, user is staff with appropriate permissions
         """
         # Owner can always view and edit their own documents
-        if obj.user == request.user:
+        if obj.user_id == request.user.pk:
             return True
         
+        roles = get_roles(request)
         # Staff with view_all_documents permission can view any document
         if request.method in permissions.SAFE_METHODS:
-            return request.user.is_staff and request.user.has_perm('documents.view_all_documents')
+            return roles.is_staff and roles.has_perm('documents.view_all_documents')
         
         # For unsafe methods, staff needs additional permissions
         return (
-            request.user.is_staff and 
-            (request.user.has_perm('documents.change_document') or 
-             request.user.has_perm('documents.verify_document'))
+            roles.is_staff and 
+            (roles.has_perm('documents.change_document') or 
+             roles.has_perm('documents.verify_document'))
         )
 
 
@@ -40,9 +43,5 @@ class CanVerifyDocument(permissions.BasePermission):
     
     def has_permission(self, request, view):
         """Check if user has permission to verify documents."""
-        return (
-            request.user and 
-            request.user.is_authenticated and 
-            request.user.is_staff and
-            request.user.has_perm('documents.verify_document')
-        )
\ No newline at end of file
+        roles = get_roles(request)
+        return roles.is_staff and roles.has_perm('documents.verify_document')
\ No newline at end of file
@@ -1,3 +1,91 @@
-from django.test import TestCase
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from .models import Document
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], MEDIA_ROOT=MEDIA_ROOT)
+class DocumentFileDeliveryTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.document = Document.objects.create(
+            user=self.user, name='Contract',
+            file=SimpleUploadedFile('contract.pdf', b'%PDF-1.4 contract', content_type='application/pdf'),
+        )
+        self.client.force_login(self.user)
+        self.url = f'/api/download/{self.document.pk}/'
+
+    def test_file_is_streamed_by_default(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 contract')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    @override_settings(FILE_DELIVERY_BACKEND='x-accel-redirect')
+    def test_x_accel_redirect_hands_off_to_proxy(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.document.file.name}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('contract', response['Content-Disposition'])
+
+    @override_settings(FILE_DELIVERY_BACKEND='x-sendfile')
+    def test_permission_is_checked_before_hand_off(self):
+        other = User.objects.create_user(email='other@example.com', password='pass')
+        self.client.force_login(other)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('X-Sendfile', response)
+
+    def test_single_range_returns_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=9-16')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'contract')
+        self.assertEqual(response['Content-Range'], 'bytes 9-16/17')
+        self.assertEqual(response['Content-Length'], '8')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-8')
+        self.assertEqual(b''.join(response.streaming_content), b'contract')
+
+    def test_multiple_or_unsatisfiable_ranges_are_rejected(self):
+        for header in ('bytes=0-1,4-5', 'bytes=100-'):
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response['Content-Range'], 'bytes */17')
+
+    def test_malformed_ranges_get_the_whole_file(self):
+        for header in ('bytes=5-3', 'bytes=abc', 'items=0-4'):
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200, header)
+            self.assertEqual(len(b''.join(response.streaming_content)), 17)
+
+    def test_conditional_requests(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # A stale If-Range gets the whole file instead of a range of the new one
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
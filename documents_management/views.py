@@ -6,17 +6,17 @@ from rest_framework.response import Response
 from django.utils import timezone
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse, FileResponse
+from django.http import HttpResponse
 from rest_framework import serializers
 import os
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
-from urllib.parse import quote as urlquote
-from django.http import FileResponse
 from django.views.decorators.clickjacking import xframe_options_exempt
 from .models import Document, DocumentRequirement
 from .serializers import DocumentSerializer, DocumentRequirementSerializer
 from .permissions import IsOwnerOrStaff, CanVerifyDocument
+from affiliateos import files
+from authentication.roles import get_roles
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -40,7 +40,8 @@ class DocumentViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(user_id=user_id)
         
         # Permission checks
-        if user.is_staff and user.has_perm('documents.view_all_documents'):
+        roles = get_roles(self.request)
+        if roles.is_staff and roles.has_perm('documents.view_all_documents'):
             return queryset
         return queryset.filter(user=user)
     
@@ -186,9 +187,9 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 '.png': 'image/png',
             }.get(ext, 'application/octet-stream')
 
-            response = FileResponse(open(file_path, 'rb'), content_type=content_type)
-            response['Content-Disposition'] = f'inline; filename="{unquote(document.file.name)}"'
-            return response
+            return files.serve(
+                request, document.file, document.file_name, content_type=content_type, as_attachment=False
+            )
 
         except Exception as e:
             return Response({'error': str(e)}, status=500)
@@ -223,10 +224,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            response = FileResponse(open(file_path, 'rb'))
-            response['Content-Type'] = 'application/octet-stream'
-            response['Content-Disposition'] = f'attachment; filename="{quote(document.file.name)}"'
-            return response
+            return files.serve(request, document.file, document.file_name)
 
         except Exception as e:
             logger.error(f"Error downloading document: {str(e)}")
@@ -281,9 +279,9 @@ def document_view(request, pk):
     logger.debug(f"Attempting to view document with pk={pk}")
     document = get_object_or_404(Document, pk=pk)
     
-    if document.user != request.user and not (
-        request.user.is_staff and 
-        request.user.has_perm('documents.view_all_documents')
+    roles = get_roles(request)
+    if document.user_id != request.user.pk and not (
+        roles.is_staff and roles.has_perm('documents.view_all_documents')
     ):
         logger.warning("Permission denied when viewing document.")
         raise PermissionDenied("You don't have permission to view this document.")
@@ -301,14 +299,13 @@ def document_view(request, pk):
         'text/html'
     ]
     
-    disposition = 'inline' if document.content_type in displayable_types else 'attachment'
-    logger.debug(f"Content-Disposition set to: {disposition}")
+    as_attachment = document.content_type not in displayable_types
+    logger.debug(f"Serving document as {'attachment' if as_attachment else 'inline'}")
 
-    response = FileResponse(document.file)
-    response['Content-Type'] = document.content_type or 'application/octet-stream'
-    response['Content-Disposition'] = f'{disposition}; filename="{urlquote(document.file_name or document.file.name)}"'
-    
-    return response
+    return files.serve(
+        request, document.file, document.file_name,
+        content_type=document.content_type, as_attachment=as_attachment
+    )
 
 
 @login_required
@@ -316,9 +313,9 @@ def document_download_view(request, pk):
     logger.debug(f"Attempting to download document with pk={pk}")
     document = get_object_or_404(Document, pk=pk)
     
-    if document.user != request.user and not (
-        request.user.is_staff and 
-        request.user.has_perm('documents.view_all_documents')
+    roles = get_roles(request)
+    if document.user_id != request.user.pk and not (
+        roles.is_staff and roles.has_perm('documents.view_all_documents')
     ):
         logger.warning("Permission denied when downloading document.")
         raise PermissionDenied("You don't have permission to download this document.")
@@ -327,8 +324,4 @@ def document_download_view(request, pk):
         logger.warning("Document has no file.")
         return HttpResponse("No file available for this document.", status=404)
     
-    response = FileResponse(document.file)
-    response['Content-Type'] = document.content_type or 'application/octet-stream'
-    response['Content-Disposition'] = f'attachment; filename="{urlquote(document.file_name or document.file.name)}"'
-    
-    return response
+    return files.serve(request, document.file, document.file_name, content_type=document.content_type)
@@ -1,5 +1,7 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
+from django.utils import timezone
+from . import catalog
 from .models import PartnerOnboardingLink, Product, Testimonial, PartnerProfile
 from django.utils.html import format_html
 from django.db.models import Count, Sum
@@ -101,12 +103,18 @@ class ProductAdmin(admin.ModelAdmin):
     conversion_rate_display.short_description = _('Conversion Rate')
 
     def activate_products(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        product_ids = list(queryset.values_list('id', flat=True))
+        # update() skips auto_now and signals, so stamp and invalidate here
+        updated = queryset.update(is_active=True, updated_at=timezone.now())
+        catalog.invalidate_products(product_ids)
         self.message_user(request, f"{updated} products activated")
     activate_products.short_description = _("Activate selected products")
 
     def deactivate_products(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        product_ids = list(queryset.values_list('id', flat=True))
+        # update() skips auto_now and signals, so stamp and invalidate here
+        updated = queryset.update(is_active=False, updated_at=timezone.now())
+        catalog.invalidate_products(product_ids)
         self.message_user(request, f"{updated} products deactivated")
     deactivate_products.short_description = _("Deactivate selected products")
 
@@ -304,6 +312,9 @@ class PartnerProfileAdmin(admin.ModelAdmin):
     filter_horizontal = ('selected_products', 'testimonials')
     actions = ['activate_partners', 'suspend_partners', 'deactivate_partners']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stats()
+
     def status_display(self, obj):
         return obj.get_status_display()
     status_display.short_description = _('Status')
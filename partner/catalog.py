@@ -0,0 +1,82 @@
+# partner/catalog.py
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+
+from affiliateos.cache import namespace
+
+products_cache = namespace('product')
+CACHE_KEY = 'catalog:{product_id}'
+
+
+def _fields_signature():
+    from .serializers import ProductSerializer
+
+    return ','.join(ProductSerializer.Meta.fields)
+
+
+def validators(rows, extra=''):
+    """
+    Return a strong ETag and a Last-Modified timestamp for catalog rows of
+    (id, updated_at). The serialized fields are part of the ETag so a
+    changed serializer never matches an old one. The timestamp is in whole
+    seconds, like the HTTP dates If-Modified-Since is compared against.
+    """
+    digest = hashlib.sha256(f'{_fields_signature()}|{extra}'.encode())
+    for product_id, updated_at in rows:
+        digest.update(f'|{product_id}:{updated_at.isoformat()}'.encode())
+    last_modified = max((updated_at for _, updated_at in rows), default=None)
+    return f'"{digest.hexdigest()[:32]}"', int(last_modified.timestamp()) if last_modified else None
+
+
+def set_validators(response, etag, last_modified):
+    """Attach validators and make clients revalidate before reuse"""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def serialized_products(product_ids, request=None):
+    """
+    Return serialized products in the order of ``product_ids``, loading
+    only the ones missing from the cache. Image URLs are cached relative
+    and made absolute for the current request.
+    """
+    from .models import Product
+    from .serializers import ProductSerializer
+
+    keys = {CACHE_KEY.format(product_id=pk): pk for pk in product_ids}
+    cached = {keys[key]: data for key, data in products_cache.get_many(list(keys)).items()}
+
+    missing = [pk for pk in product_ids if pk not in cached]
+    if missing:
+        for product in Product.objects.filter(pk__in=missing):
+            data = ProductSerializer(product).data
+            products_cache.set(CACHE_KEY.format(product_id=product.pk), data, settings.CACHE_TTL)
+            cached[product.pk] = data
+
+    results = []
+    for pk in product_ids:
+        if pk not in cached:
+            continue
+        data = dict(cached[pk])
+        if request is not None and data.get('image'):
+            data['image'] = request.build_absolute_uri(data['image'])
+        results.append(data)
+    return results
+
+
+def invalidate_products(product_ids):
+    """Drop cached catalog entries once the current transaction commits"""
+    product_ids = list(product_ids)
+
+    def delete():
+        for pk in product_ids:
+            products_cache.delete(CACHE_KEY.format(product_id=pk))
+
+    transaction.on_commit(delete)
@@ -0,0 +1,36 @@
+# partner/commission.py
+from django.conf import settings
+
+from affiliateos.cache import namespace
+
+products_cache = namespace('product')
+CACHE_KEY = 'commission:{product_id}'
+
+
+def commission_for_product(product_id, product=None):
+    """
+    Return the commission amount per sale for a product, or None when its
+    commission or price isn't numeric. Results are cached per product;
+    pass an already loaded product to skip the database on a cache miss.
+    """
+    from .models import Product
+
+    if product_id is None:
+        return None
+
+    key = CACHE_KEY.format(product_id=product_id)
+    cached = products_cache.get(key)
+    if cached is not None:
+        return cached['amount']
+
+    if product is None:
+        product = Product.objects.only('commission_rate', 'price_amount').filter(pk=product_id).first()
+    amount = product.commission_amount if product else None
+
+    products_cache.set(key, {'amount': amount}, settings.CACHE_TTL)
+    return amount
+
+
+def invalidate_product(product_id):
+    """Drop the cached commission for a product after it changes"""
+    products_cache.delete(CACHE_KEY.format(product_id=product_id))
@@ -0,0 +1,91 @@
+# partner/dashboard_cache.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+import logging
+import time
+
+from affiliateos.cache import namespace
+
+logger = logging.getLogger(__name__)
+
+dashboard_namespace = namespace('dashboard')
+SECTION_KEY = 'dashboard:section:{name}'
+LOCK_KEY = 'dashboard:lock:{name}'
+
+# How long a single worker may hold the recompute lock for a section
+LOCK_TIMEOUT = 60
+
+# How long a request waits on a cold section for the lock holder to store it
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.1
+
+
+def get_generation():
+    """Return the current dashboard data generation"""
+    return dashboard_namespace.version
+
+
+def bump_generation():
+    """Mark every cached dashboard section as stale"""
+    dashboard_namespace.clear()
+
+
+def invalidate():
+    """Bump the generation once the surrounding transaction commits"""
+    transaction.on_commit(bump_generation)
+
+
+def _wait_for_entry(key):
+    """Poll for the entry another worker is computing, up to LOCK_WAIT"""
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry:
+            return entry
+    return None
+
+
+def get_section(name, compute):
+    """
+    Return the cached data for a dashboard section, recomputing it when the
+    generation has moved on or the entry is older than CACHE_TTL.
+
+    Only the worker holding the section lock recomputes it. Other requests
+    are served the stale entry, or on a cold cache wait for the lock holder
+    to store one and compute it themselves if it doesn't arrive in time.
+    """
+    generation = get_generation()
+    key = SECTION_KEY.format(name=name)
+    entry = cache.get(key)
+
+    if entry and entry['generation'] == generation and entry['expires'] > time.time():
+        return entry['data']
+
+    lock_key = LOCK_KEY.format(name=name)
+    locked = cache.add(lock_key, True, timeout=LOCK_TIMEOUT)
+    if not locked:
+        if entry:
+            return entry['data']
+        entry = _wait_for_entry(key)
+        if entry:
+            return entry['data']
+
+    try:
+        data = compute()
+        cache.set(key, {
+            'generation': generation,
+            'expires': time.time() + settings.CACHE_TTL,
+            'data': data,
+        }, timeout=None)
+    except Exception as e:
+        if not entry:
+            raise
+        logger.error(f"Error recomputing dashboard section {name}: {str(e)}")
+        data = entry['data']
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+    return data
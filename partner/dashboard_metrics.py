@@ -1,13 +1,17 @@
 from django.db import models
-from django.db.models import Count, Sum, Avg, F, Q, ExpressionWrapper, fields
+from django.db.models import Count, Sum, Avg, F, Q, ExpressionWrapper, OuterRef, Subquery, fields
+from django.db.models.functions import TruncMonth
 from django.utils import timezone
 from datetime import timedelta, datetime
 from decimal import Decimal
 
 from documents_management.models import Document
 from payouts.models import Payout, Earnings
-from partner.models import PartnerProfile, Product, Testimonial
-from referrals_management.models import Referral
+from partner.models import (
+    PartnerProfile, Product, Testimonial,
+    ReferralDailyRollup, EarningsDailyRollup, PayoutDailyRollup
+)
+from referrals_management.models import Referral, ReferralTimeline
 from resources.models import Resource
 
 
@@ -38,8 +42,17 @@ class DashboardMetrics:
         now = timezone.now()
         month_ago = now - timedelta(days=30)
         
-        # Get total counts
-        total_referrals = Referral.objects.count()
+        # Referral totals and month-over-month counts from the daily rollup
+        referral_totals = ReferralDailyRollup.objects.aggregate(
+            total=Sum('count'),
+            converted=Sum('count', filter=Q(status='converted')),
+            current_month=Sum('count', filter=Q(date__gte=month_ago.date())),
+            previous_month=Sum('count', filter=Q(
+                date__gte=(now - timedelta(days=60)).date(),
+                date__lt=month_ago.date()
+            )),
+        )
+        total_referrals = referral_totals['total'] or 0
         total_partners = PartnerProfile.objects.count()
         total_products = Product.objects.count()
         
@@ -50,35 +63,26 @@ class DashboardMetrics:
     ).count()
         
         # Get total earnings and payouts
-        total_earnings = Earnings.objects.exclude(status='cancelled').aggregate(
+        total_earnings = EarningsDailyRollup.objects.exclude(status='cancelled').aggregate(
             total=Sum('amount')
         )['total'] or Decimal('0.00')
         
-        total_payouts = Payout.objects.filter(
+        total_payouts = PayoutDailyRollup.objects.filter(
             status='completed'
         ).aggregate(
             total=Sum('amount')
         )['total'] or Decimal('0.00')
         
         # Get conversion rate
-        converted_referrals = Referral.objects.filter(
-            status='converted'
-        ).count()
+        converted_referrals = referral_totals['converted'] or 0
         
         conversion_rate = 0
         if total_referrals > 0:
             conversion_rate = (converted_referrals / total_referrals) * 100
         
         # Get month-to-month growth
-        current_month_referrals = Referral.objects.filter(
-            date_submitted__gte=month_ago
-        ).count()
-        
-        two_months_ago = now - timedelta(days=60)
-        previous_month_referrals = Referral.objects.filter(
-            date_submitted__gte=two_months_ago,
-            date_submitted__lt=month_ago
-        ).count()
+        current_month_referrals = referral_totals['current_month'] or 0
+        previous_month_referrals = referral_totals['previous_month'] or 0
         
         # FIXED: Handle zero previous month referrals case better
         if previous_month_referrals > 0:
@@ -128,86 +132,55 @@ class DashboardMetrics:
         year_ago = now - timedelta(days=365)
         
         # Base queries
-        referrals = Referral.objects
+        rollups = ReferralDailyRollup.objects
         
         # Status counts
-        status_counts = referrals.values('status').annotate(count=Count('id'))
+        status_counts = rollups.values('status').annotate(count=Sum('count')).order_by()
         status_dict = {item['status']: item['count'] for item in status_counts}
         
         # Timeline distribution
-        timeline_counts = referrals.values('timeline').annotate(count=Count('id'))
+        timeline_counts = rollups.values('timeline').annotate(count=Sum('count')).order_by()
         timeline_dict = {item['timeline']: item['count'] for item in timeline_counts}
         
-        # Time-based metrics
-        today_referrals = referrals.filter(date_submitted__gte=today).count()
-        yesterday_referrals = referrals.filter(
-            date_submitted__gte=yesterday, 
-            date_submitted__lt=today
-        ).count()
-        
-        weekly_referrals = referrals.filter(date_submitted__gte=week_ago).count()
-        monthly_referrals = referrals.filter(date_submitted__gte=month_ago).count()
-        quarterly_referrals = referrals.filter(date_submitted__gte=quarter_ago).count()
-        yearly_referrals = referrals.filter(date_submitted__gte=year_ago).count()
+        # Every time window plus the commission totals in a single pass
+        windows = rollups.aggregate(
+            total_count=Sum('count'),
+            today_count=Sum('count', filter=Q(date__gte=today.date())),
+            yesterday_count=Sum('count', filter=Q(date=yesterday.date())),
+            weekly_count=Sum('count', filter=Q(date__gte=week_ago.date())),
+            monthly_count=Sum('count', filter=Q(date__gte=month_ago.date())),
+            quarterly_count=Sum('count', filter=Q(date__gte=quarter_ago.date())),
+            yearly_count=Sum('count', filter=Q(date__gte=year_ago.date())),
+            total_potential=Sum('potential_commission'),
+            total_actual=Sum('actual_commission', filter=Q(status='converted')),
+        )
+        windows = {key: value or 0 for key, value in windows.items()}
+        today_referrals = windows['today_count']
+        yesterday_referrals = windows['yesterday_count']
         
         # Average time to conversion
-        converted_referrals = Referral.objects.filter(status='converted')
-        avg_time_to_conversion = None
-        
-        if converted_referrals.exists():
-            # We need status timeline data to calculate this properly
-            conversion_times = []
-            for referral in converted_referrals:
-                timeline_entries = referral.status_changes.order_by('timestamp')
-                first_entry = timeline_entries.first()
-                last_entry = timeline_entries.filter(status='converted').first()
-                if first_entry and last_entry:
-                    conversion_time = last_entry.timestamp - first_entry.timestamp
-                    conversion_times.append(conversion_time.total_seconds())
-                    
-            if conversion_times:
-                avg_seconds = sum(conversion_times) / len(conversion_times)
-                avg_time_to_conversion = avg_seconds / (60 * 60 * 24)  # Convert to days
-        
-        # Calculate daily referral counts for the past 30 days
-        daily_counts = []
-        for i in range(30):
-            day = now - timedelta(days=i)
-            day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-            count = referrals.filter(
-                date_submitted__gte=day_start,
-                date_submitted__lt=day_end
-            ).count()
-            daily_counts.append({
-                'date': day_start.strftime('%Y-%m-%d'),
-                'count': count
-            })
+        avg_time_to_conversion = cls._get_avg_conversion_time_days()
         
-        # Potential vs actual commission
-        total_potential = referrals.aggregate(
-            total=Sum('potential_commission')
-        )['total'] or 0
+        # Daily referral counts for the past 30 days from one grouped query
+        daily_counts = cls._get_daily_counts(today, days=30)
         
-        total_actual = referrals.filter(
-            status='converted'
-        ).aggregate(
-            total=Sum('actual_commission')
-        )['total'] or 0
+        # Potential vs actual commission
+        total_potential = windows['total_potential']
+        total_actual = windows['total_actual']
         
         realization_rate = (total_actual / total_potential * 100) if total_potential > 0 else 0
         
         return {
-            'total_count': referrals.count(),
+            'total_count': windows['total_count'],
             'status_distribution': status_dict,
             'timeline_distribution': timeline_dict,
             'today_count': today_referrals,
             'yesterday_count': yesterday_referrals,
             'day_growth': ((today_referrals - yesterday_referrals) / yesterday_referrals * 100) if yesterday_referrals > 0 else 0,
-            'weekly_count': weekly_referrals,
-            'monthly_count': monthly_referrals,
-            'quarterly_count': quarterly_referrals,
-            'yearly_count': yearly_referrals,
+            'weekly_count': windows['weekly_count'],
+            'monthly_count': windows['monthly_count'],
+            'quarterly_count': windows['quarterly_count'],
+            'yearly_count': windows['yearly_count'],
             'avg_conversion_time_days': avg_time_to_conversion,
             'daily_counts': daily_counts,
             'total_potential_commission': total_potential,
@@ -215,6 +188,59 @@ class DashboardMetrics:
             'commission_realization_rate': realization_rate,
         }
     @classmethod
+    def _get_avg_conversion_time_days(cls):
+        """
+        Average days between a converted referral's first timeline entry and
+        its first 'converted' entry, computed in the database
+        """
+        entries = ReferralTimeline.objects.filter(
+            referral=OuterRef('pk')
+        ).order_by('timestamp').values('timestamp')
+        
+        result = Referral.objects.filter(status='converted').annotate(
+            first_entry_at=Subquery(entries[:1]),
+            converted_at=Subquery(entries.filter(status='converted')[:1]),
+        ).filter(
+            first_entry_at__isnull=False,
+            converted_at__isnull=False
+        ).annotate(
+            conversion_time=ExpressionWrapper(
+                F('converted_at') - F('first_entry_at'),
+                output_field=fields.DurationField()
+            )
+        ).aggregate(avg_time=Avg('conversion_time'))
+        
+        if result['avg_time'] is None:
+            return None
+        return result['avg_time'].total_seconds() / (60 * 60 * 24)  # Convert to days
+    
+    @classmethod
+    def _get_daily_counts(cls, today, days=30):
+        """
+        Return per-day referral counts for the last `days` days (newest first),
+        filling days without referrals with zero
+        """
+        start = (today - timedelta(days=days - 1)).date()
+        grouped = ReferralDailyRollup.objects.filter(
+            date__gte=start
+        ).values('date').annotate(
+            count=Sum('count')
+        ).order_by()
+        
+        counts_by_day = {
+            item['date'].strftime('%Y-%m-%d'): item['count'] for item in grouped
+        }
+        
+        daily_counts = []
+        for i in range(days):
+            day = (today - timedelta(days=i)).strftime('%Y-%m-%d')
+            daily_counts.append({
+                'date': day,
+                'count': counts_by_day.get(day, 0)
+            })
+        return daily_counts
+    
+    @classmethod
     def get_partner_metrics(cls):
         """Return partner-related metrics"""
         now = timezone.now()
@@ -243,38 +269,41 @@ class DashboardMetrics:
             activity_rate = (active_partners / total_partners) * 100
         
         # Top partners by referral count
-        top_partners_by_referrals = PartnerProfile.objects.annotate(
-            referral_count=Count('referrals')
-        ).order_by('-referral_count')[:10]
+        partner_referrals = ReferralDailyRollup.objects.filter(
+            partner__isnull=False
+        ).values(
+            'partner_id', 'partner__name', 'partner__company'
+        ).annotate(
+            referral_count=Sum('count'),
+            converted_count=Sum('count', filter=Q(status='converted'), default=0),
+        )
+        top_partners_by_referrals = partner_referrals.order_by('-referral_count')[:10]
         
         top_partners_referrals = [
             {
-                'id': partner.id,
-                'name': partner.name,
-                'company': partner.company,
-                'referral_count': partner.referral_count
+                'id': item['partner_id'],
+                'name': item['partner__name'],
+                'company': item['partner__company'],
+                'referral_count': item['referral_count']
             }
-            for partner in top_partners_by_referrals
+            for item in top_partners_by_referrals
         ]
         
         # Top partners by conversion
-        top_converter_data = PartnerProfile.objects.annotate(
-            converted_count=Count('referrals', filter=Q(referrals__status='converted')),
-            total_count=Count('referrals')
-        ).filter(total_count__gt=0).values(
-            'id', 'name', 'company', 'converted_count', 'total_count'
+        top_converter_data = partner_referrals.filter(
+            referral_count__gt=0
         ).order_by('-converted_count')[:10]
         
         top_converters_list = []
         for data in top_converter_data:
-            conversion_rate = (data['converted_count'] * 100.0 / data['total_count']) if data['total_count'] > 0 else 0
+            conversion_rate = (data['converted_count'] * 100.0 / data['referral_count']) if data['referral_count'] > 0 else 0
             
             top_converters_list.append({
-                'id': data['id'],
-                'name': data['name'],
-                'company': data['company'],
+                'id': data['partner_id'],
+                'name': data['partner__name'],
+                'company': data['partner__company'],
                 'converted': data['converted_count'],
-                'total': data['total_count'],
+                'total': data['referral_count'],
                 'conversion_rate': conversion_rate
             })
         
@@ -282,18 +311,22 @@ class DashboardMetrics:
         top_converters_list.sort(key=lambda x: x['conversion_rate'], reverse=True)
         
         # Top partners by earnings
-        top_earners = PartnerProfile.objects.annotate(
-            annotated_total_earnings=Sum('earnings__amount', filter=~Q(earnings__status='cancelled'))
+        top_earners = EarningsDailyRollup.objects.exclude(
+            status='cancelled'
+        ).values(
+            'partner_id', 'partner__name', 'partner__company'
+        ).annotate(
+            annotated_total_earnings=Sum('amount')
         ).filter(annotated_total_earnings__gt=0).order_by('-annotated_total_earnings')[:10]
 
         top_earners_list = [
             {
-                'id': partner.id,
-                'name': partner.name,
-                'company': partner.company,
-                'total_earnings': partner.annotated_total_earnings
+                'id': item['partner_id'],
+                'name': item['partner__name'],
+                'company': item['partner__company'],
+                'total_earnings': item['annotated_total_earnings']
             }
-            for partner in top_earners
+            for item in top_earners
         ]
         
         # Partners by product selection
@@ -328,11 +361,13 @@ class DashboardMetrics:
         now = timezone.now()
         month_ago = now - timedelta(days=30)
         
+        rollups = EarningsDailyRollup.objects
+        
         # Total earnings by status
-        status_totals = Earnings.objects.values('status').annotate(
+        status_totals = rollups.values('status').annotate(
             total=Sum('amount'),
-            count=Count('id')
-        )
+            count=Sum('count')
+        ).order_by()
         
         status_dict = {
             item['status']: {
@@ -341,7 +376,14 @@ class DashboardMetrics:
             } for item in status_totals
         }
         
-        # Monthly earnings trend
+        # Monthly earnings trend, grouped once and looked up per month
+        monthly_totals = {
+            item['month']: item['total']
+            for item in rollups.annotate(
+                month=TruncMonth('date')
+            ).values('month').annotate(total=Sum('amount')).order_by()
+        }
+        
         monthly_earnings = []
         for i in range(12):
             month_end = now.replace(day=1) - timedelta(days=1)
@@ -351,10 +393,7 @@ class DashboardMetrics:
                 month_end = month_start - timedelta(days=1)
                 month_start = month_end.replace(day=1)
             
-            month_total = Earnings.objects.filter(
-                date__gte=month_start,
-                date__lte=month_end
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            month_total = monthly_totals.get(month_start.date(), 0) or 0
             
             monthly_earnings.append({
                 'month': month_start.strftime('%Y-%m'),
@@ -366,10 +405,10 @@ class DashboardMetrics:
         monthly_earnings.reverse()  # Show oldest to newest
         
         # Source distribution
-        source_totals = Earnings.objects.values('source').annotate(
+        source_totals = rollups.values('source').annotate(
             total=Sum('amount'),
-            count=Count('id')
-        )
+            count=Sum('count')
+        ).order_by()
         
         source_dict = {
             item['source']: {
@@ -379,13 +418,11 @@ class DashboardMetrics:
         }
         
         # Pending vs paid ratio
-        pending_total = Earnings.objects.filter(
-            status__in=['pending', 'pending_approval', 'available', 'processing']
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        paid_total = Earnings.objects.filter(
-            status='paid'
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        pending_total = sum(
+            (item['total'] or 0) for status, item in status_dict.items()
+            if status in ['pending', 'pending_approval', 'available', 'processing']
+        )
+        paid_total = status_dict.get('paid', {}).get('total') or 0
         
         # Recent earnings
         recent_earnings = Earnings.objects.select_related(
@@ -420,11 +457,13 @@ class DashboardMetrics:
     @classmethod
     def get_payout_metrics(cls):
         """Return payout-related metrics"""
+        rollups = PayoutDailyRollup.objects
+        
         # Status distribution
-        status_counts = Payout.objects.values('status').annotate(
-            count=Count('id'),
+        status_counts = rollups.values('status').annotate(
+            count=Sum('count'),
             total=Sum('amount')
-        )
+        ).order_by()
         
         status_dict = {
             item['status']: {
@@ -434,10 +473,10 @@ class DashboardMetrics:
         }
         
         # Payment method distribution
-        method_counts = Payout.objects.values('payment_method').annotate(
-            count=Count('id'),
+        method_counts = rollups.values('payment_method').annotate(
+            count=Sum('count'),
             total=Sum('amount')
-        )
+        ).order_by()
         
         method_dict = {
             item['payment_method']: {
@@ -446,7 +485,16 @@ class DashboardMetrics:
             } for item in method_counts
         }
         
-        # Monthly payout trend
+        # Monthly payout trend by processed date, grouped once and looked up per month
+        monthly_totals = {
+            item['month']: item['total']
+            for item in rollups.filter(
+                status='completed', processed_date__isnull=False
+            ).annotate(
+                month=TruncMonth('processed_date')
+            ).values('month').annotate(total=Sum('amount')).order_by()
+        }
+        
         monthly_payouts = []
         now = timezone.now()
         
@@ -458,11 +506,7 @@ class DashboardMetrics:
                 month_end = month_start - timedelta(days=1)
                 month_start = month_end.replace(day=1)
             
-            month_total = Payout.objects.filter(
-                status='completed',
-                processed_date__gte=month_start,
-                processed_date__lte=month_end
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            month_total = monthly_totals.get(month_start.date(), 0) or 0
             
             monthly_payouts.append({
                 'month': month_start.strftime('%Y-%m'),
@@ -473,30 +517,18 @@ class DashboardMetrics:
         
         monthly_payouts.reverse()  # Show oldest to newest
         
-        # Average processing time - FIXED to handle NULL gracefully
-        completed_payouts = Payout.objects.filter(
-            status='completed',
-            processed_date__isnull=False,
-            request_date__isnull=False  # Ensure both dates are available
+        # Average processing time from the summed per-row processing times
+        processing = rollups.filter(
+            status='completed', processing_time__isnull=False
+        ).aggregate(
+            total_time=Sum('processing_time'),
+            count=Sum('count')
         )
         
         avg_processing_time = None
-        if completed_payouts.exists():
-            # Use Django's aggregation with ExpressionWrapper for better performance
-            time_diff = ExpressionWrapper(
-                F('processed_date') - F('request_date'),
-                output_field=fields.DurationField()
-            )
-            
-            result = completed_payouts.annotate(
-                processing_time=time_diff
-            ).aggregate(
-                avg_time=Avg('processing_time')
-            )
-            
-            if result['avg_time']:
-                # Convert timedelta to hours
-                avg_processing_time = result['avg_time'].total_seconds() / (60 * 60)
+        if processing['count'] and processing['total_time'] is not None:
+            # Convert timedelta to hours
+            avg_processing_time = processing['total_time'].total_seconds() / processing['count'] / (60 * 60)
         
         # Pending payouts - FIXED: ensure proper ordering and handle empty case
         pending_payouts = Payout.objects.filter(
@@ -518,18 +550,17 @@ class DashboardMetrics:
         # If no pending payouts, provide an empty list but don't fail
         
         return {
-            'total_payouts': Payout.objects.count(),
-            'total_amount_paid': Payout.objects.filter(status='completed').aggregate(
-                total=Sum('amount')
-            )['total'] or 0,
+            'total_payouts': sum(item['count'] for item in status_dict.values()),
+            'total_amount_paid': status_dict.get('completed', {}).get('total') or 0,
             'status_distribution': status_dict,
             'payment_method_distribution': method_dict,
             'monthly_trend': monthly_payouts,
             'avg_processing_time_hours': avg_processing_time,
             'pending_payouts': pending_list,
-            'pending_amount': Payout.objects.filter(
-                status__in=['pending', 'processing']
-            ).aggregate(total=Sum('amount'))['total'] or 0,
+            'pending_amount': sum(
+                (item['total'] or 0) for status, item in status_dict.items()
+                if status in ['pending', 'processing']
+            ),
         }
  
     @classmethod
@@ -774,6 +805,25 @@ class DashboardMetrics:
         # Convert to list and sort
         product_earnings = list(product_to_earnings.values())
         product_earnings.sort(key=lambda x: x['earnings'], reverse=True)
+
+        # Projected commission on open referrals, computed from the numeric product fields
+        product_projections = list(Product.objects.filter(
+            commission_rate__isnull=False, price_amount__isnull=False
+        ).annotate(
+            open_referrals=Count(
+                'referrals',
+                filter=Q(referrals__status__in=['pending', 'contacted', 'qualified'])
+            )
+        ).annotate(
+            projected_commission=ExpressionWrapper(
+                F('price_amount') * F('commission_rate') / 100 * F('open_referrals'),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2)
+            )
+        ).filter(
+            open_referrals__gt=0
+        ).values(
+            'name', 'open_referrals', 'projected_commission'
+        ).order_by('-projected_commission')[:10])
         
         return {
             'total_products': Product.objects.count(),
@@ -782,6 +832,14 @@ class DashboardMetrics:
             'product_conversion': conversion_list,
             'partner_selections': selection_list,
             'product_earnings': product_earnings[:10],  # Top 10 by earnings
+            'product_projections': [
+                {
+                    'product': item['name'],
+                    'open_referrals': item['open_referrals'],
+                    'projected_commission': item['projected_commission'],
+                }
+                for item in product_projections
+            ],
         }
         
     @classmethod
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from partner.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily referral, earnings and payout rollup tables from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Number of rollup rows inserted per query"
+        )
+
+    def handle(self, *args, **options):
+        counts = rebuild_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rollups: {counts['referrals']} referral rows, "
+            f"{counts['earnings']} earnings rows, {counts['payouts']} payout rows"
+        ))
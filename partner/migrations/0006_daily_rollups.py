@@ -0,0 +1,67 @@
+# Generated by Django 4.2.17 on 2026-10-16 20:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partner', '0005_remove_testimonial_is_approved_testimonial_status_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('status', models.CharField(max_length=10)),
+                ('timeline', models.CharField(blank=True, max_length=20, null=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('potential_commission', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('actual_commission', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('partner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='referral_rollups', to='partner.partnerprofile')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='referral_rollups', to='partner.product')),
+            ],
+            options={
+                'verbose_name': 'Referral Daily Rollup',
+                'verbose_name_plural': 'Referral Daily Rollups',
+                'indexes': [models.Index(fields=['date', 'status'], name='partner_ref_date_dbc3b4_idx'), models.Index(fields=['partner', 'date'], name='partner_ref_partner_5b2f08_idx'), models.Index(fields=['product', 'date'], name='partner_ref_product_2b9b8b_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PayoutDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('status', models.CharField(max_length=15)),
+                ('payment_method', models.CharField(max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('partner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payout_rollups', to='partner.partnerprofile')),
+            ],
+            options={
+                'verbose_name': 'Payout Daily Rollup',
+                'verbose_name_plural': 'Payout Daily Rollups',
+                'indexes': [models.Index(fields=['date', 'status'], name='partner_pay_date_9c1b4f_idx'), models.Index(fields=['partner', 'date'], name='partner_pay_partner_ca1a9b_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EarningsDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('status', models.CharField(max_length=20)),
+                ('source', models.CharField(max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('partner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='earnings_rollups', to='partner.partnerprofile')),
+            ],
+            options={
+                'verbose_name': 'Earnings Daily Rollup',
+                'verbose_name_plural': 'Earnings Daily Rollups',
+                'indexes': [models.Index(fields=['date', 'status'], name='partner_ear_date_7b2d06_idx'), models.Index(fields=['partner', 'date'], name='partner_ear_partner_63c1ed_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.17 on 2026-10-16 20:20
+
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+
+def parse_decimal(value, field=None):
+    # Frozen copy of partner.models.parse_decimal
+    if value is None:
+        return None
+    cleaned = str(value).strip().replace(',', '').strip('%$ ')
+    try:
+        number = Decimal(cleaned)
+    except InvalidOperation:
+        return None
+    if not number.is_finite():
+        return None
+    if field is None:
+        return number
+    try:
+        number = number.quantize(Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        # More digits than the decimal context holds
+        return None
+    return number if len(number.as_tuple().digits) <= field.max_digits else None
+
+
+def backfill_numeric_fields(apps, schema_editor):
+    Product = apps.get_model('partner', 'Product')
+    commission_rate = Product._meta.get_field('commission_rate')
+    price_amount = Product._meta.get_field('price_amount')
+    products = list(Product.objects.only('id', 'commission', 'price'))
+    for product in products:
+        product.commission_rate = parse_decimal(product.commission, commission_rate)
+        product.price_amount = parse_decimal(product.price, price_amount)
+    Product.objects.bulk_update(products, ['commission_rate', 'price_amount'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partner', '0006_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='commission_rate',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=7, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='price_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.RunPython(backfill_numeric_fields, migrations.RunPython.noop),
+    ]
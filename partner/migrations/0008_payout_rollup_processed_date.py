@@ -0,0 +1,61 @@
+# Generated by Django 4.2.17 on 2026-10-16 21:05
+
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def rebuild_payout_rollups(apps, schema_editor):
+    # Existing rows have no processed date or processing time; rebuild them
+    Payout = apps.get_model('payouts', 'Payout')
+    PayoutDailyRollup = apps.get_model('partner', 'PayoutDailyRollup')
+    processing_time = ExpressionWrapper(F('processed_date') - F('request_date'), output_field=DurationField())
+    rows = Payout.objects.filter(request_date__isnull=False, partner__isnull=False).annotate(
+        day=TruncDate('request_date'),
+        processed_day=TruncDate('processed_date'),
+    ).values('day', 'partner_id', 'status', 'payment_method', 'processed_day').annotate(
+        count=Count('id'),
+        total=Sum('amount'),
+        processing_time=Sum(processing_time),
+    ).order_by()
+
+    PayoutDailyRollup.objects.all().delete()
+    PayoutDailyRollup.objects.bulk_create([
+        PayoutDailyRollup(
+            date=row['day'],
+            partner_id=row['partner_id'],
+            status=row['status'],
+            payment_method=row['payment_method'],
+            processed_date=row['processed_day'],
+            count=row['count'],
+            amount=row['total'] or 0,
+            processing_time=row['processing_time'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partner', '0007_product_numeric_commission_price'),
+        ('payouts', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payoutdailyrollup',
+            name='processed_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='payoutdailyrollup',
+            name='processing_time',
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='payoutdailyrollup',
+            index=models.Index(fields=['status', 'processed_date'], name='partner_pay_status_817c7a_idx'),
+        ),
+        migrations.RunPython(rebuild_payout_rollups, migrations.RunPython.noop),
+    ]
@@ -4,6 +4,35 @@ from django.utils.translation import gettext_lazy as _
 from django.utils.text import slugify
 import uuid
 from django.utils import timezone
+from django.db.models.functions import Coalesce
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+
+def parse_decimal(value, field=None):
+    """
+    Parse a free-text amount such as "15%", "$1,200" or "99.5" into a
+    Decimal. Returns None when the text isn't a number, or, given a
+    DecimalField, when the number rounded to its places doesn't fit in
+    its max_digits.
+    """
+    if value is None:
+        return None
+    cleaned = str(value).strip().replace(',', '').strip('%$ ')
+    try:
+        number = Decimal(cleaned)
+    except InvalidOperation:
+        return None
+    if not number.is_finite():
+        return None
+    if field is None:
+        return number
+    try:
+        number = number.quantize(Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        # More digits than the decimal context holds
+        return None
+    return number if len(number.as_tuple().digits) <= field.max_digits else None
+
 
 class Product(models.Model):
     title = models.CharField(max_length=255)
@@ -11,6 +40,9 @@ class Product(models.Model):
     description = models.TextField()
     commission = models.CharField(max_length=100)
     price = models.CharField(max_length=100, null=True, blank=True)
+    # Numeric copies of commission (percent) and price, kept in sync on save
+    commission_rate = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True, editable=False)
+    price_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
     image = models.ImageField(upload_to='products/', null=True, blank=True)
     delivery_time = models.CharField(max_length=100, null=True, blank=True)
     cost = models.CharField(max_length=100, null=True, blank=True)
@@ -31,6 +63,21 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.commission_rate = parse_decimal(self.commission, self._meta.get_field('commission_rate'))
+        self.price_amount = parse_decimal(self.price, self._meta.get_field('price_amount'))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'commission_rate', 'price_amount'}
+        super().save(*args, **kwargs)
+
+    @property
+    def commission_amount(self):
+        """Commission earned per sale: the commission rate applied to the price"""
+        if self.commission_rate is None or self.price_amount is None:
+            return None
+        return (self.price_amount * self.commission_rate / 100).quantize(Decimal('0.01'))
+
     # ✅ Added computed properties
     @property
     def total_referrals(self):
@@ -102,6 +149,45 @@ class Testimonial(models.Model):
 
 
 
+class PartnerProfileQuerySet(models.QuerySet):
+    def with_stats(self):
+        """
+        Annotate referral counts and earnings totals with one correlated
+        subquery each, so the to-many relations are never joined into the
+        outer query and the partner rows are not multiplied.
+        """
+        from payouts.models import Earnings
+        from referrals_management.models import Referral
+
+        def referral_count(**filters):
+            referrals = Referral.objects.filter(
+                user=models.OuterRef('user'), **filters
+            ).order_by().values('user').annotate(
+                count=models.Count('pk')
+            ).values('count')
+            return Coalesce(models.Subquery(referrals), 0)
+
+        def earnings_sum(queryset):
+            earnings = queryset.filter(
+                partner=models.OuterRef('pk')
+            ).order_by().values('partner').annotate(
+                total=models.Sum('amount')
+            ).values('total')
+            return Coalesce(
+                models.Subquery(earnings), Decimal('0'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)
+            )
+
+        return self.annotate(
+            total_referrals_count=referral_count(),
+            pending_referrals_count=referral_count(status='pending'),
+            converted_referrals_count=referral_count(status='converted'),
+            available_earnings_sum=earnings_sum(Earnings.objects.filter(status='available')),
+            pending_earnings_sum=earnings_sum(Earnings.objects.filter(status='pending')),
+            total_earnings_sum=earnings_sum(Earnings.objects.exclude(status='cancelled')),
+        )
+
+
 class PartnerProfile(models.Model):
     class Status(models.TextChoices):
         ACTIVE = 'active', _('Active')
@@ -148,6 +234,8 @@ class PartnerProfile(models.Model):
     last_login_ip = models.CharField(max_length=45, blank=True, null=True)
     two_factor_enabled = models.BooleanField(default=False)
 
+    objects = PartnerProfileQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         verbose_name = _("Partner Profile")
@@ -179,14 +267,20 @@ class PartnerProfile(models.Model):
     
     @property
     def total_referrals(self):
+        if hasattr(self, 'total_referrals_count'):
+            return self.total_referrals_count
         return self.user.referrals.count()
     
     @property
     def pending_referrals(self):
+        if hasattr(self, 'pending_referrals_count'):
+            return self.pending_referrals_count
         return self.user.referrals.filter(status='pending').count()
     
     @property
     def converted_referrals(self):
+        if hasattr(self, 'converted_referrals_count'):
+            return self.converted_referrals_count
         return self.user.referrals.filter(status='converted').count()
     
     @property
@@ -196,6 +290,8 @@ class PartnerProfile(models.Model):
     
     @property
     def available_earnings(self):
+        if hasattr(self, 'available_earnings_sum'):
+            return self.available_earnings_sum
         from payouts.models import Earnings
         return Earnings.objects.filter(
             partner=self, 
@@ -204,6 +300,8 @@ class PartnerProfile(models.Model):
     
     @property
     def pending_earnings(self):
+        if hasattr(self, 'pending_earnings_sum'):
+            return self.pending_earnings_sum
         from payouts.models import Earnings
         return Earnings.objects.filter(
             partner=self, 
@@ -212,6 +310,8 @@ class PartnerProfile(models.Model):
     
     @property
     def total_earnings(self):
+        if hasattr(self, 'total_earnings_sum'):
+            return self.total_earnings_sum
         from payouts.models import Earnings
         return Earnings.objects.filter(
             partner=self
@@ -246,3 +346,96 @@ class PartnerOnboardingLink(models.Model):
 
     def __str__(self):
         return f"Onboarding Link {self.token} ({'active' if self.is_valid() else 'inactive'})"
+
+
+class ReferralDailyRollup(models.Model):
+    """Per-day referral counts and commission sums by partner, product, status and timeline"""
+    date = models.DateField(db_index=True)
+    partner = models.ForeignKey(
+        PartnerProfile,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='referral_rollups'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='referral_rollups'
+    )
+    status = models.CharField(max_length=10)
+    timeline = models.CharField(max_length=20, null=True, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    potential_commission = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    actual_commission = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = _("Referral Daily Rollup")
+        verbose_name_plural = _("Referral Daily Rollups")
+        indexes = [
+            models.Index(fields=['date', 'status']),
+            models.Index(fields=['partner', 'date']),
+            models.Index(fields=['product', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.status}: {self.count}"
+
+
+class EarningsDailyRollup(models.Model):
+    """Per-day earnings counts and amounts by partner, status and source"""
+    date = models.DateField(db_index=True)
+    partner = models.ForeignKey(
+        PartnerProfile,
+        on_delete=models.CASCADE,
+        related_name='earnings_rollups'
+    )
+    status = models.CharField(max_length=20)
+    source = models.CharField(max_length=20)
+    count = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = _("Earnings Daily Rollup")
+        verbose_name_plural = _("Earnings Daily Rollups")
+        indexes = [
+            models.Index(fields=['date', 'status']),
+            models.Index(fields=['partner', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.status}: {self.amount}"
+
+
+class PayoutDailyRollup(models.Model):
+    """
+    Per-day payout counts and amounts (by request date) by partner, status,
+    payment method and processed date
+    """
+    date = models.DateField(db_index=True)
+    partner = models.ForeignKey(
+        PartnerProfile,
+        on_delete=models.CASCADE,
+        related_name='payout_rollups'
+    )
+    status = models.CharField(max_length=15)
+    payment_method = models.CharField(max_length=10)
+    processed_date = models.DateField(null=True, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Summed request-to-processing time of the payouts in this row
+    processing_time = models.DurationField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Payout Daily Rollup")
+        verbose_name_plural = _("Payout Daily Rollups")
+        indexes = [
+            models.Index(fields=['date', 'status']),
+            models.Index(fields=['partner', 'date']),
+            models.Index(fields=['status', 'processed_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.status}: {self.amount}"
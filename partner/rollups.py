@@ -0,0 +1,261 @@
+# partner/rollups.py
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+import logging
+
+from . import dashboard_cache
+from .models import PartnerProfile, Product, ReferralDailyRollup, EarningsDailyRollup, PayoutDailyRollup
+
+logger = logging.getLogger(__name__)
+
+
+def referral_rollup_key(referral):
+    """Return the (date, partner_id, product_id) slice a referral is counted in"""
+    if not referral.date_submitted:
+        return None
+    return (
+        timezone.localdate(referral.date_submitted),
+        referral.partner_id,
+        referral.product_id,
+    )
+
+
+def earnings_rollup_key(earning):
+    """Return the (date, partner_id) slice an earnings record is counted in"""
+    if not earning.date or not earning.partner_id:
+        return None
+    return (earning.date, earning.partner_id)
+
+
+def payout_rollup_key(payout):
+    """Return the (date, partner_id) slice a payout is counted in"""
+    if not payout.request_date or not payout.partner_id:
+        return None
+    return (timezone.localdate(payout.request_date), payout.partner_id)
+
+
+def _payout_processing_time():
+    return ExpressionWrapper(F('processed_date') - F('request_date'), output_field=DurationField())
+
+
+def schedule_refresh(refresh, keys):
+    """
+    Refresh each affected rollup slice once the surrounding transaction commits
+    """
+    for key in {key for key in keys if key is not None}:
+        transaction.on_commit(lambda key=key: _run_refresh(refresh, key))
+
+
+def _run_refresh(refresh, key):
+    try:
+        refresh(*key)
+    except Exception as e:
+        logger.error(f"Error refreshing rollup {refresh.__name__}{key}: {str(e)}")
+
+
+def update_earnings(queryset, **changes):
+    """
+    Bulk-update earnings with queryset.update() and refresh the rollup slices
+    of the updated rows, since update() bypasses the save signals
+    """
+    keys = set(queryset.values_list('date', 'partner_id').distinct())
+    updated = queryset.update(**changes)
+    if updated:
+        schedule_refresh(refresh_earnings_rollup, keys)
+        dashboard_cache.invalidate()
+    return updated
+
+
+def _lock_slice(queryset):
+    """
+    Lock the rows a rollup slice hangs off until the transaction ends.
+    Concurrent refreshes of the slice then run one after the other, so they
+    can't both delete the old rows and insert their own.
+    """
+    list(queryset.select_for_update().values_list('pk', flat=True))
+
+
+def refresh_referral_rollup(date, partner_id, product_id):
+    """Recompute the referral rollup rows for a single (date, partner, product) slice"""
+    from referrals_management.models import Referral
+
+    referrals = Referral.objects.filter(
+        date_submitted__date=date,
+        partner_id=partner_id,
+        product_id=product_id,
+    )
+
+    with transaction.atomic():
+        if partner_id is not None:
+            _lock_slice(PartnerProfile.objects.filter(pk=partner_id))
+        elif product_id is not None:
+            _lock_slice(Product.objects.filter(pk=product_id))
+        else:
+            _lock_slice(referrals)
+        rows = referrals.values('status', 'timeline').annotate(
+            count=Count('id'),
+            potential=Sum('potential_commission'),
+            actual=Sum('actual_commission'),
+        ).order_by()
+
+        ReferralDailyRollup.objects.filter(
+            date=date, partner_id=partner_id, product_id=product_id
+        ).delete()
+        ReferralDailyRollup.objects.bulk_create([
+            ReferralDailyRollup(
+                date=date,
+                partner_id=partner_id,
+                product_id=product_id,
+                status=row['status'],
+                timeline=row['timeline'],
+                count=row['count'],
+                potential_commission=row['potential'] or 0,
+                actual_commission=row['actual'] or 0,
+            )
+            for row in rows
+        ])
+
+
+def refresh_earnings_rollup(date, partner_id):
+    """Recompute the earnings rollup rows for a single (date, partner) slice"""
+    from payouts.models import Earnings
+
+    with transaction.atomic():
+        _lock_slice(PartnerProfile.objects.filter(pk=partner_id))
+        rows = Earnings.objects.filter(
+            date=date, partner_id=partner_id
+        ).values('status', 'source').annotate(
+            count=Count('id'),
+            total=Sum('amount'),
+        ).order_by()
+
+        EarningsDailyRollup.objects.filter(date=date, partner_id=partner_id).delete()
+        EarningsDailyRollup.objects.bulk_create([
+            EarningsDailyRollup(
+                date=date,
+                partner_id=partner_id,
+                status=row['status'],
+                source=row['source'],
+                count=row['count'],
+                amount=row['total'] or 0,
+            )
+            for row in rows
+        ])
+
+
+def refresh_payout_rollup(date, partner_id):
+    """Recompute the payout rollup rows for a single (date, partner) slice"""
+    from payouts.models import Payout
+
+    with transaction.atomic():
+        _lock_slice(PartnerProfile.objects.filter(pk=partner_id))
+        rows = Payout.objects.filter(
+            request_date__date=date, partner_id=partner_id
+        ).annotate(
+            processed_day=TruncDate('processed_date')
+        ).values('status', 'payment_method', 'processed_day').annotate(
+            count=Count('id'),
+            total=Sum('amount'),
+            processing_time=Sum(_payout_processing_time()),
+        ).order_by()
+
+        PayoutDailyRollup.objects.filter(date=date, partner_id=partner_id).delete()
+        PayoutDailyRollup.objects.bulk_create([
+            PayoutDailyRollup(
+                date=date,
+                partner_id=partner_id,
+                status=row['status'],
+                payment_method=row['payment_method'],
+                processed_date=row['processed_day'],
+                count=row['count'],
+                amount=row['total'] or 0,
+                processing_time=row['processing_time'],
+            )
+            for row in rows
+        ])
+
+
+def rebuild_rollups(batch_size=1000):
+    """
+    Rebuild every rollup table from the base tables.
+    Returns the number of rollup rows written per table.
+    """
+    from referrals_management.models import Referral
+    from payouts.models import Earnings, Payout
+
+    referral_rows = Referral.objects.annotate(
+        day=TruncDate('date_submitted')
+    ).values('day', 'partner_id', 'product_id', 'status', 'timeline').annotate(
+        count=Count('id'),
+        potential=Sum('potential_commission'),
+        actual=Sum('actual_commission'),
+    ).order_by()
+
+    earnings_rows = Earnings.objects.values(
+        'date', 'partner_id', 'status', 'source'
+    ).annotate(
+        count=Count('id'),
+        total=Sum('amount'),
+    ).order_by()
+
+    payout_rows = Payout.objects.annotate(
+        day=TruncDate('request_date'),
+        processed_day=TruncDate('processed_date'),
+    ).values('day', 'partner_id', 'status', 'payment_method', 'processed_day').annotate(
+        count=Count('id'),
+        total=Sum('amount'),
+        processing_time=Sum(_payout_processing_time()),
+    ).order_by()
+
+    with transaction.atomic():
+        ReferralDailyRollup.objects.all().delete()
+        EarningsDailyRollup.objects.all().delete()
+        PayoutDailyRollup.objects.all().delete()
+
+        referrals = ReferralDailyRollup.objects.bulk_create([
+            ReferralDailyRollup(
+                date=row['day'],
+                partner_id=row['partner_id'],
+                product_id=row['product_id'],
+                status=row['status'],
+                timeline=row['timeline'],
+                count=row['count'],
+                potential_commission=row['potential'] or 0,
+                actual_commission=row['actual'] or 0,
+            )
+            for row in referral_rows
+        ], batch_size=batch_size)
+
+        earnings = EarningsDailyRollup.objects.bulk_create([
+            EarningsDailyRollup(
+                date=row['date'],
+                partner_id=row['partner_id'],
+                status=row['status'],
+                source=row['source'],
+                count=row['count'],
+                amount=row['total'] or 0,
+            )
+            for row in earnings_rows
+        ], batch_size=batch_size)
+
+        payouts = PayoutDailyRollup.objects.bulk_create([
+            PayoutDailyRollup(
+                date=row['day'],
+                partner_id=row['partner_id'],
+                status=row['status'],
+                payment_method=row['payment_method'],
+                processed_date=row['processed_day'],
+                count=row['count'],
+                amount=row['total'] or 0,
+                processing_time=row['processing_time'],
+            )
+            for row in payout_rows
+        ], batch_size=batch_size)
+
+    return {
+        'referrals': len(referrals),
+        'earnings': len(earnings),
+        'payouts': len(payouts),
+    }
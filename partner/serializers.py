@@ -67,6 +67,12 @@ class PartnerProfileSerializer(serializers.ModelSerializer):
     text_testimonials = serializers.SerializerMethodField()
     image_testimonials = serializers.SerializerMethodField()
     video_testimonials = serializers.SerializerMethodField()
+
+    # Nested fields that list views only include when asked for with ?expand=
+    expandable_fields = [
+        'selected_products', 'text_testimonials',
+        'image_testimonials', 'video_testimonials'
+    ]
     
     class Meta:
         model = PartnerProfile
@@ -83,6 +89,32 @@ class PartnerProfileSerializer(serializers.ModelSerializer):
             'image_testimonials', 'video_testimonials'
         ]
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        requested = self.parse_field_list(request.query_params.get('fields'))
+        expanded = self.parse_field_list(request.query_params.get('expand'))
+
+        # ?fields= keeps only the named fields (plus any expanded ones)
+        if requested:
+            for name in set(self.fields) - requested - expanded:
+                self.fields.pop(name)
+
+        # Views that collapse nested data drop it unless it was expanded
+        if self.context.get('collapse_expandable'):
+            for name in set(self.expandable_fields) - expanded:
+                self.fields.pop(name, None)
+
+    @staticmethod
+    def parse_field_list(value):
+        """Split a comma-separated query parameter into a set of names"""
+        if not value:
+            return set()
+        return {name.strip() for name in value.split(',') if name.strip()}
+
     def get_status_display(self, obj):
         return dict(PartnerProfile.Status.choices).get(obj.status)
     
@@ -99,16 +131,36 @@ class PartnerProfileSerializer(serializers.ModelSerializer):
             return round((converted / total) * 100)
         return 0
         
+    def _testimonials_by_type(self, obj):
+        """
+        Bucket the partner's approved testimonials by type in a single pass
+        over obj.testimonials.all(), so a prefetch is used instead of one
+        filtered query per type. Without a prefetch (e.g. nested in a
+        payout) the approved ones are queried once.
+        """
+        buckets = getattr(obj, '_testimonial_buckets', None)
+        if buckets is None:
+            testimonials = obj.testimonials.all()
+            if 'testimonials' not in getattr(obj, '_prefetched_objects_cache', {}):
+                testimonials = testimonials.filter(status=Testimonial.Status.APPROVED)
+            buckets = {choice: [] for choice in Testimonial.TestimonialType.values}
+            for testimonial in testimonials:
+                # A prefetch may hold every status
+                if testimonial.status == Testimonial.Status.APPROVED:
+                    buckets.setdefault(testimonial.type, []).append(testimonial)
+            obj._testimonial_buckets = buckets
+        return buckets
+
     def get_text_testimonials(self, obj):
-        text_testimonials = obj.testimonials.filter(type='text')
+        text_testimonials = self._testimonials_by_type(obj)['text']
         return TestimonialSerializer(text_testimonials, many=True).data
     
     def get_image_testimonials(self, obj):
-        image_testimonials = obj.testimonials.filter(type='image')
+        image_testimonials = self._testimonials_by_type(obj)['image']
         return TestimonialSerializer(image_testimonials, many=True).data
     
     def get_video_testimonials(self, obj):
-        video_testimonials = obj.testimonials.filter(type='video')
+        video_testimonials = self._testimonials_by_type(obj)['video']
         return TestimonialSerializer(video_testimonials, many=True).data
     def get_selected_products(self, obj):
         # Explicitly serialize the prefetched products
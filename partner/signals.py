@@ -1,36 +1,75 @@
-# from django.db.models.signals import post_save, post_delete
-# from django.dispatch import receiver
-
-# from referrals_management.models import Referral
-
-# from .models import ProductStats
-# from django.db import transaction
-# import logging
-
-# logger = logging.getLogger(__name__)
-
-# @receiver(post_save, sender=Referral)
-# def update_product_stats_on_referral_change(sender, instance, created, **kwargs):
-#     """
-#     Update product statistics whenever a referral is created or updated
-#     """
-#     if instance.product:
-#         transaction.on_commit(lambda: update_stats_for_product(instance.product.id))
-
-# @receiver(post_delete, sender=Referral)
-# def update_product_stats_on_referral_delete(sender, instance, **kwargs):
-#     """
-#     Update product statistics whenever a referral is deleted
-#     """
-#     if instance.product:
-#         transaction.on_commit(lambda: update_stats_for_product(instance.product.id))
-
-# def update_stats_for_product(product_id):
-#     """
-#     Wrapper function to handle errors and retry logic
-#     """
-#     try:
-#         ProductStats.update_stats_for_product(product_id)
-#     except Exception as e:
-#         logger.error(f"Error updating stats for product {product_id}: {str(e)}")
-#         # You could implement retry logic here if needed
\ No newline at end of file
+# partner/signals.py
+from django.db.models.signals import post_save, post_delete
+from types import SimpleNamespace
+from django.dispatch import receiver
+
+from documents_management.models import Document
+from payouts.models import Earnings, Payout
+from referrals_management.models import Referral
+from resources.models import Resource
+
+from . import catalog, commission, dashboard_cache, rollups
+from .models import Product
+
+
+def _previous_key(instance, key_func):
+    """
+    Return the slice a row was counted in when it was loaded from the
+    database. Tracked fields that weren't loaded (deferred) have no
+    snapshot; their current value is used instead.
+    """
+    if not instance.loaded_values:
+        return None
+    values = {}
+    for name in instance.tracked_fields:
+        attname = instance._meta.get_field(name).attname
+        if attname in instance.loaded_values:
+            values[attname] = instance.loaded_values[attname]
+        else:
+            values[attname] = getattr(instance, attname)
+    return key_func(SimpleNamespace(**values))
+
+
+@receiver(post_save, sender=Referral)
+@receiver(post_delete, sender=Referral)
+def update_referral_rollup(sender, instance, **kwargs):
+    rollups.schedule_refresh(rollups.refresh_referral_rollup, [
+        _previous_key(instance, rollups.referral_rollup_key),
+        rollups.referral_rollup_key(instance),
+    ])
+    dashboard_cache.invalidate()
+
+
+@receiver(post_save, sender=Earnings)
+@receiver(post_delete, sender=Earnings)
+def update_earnings_rollup(sender, instance, **kwargs):
+    rollups.schedule_refresh(rollups.refresh_earnings_rollup, [
+        _previous_key(instance, rollups.earnings_rollup_key),
+        rollups.earnings_rollup_key(instance),
+    ])
+    dashboard_cache.invalidate()
+
+
+@receiver(post_save, sender=Payout)
+@receiver(post_delete, sender=Payout)
+def update_payout_rollup(sender, instance, **kwargs):
+    rollups.schedule_refresh(rollups.refresh_payout_rollup, [
+        _previous_key(instance, rollups.payout_rollup_key),
+        rollups.payout_rollup_key(instance),
+    ])
+    dashboard_cache.invalidate()
+
+
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def invalidate_dashboard(sender, instance, **kwargs):
+    dashboard_cache.invalidate()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_caches(sender, instance, **kwargs):
+    commission.invalidate_product(instance.pk)
+    catalog.invalidate_products([instance.pk])
@@ -1,3 +1,840 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+from unittest.mock import Mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from affiliateos.cache import CacheNamespace, TieredCache
+from documents_management.models import Document
+from payouts.models import Earnings, Payout
+from referrals_management.models import Referral, ReferralTimeline
+from resources.models import Resource, ResourceCategory
+
+from . import dashboard_cache, rollups
+from .dashboard_metrics import DashboardMetrics
+from .admin import ProductAdmin
+from .models import (
+    EarningsDailyRollup, PartnerProfile, PayoutDailyRollup, Product, ReferralDailyRollup, Testimonial,
+    parse_decimal,
+)
+
+User = get_user_model()
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class PartnerListTestimonialQueriesTest(TestCase):
+    url = '/api/partner/partner-profiles/?expand=text_testimonials,image_testimonials,video_testimonials'
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_partners(self, count, start=0):
+        for i in range(start, start + count):
+            user = User.objects.create_user(email=f'partner{i}@example.com', password='pass')
+            partner = PartnerProfile.objects.create(
+                user=user, name=f'Partner {i}', email=f'profile{i}@example.com',
+                phone='000', role='Consultant'
+            )
+            partner.testimonials.add(
+                Testimonial.objects.create(author='A', content='Great', status=Testimonial.Status.APPROVED),
+                Testimonial.objects.create(author='B', content='Pending', status=Testimonial.Status.PENDING),
+                Testimonial.objects.create(
+                    author='C', type=Testimonial.TestimonialType.IMAGE,
+                    image='testimonials/images/c.png', status=Testimonial.Status.APPROVED
+                ),
+            )
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data['results']
+
+    def test_query_count_does_not_grow_with_partners(self):
+        self.create_partners(2)
+        small_count, _ = self.count_list_queries()
+
+        self.create_partners(8, start=2)
+        large_count, results = self.count_list_queries()
+
+        self.assertEqual(len(results), 10)
+        self.assertEqual(small_count, large_count)
+
+    def test_only_approved_testimonials_are_bucketed(self):
+        self.create_partners(1)
+        _, results = self.count_list_queries()
+
+        partner = results[0]
+        self.assertEqual([t['author'] for t in partner['text_testimonials']], ['A'])
+        self.assertEqual([t['author'] for t in partner['image_testimonials']], ['C'])
+        self.assertEqual(partner['video_testimonials'], [])
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class PartnerListFieldsTest(TestCase):
+    url = '/api/partner/partner-profiles/'
+    expandable = {'selected_products', 'text_testimonials', 'image_testimonials', 'video_testimonials'}
+
+    def setUp(self):
+        admin = User.objects.create_superuser(email='admin@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        self.product = Product.objects.create(title='P', name='P', description='-', commission='10')
+        self.partners = []
+
+    def create_partners(self, count):
+        start = len(self.partners)
+        created = timezone.now()
+        for i in range(start, start + count):
+            user = User.objects.create_user(email=f'partner{i}@example.com', password='pass')
+            partner = PartnerProfile.objects.create(
+                user=user, name=f'Partner {i}', email=f'profile{i}@example.com',
+                phone='000', role='Consultant'
+            )
+            partner.selected_products.add(self.product)
+            partner.testimonials.add(
+                Testimonial.objects.create(author=f'Author {i}', content='Great', status=Testimonial.Status.APPROVED)
+            )
+            # Pairs share a timestamp so ties are broken by id
+            PartnerProfile.objects.filter(pk=partner.pk).update(created_at=created - timedelta(minutes=i // 2))
+            self.partners.append(partner)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_default_list_collapses_nested_fields(self):
+        self.create_partners(2)
+        response, queries = self.get(self.url)
+
+        for partner in response.data['results']:
+            self.assertFalse(self.expandable & set(partner))
+            self.assertIn('total_referrals', partner)
+        self.assertFalse(any('partner_testimonial' in sql or 'partner_product' in sql for sql in queries))
+
+    def test_expand_prefetches_nested_fields_with_fixed_queries(self):
+        url = f"{self.url}?expand={','.join(sorted(self.expandable))}"
+        self.create_partners(2)
+        _, small = self.get(url)
+        self.create_partners(6)
+        response, large = self.get(url)
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(sum('partner_testimonial' in sql for sql in large), 1)
+        self.assertEqual(sum('"partner_product"' in sql for sql in large), 1)
+        for partner in response.data['results']:
+            self.assertLessEqual(self.expandable, set(partner))
+            self.assertEqual([p['name'] for p in partner['selected_products']], ['P'])
+            self.assertEqual(len(partner['text_testimonials']), 1)
+
+    def test_fields_trims_the_payload(self):
+        self.create_partners(1)
+        response, _ = self.get(f'{self.url}?fields=id,name&expand=selected_products')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'selected_products'})
+
+        response, _ = self.get(f'{self.url}?fields=id,name,text_testimonials')
+        # Expandable fields stay collapsed unless expanded
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+
+    def test_next_cursor_pages_by_created_at_then_id(self):
+        self.create_partners(5)
+        expected = [
+            partner.pk for partner in sorted(
+                PartnerProfile.objects.all(), key=lambda partner: (partner.created_at, partner.pk), reverse=True
+            )
+        ]
+
+        seen = []
+        url = f'{self.url}?fields=id&page_size=2'
+        while url:
+            response, _ = self.get(url)
+            seen.extend(partner['id'] for partner in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class PartnerRetrieveQueryBudgetTest(TestCase):
+    # partner (with stats), products, testimonials, recent referrals,
+    # by-product breakdown, status totals, recent earnings, monthly earnings
+    query_budget = 8
+
+    def setUp(self):
+        admin = User.objects.create_superuser(email='admin@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+        user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.partner = PartnerProfile.objects.create(
+            user=user, name='Partner', email='profile@example.com',
+            phone='000', role='Consultant'
+        )
+        self.url = f'/api/partner/partner-profiles/{self.partner.pk}/'
+
+    def add_products(self, count, referrals_per_product=3):
+        for i in range(count):
+            product = Product.objects.create(
+                title=f'Product {i}', name=f'Product {i}', description='-', commission='10'
+            )
+            self.partner.selected_products.add(product)
+            for j in range(referrals_per_product):
+                Referral.objects.create(
+                    user=self.partner.user, partner=self.partner, product=product,
+                    client_name=f'Client {i}-{j}',
+                    status='converted' if j == 0 else 'pending',
+                    actual_commission=Decimal('100.00'),
+                    potential_commission=Decimal('50.00'),
+                )
+
+    def test_query_budget_is_constant(self):
+        self.add_products(1)
+        with self.assertNumQueries(self.query_budget):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+        self.add_products(5)
+        with self.assertNumQueries(self.query_budget):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_breakdown_and_metrics(self):
+        self.add_products(2)
+        response = self.client.get(self.url)
+
+        by_product = response.data['referrals']['by_product']
+        self.assertEqual(len(by_product), 2)
+        for row in by_product:
+            self.assertEqual(row['count'], 3)
+            self.assertEqual(row['conversion_rate'], 33)
+            self.assertEqual(row['total_commission'], Decimal('100.00'))
+
+        status_counts = response.data['metrics']['referral_status_counts']
+        self.assertEqual(status_counts['converted']['count'], 2)
+        self.assertEqual(status_counts['converted']['total_commission'], Decimal('200.00'))
+        self.assertEqual(status_counts['pending']['count'], 4)
+        self.assertEqual(status_counts['pending']['total_commission'], Decimal('200.00'))
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ProductCatalogCacheTest(TestCase):
+    url = '/api/partner/products/'
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.partner = PartnerProfile.objects.create(
+            user=user, name='Partner', email='profile@example.com',
+            phone='000', role='Consultant'
+        )
+        self.products = [
+            Product.objects.create(
+                title=f'Product {i}', name=f'Product {i}', description='-', commission='10',
+                svg_image='<svg/>', features=['a', 'b']
+            )
+            for i in range(3)
+        ]
+        self.partner.selected_products.add(*self.products)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_catalog_is_served_from_cache(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['name'] for p in response.data['results']], ['Product 0', 'Product 1', 'Product 2'])
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.data, response.data)
+        self.assertFalse(any('svg_image' in query['sql'] for query in queries.captured_queries))
+
+    def test_if_none_match_returns_304(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        detail_url = f'{self.url}{self.products[0].pk}/'
+        response = self.client.get(detail_url)
+        self.assertEqual(response.data['name'], 'Product 0')
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_alone_returns_304(self):
+        for url in (self.url, f'{self.url}{self.products[0].pk}/'):
+            last_modified = self.client.get(url)['Last-Modified']
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 304)
+
+    def test_product_changes_invalidate_the_catalog(self):
+        etag = self.client.get(self.url)['ETag']
+
+        product = self.products[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            product.title = 'Renamed'
+            product.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][1]['title'], 'Renamed')
+
+    def test_admin_actions_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductAdmin(Product, AdminSite()).deactivate_products(
+                Mock(), Product.objects.filter(pk=self.products[0].pk)
+            )
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ParseDecimalTest(TestCase):
+    def test_free_text_amounts(self):
+        self.assertEqual(parse_decimal('15%'), Decimal('15'))
+        self.assertEqual(parse_decimal(' $1,200.50 '), Decimal('1200.50'))
+        self.assertEqual(parse_decimal(7), Decimal('7'))
+        for value in (None, '', 'ask us', 'NaN', 'Infinity'):
+            self.assertIsNone(parse_decimal(value), value)
+
+    def test_values_must_fit_the_field(self):
+        rate = Product._meta.get_field('commission_rate')
+        price = Product._meta.get_field('price_amount')
+
+        self.assertEqual(parse_decimal('12.345%', rate), Decimal('12.35'))
+        self.assertEqual(parse_decimal('99999.99', rate), Decimal('99999.99'))
+        self.assertIsNone(parse_decimal('99999.995', rate))
+        self.assertIsNone(parse_decimal('100000', rate))
+        self.assertEqual(parse_decimal('$9,999,999,999.99', price), Decimal('9999999999.99'))
+        self.assertIsNone(parse_decimal('$10,000,000,000', price))
+        self.assertIsNone(parse_decimal('1e40', price))
+
+    def test_save_stores_none_for_overflowing_text(self):
+        product = Product.objects.create(
+            title='Big', name='Big', description='-', commission='1000000%', price='1e15'
+        )
+        product.refresh_from_db()
+        self.assertIsNone(product.commission_rate)
+        self.assertIsNone(product.price_amount)
+
+    def test_backfill_skips_values_that_do_not_fit(self):
+        backfill = import_module('partner.migrations.0007_product_numeric_commission_price').backfill_numeric_fields
+        fits = Product.objects.create(title='A', name='A', description='-', commission='10')
+        overflows = Product.objects.create(title='B', name='B', description='-', commission='10')
+        # Text written before the numeric columns existed
+        Product.objects.filter(pk=fits.pk).update(commission='15%', price='$1,200', commission_rate=None)
+        Product.objects.filter(pk=overflows.pk).update(commission='250000%', price='99999999999')
+
+        backfill(apps, None)
+
+        fits.refresh_from_db()
+        overflows.refresh_from_db()
+        self.assertEqual((fits.commission_rate, fits.price_amount), (Decimal('15'), Decimal('1200')))
+        self.assertEqual((overflows.commission_rate, overflows.price_amount), (None, None))
+
+
+class TieredCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = 1000.0
+        patcher = mock.patch('affiliateos.cache.time.monotonic', side_effect=lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tiered(self, location, **options):
+        """A TieredCache with its own L1, standing in for another process"""
+        options.setdefault('LOCAL_TIMEOUT', 5)
+        tiered = TieredCache(location, {'OPTIONS': {'SHARED': 'shared', **options}})
+        tiered.clear_local()
+        return tiered
+
+    def test_default_cache_uses_locmem_as_the_shared_tier(self):
+        self.assertIsInstance(caches['default'], TieredCache)
+        self.assertIsInstance(caches['default'].shared, LocMemCache)
+
+    def test_local_entries_expire_and_fall_through_to_shared(self):
+        first = self.tiered('test-first')
+        first.set('key', 'one')
+        # Another process writes the shared tier
+        caches['shared'].set('key', 'two')
+
+        self.assertEqual(first.get('key'), 'one')
+        self.clock += 6
+        self.assertEqual(first.get('key'), 'two')
+        self.assertEqual(self.tiered('test-second').get('key'), 'two')
+
+    def test_short_timeouts_bound_the_local_copy(self):
+        first = self.tiered('test-first')
+        first.set('key', 'one', timeout=1)
+        caches['shared'].set('key', 'two')
+        self.clock += 2
+        self.assertEqual(first.get('key'), 'two')
+
+    def test_evicted_local_entries_are_read_from_shared(self):
+        first = self.tiered('test-first', LOCAL_MAX_ENTRIES=2)
+        first.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(len(first._local), 2)
+        self.assertEqual(first.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2, 'c': 3})
+
+    def test_add_and_incr_are_shared(self):
+        first, second = self.tiered('test-first'), self.tiered('test-second')
+        self.assertTrue(first.add('lock', True))
+        self.assertFalse(second.add('lock', True))
+
+        first.set('counter', 1)
+        second.incr('counter')
+        self.assertEqual(first.incr('counter'), 3)
+
+    def test_delete_reaches_both_tiers(self):
+        first = self.tiered('test-first')
+        first.set('key', 'one')
+        first.delete('key')
+        self.assertIsNone(first.get('key'))
+        self.assertIsNone(caches['shared'].get('key'))
+
+
+class CacheNamespaceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_version_is_seeded_once_in_the_shared_tier(self):
+        first, second = CacheNamespace('test'), CacheNamespace('test')
+        self.assertEqual(first.version, 1)
+        self.assertEqual(second.version, 1)
+        self.assertEqual(caches['shared'].get(first.version_key), 1)
+
+    def test_clear_retires_keys_for_every_instance(self):
+        first, second = CacheNamespace('test'), CacheNamespace('test')
+        first.set('key', 'value')
+        self.assertEqual(second.get('key'), 'value')
+
+        second.clear()
+        self.assertIsNone(first.get('key'))
+        self.assertEqual(first.version, 2)
+
+    def test_clear_from_another_process_is_seen_after_the_local_window(self):
+        products = CacheNamespace('test')
+        products.set('key', 'value')
+        caches['shared'].incr(products.version_key)
+        # This process trusts its copy of the version for LOCAL_TIMEOUT
+        self.assertEqual(products.get('key'), 'value')
+
+        cache.clear_local()
+        self.assertIsNone(products.get('key'))
+
+    def test_lost_version_is_seeded_again(self):
+        products = CacheNamespace('test')
+        products.clear()
+        cache.delete(products.version_key)
+
+        products.clear()
+        self.assertEqual(products.version, 1)
+        products.clear()
+        self.assertEqual(products.version, 2)
+
+
+class DailyRollupTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.partners = []
+        for i in range(2):
+            user = User.objects.create_user(email=f'partner{i}@example.com', password='pass')
+            self.partners.append(PartnerProfile.objects.create(
+                user=user, name=f'Partner {i}', email=f'profile{i}@example.com', phone='000', role='Owner'
+            ))
+        self.product = Product.objects.create(title='P', name='P', description='-', commission='10')
+
+    def referral(self, partner, **kwargs):
+        return Referral.objects.create(
+            user=partner.user, partner=partner, product=self.product, client_name='Client',
+            client_email='c@example.com', client_phone='000', **kwargs
+        )
+
+    def referral_rollups(self):
+        return sorted(ReferralDailyRollup.objects.values_list('partner_id', 'status', 'count', 'potential_commission'))
+
+    def test_rollups_refresh_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            referral = self.referral(self.partners[0], potential_commission=Decimal('30.00'))
+            # Nothing is written until the transaction commits
+            self.assertFalse(ReferralDailyRollup.objects.exists())
+        self.assertEqual(self.referral_rollups(), [(self.partners[0].pk, 'pending', 1, Decimal('30.00'))])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            referral = Referral.objects.get(pk=referral.pk)
+            referral.status = Referral.Status.CONTACTED
+            referral.partner = self.partners[1]
+            referral.save()
+        # The slice the referral left is emptied
+        self.assertEqual(self.referral_rollups(), [(self.partners[1].pk, 'contacted', 1, Decimal('30.00'))])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            referral.delete()
+        self.assertEqual(self.referral_rollups(), [])
+
+    def test_earnings_and_payout_rollups_refresh_on_commit(self):
+        partner = self.partners[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            Earnings.objects.create(
+                partner=partner, amount=Decimal('12.50'), date=date(2024, 3, 1), source=Earnings.Source.BONUS,
+                status=Earnings.Status.AVAILABLE,
+            )
+            Payout.objects.create(partner=partner, amount=Decimal('12.50'), payment_method='bank')
+
+        # Requesting the payout moved the earning to processing
+        self.assertEqual(
+            list(EarningsDailyRollup.objects.values_list('date', 'status', 'count', 'amount')),
+            [(date(2024, 3, 1), 'processing', 1, Decimal('12.50'))]
+        )
+        self.assertEqual(
+            list(PayoutDailyRollup.objects.values_list('date', 'status', 'count', 'amount')),
+            [(timezone.localdate(), 'pending', 1, Decimal('12.50'))]
+        )
+
+    def test_refreshes_lock_the_slice_before_rewriting_it(self):
+        partner = self.partners[0]
+        self.referral(partner)
+        # Referrals can outlive their partner
+        Referral.objects.filter(pk=self.referral(partner).pk).update(partner=None)
+        today = timezone.localdate()
+
+        with mock.patch('partner.rollups._lock_slice', wraps=rollups._lock_slice) as lock:
+            rollups.refresh_referral_rollup(today, partner.pk, self.product.pk)
+            rollups.refresh_referral_rollup(today, None, self.product.pk)
+            rollups.refresh_earnings_rollup(today, partner.pk)
+            rollups.refresh_payout_rollup(today, partner.pk)
+
+        locked = [(queryset.model, list(queryset.values_list('pk', flat=True))) for (queryset,), _ in lock.call_args_list]
+        self.assertEqual(locked, [
+            (PartnerProfile, [partner.pk]),
+            (Product, [self.product.pk]),
+            (PartnerProfile, [partner.pk]),
+            (PartnerProfile, [partner.pk]),
+        ])
+        self.assertEqual(
+            sorted(ReferralDailyRollup.objects.values_list('partner_id', 'count'), key=str),
+            sorted([(partner.pk, 1), (None, 1)], key=str),
+        )
+
+    def test_payout_trend_and_processing_time_read_the_rollups(self):
+        partner = self.partners[0]
+        month_start = (timezone.localdate().replace(day=1) - timedelta(days=1)).replace(day=1)
+        requested = timezone.make_aware(datetime.combine(month_start, time(6)))
+        for amount, hours in ((Decimal('10.00'), 6), (Decimal('15.00'), 18)):
+            payout = Payout.objects.create(partner=partner, amount=amount, payment_method='bank')
+            Payout.objects.filter(pk=payout.pk).update(
+                status='completed', request_date=requested, processed_date=requested + timedelta(hours=hours)
+            )
+        rollups.rebuild_rollups()
+
+        with CaptureQueriesContext(connection) as queries:
+            metrics = DashboardMetrics.get_payout_metrics()
+        self.assertEqual(metrics['monthly_trend'][-1], {'month': month_start.strftime('%Y-%m'), 'total': Decimal('25.00')})
+        self.assertEqual(metrics['avg_processing_time_hours'], 12)
+        # Only the pending payout list reads the base table
+        self.assertEqual(sum('"payouts_payout"' in query['sql'] for query in queries.captured_queries), 1)
+
+    def rollup_totals(self):
+        return {
+            'referrals': sorted(ReferralDailyRollup.objects.values_list(
+                'date', 'partner_id', 'product_id', 'status', 'timeline', 'count',
+                'potential_commission', 'actual_commission'
+            )),
+            'earnings': sorted(EarningsDailyRollup.objects.values_list(
+                'date', 'partner_id', 'status', 'source', 'count', 'amount'
+            )),
+            'payouts': sorted(PayoutDailyRollup.objects.values_list(
+                'date', 'partner_id', 'status', 'payment_method', 'count', 'amount'
+            )),
+        }
+
+    def test_rebuild_matches_the_live_rollups(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, partner in enumerate(self.partners):
+                self.referral(partner, potential_commission=Decimal('10.00') * (i + 1))
+                self.referral(partner, status=Referral.Status.CONVERTED, potential_commission=Decimal('5.00'))
+                for day in range(3):
+                    Earnings.objects.create(
+                        partner=partner, amount=Decimal('1.25') * (day + 1), date=date(2024, 3, 1) + timedelta(days=day),
+                        source=Earnings.Source.BONUS, status=Earnings.Status.AVAILABLE,
+                    )
+                Payout.objects.create(partner=partner, amount=Decimal('7.00'), payment_method='bank')
+        live = self.rollup_totals()
+        self.assertTrue(all(live.values()))
+
+        ReferralDailyRollup.objects.all().delete()
+        EarningsDailyRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_rollups', batch_size=2, stdout=out)
+
+        self.assertEqual(self.rollup_totals(), live)
+        self.assertIn(f"{len(live['referrals'])} referral rows", out.getvalue())
+
+        # And the totals agree with the base tables
+        self.assertEqual(
+            sum(row[-1] for row in live['earnings']),
+            sum(Earnings.objects.values_list('amount', flat=True))
+        )
+        self.assertEqual(
+            sum(row[5] for row in live['referrals']), Referral.objects.count()
+        )
+
+
+class DashboardSectionCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = 1000.0
+        patcher = mock.patch('partner.dashboard_cache.time.time', side_effect=lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return {'calls': self.calls}
+
+    def fail(self):
+        raise RuntimeError('database is down')
+
+    def section(self, compute=None):
+        return dashboard_cache.get_section('test', compute or self.compute)
+
+    def hold_lock(self):
+        cache.add(dashboard_cache.LOCK_KEY.format(name='test'), True)
+
+    def test_model_saves_make_the_section_stale(self):
+        user = User.objects.create_user(email='partner@example.com', password='pass')
+        partner = PartnerProfile.objects.create(
+            user=user, name='Partner', email='profile@example.com', phone='000', role='Owner'
+        )
+        product = Product.objects.create(title='P', name='P', description='-', commission='10')
+        category = ResourceCategory.objects.create(name='Sales', slug='sales')
+        saves = [
+            lambda: Referral.objects.create(
+                user=user, partner=partner, product=product, client_name='Client',
+                client_email='c@example.com', client_phone='000'
+            ),
+            lambda: Earnings.objects.create(
+                partner=partner, amount=Decimal('5.00'), date=date(2024, 3, 1), source=Earnings.Source.BONUS
+            ),
+            lambda: Payout.objects.create(partner=partner, amount=Decimal('5.00'), payment_method='bank'),
+            lambda: Resource.objects.create(
+                title='Brochure', description='-', resource_type='pdf', category=category,
+                file='resources/files/brochure.pdf', file_size=1
+            ),
+            lambda: Document.objects.create(user=user, name='Contract'),
+        ]
+        self.assertEqual(self.section(), {'calls': 1})
+
+        for calls, save in enumerate(saves, start=2):
+            with self.captureOnCommitCallbacks(execute=True):
+                save()
+            self.assertEqual(self.section(), {'calls': calls})
+            self.assertEqual(self.section(), {'calls': calls})
+
+    def test_stale_entry_is_served_while_another_worker_recomputes(self):
+        self.section()
+        dashboard_cache.bump_generation()
+        self.hold_lock()
+
+        self.assertEqual(self.section(), {'calls': 1})
+        self.assertEqual(self.calls, 1)
+
+    def test_cold_cache_waits_for_the_lock_holder(self):
+        self.hold_lock()
+        key = dashboard_cache.SECTION_KEY.format(name='test')
+
+        def stored_by_other_worker(seconds):
+            cache.set(key, {'generation': dashboard_cache.get_generation(), 'expires': self.clock, 'data': 'theirs'})
+
+        with mock.patch('partner.dashboard_cache.time.sleep', side_effect=stored_by_other_worker):
+            self.assertEqual(self.section(), 'theirs')
+        self.assertEqual(self.calls, 0)
+
+    def test_cold_cache_computes_when_the_lock_holder_never_stores(self):
+        self.hold_lock()
+        with mock.patch('partner.dashboard_cache.time.sleep'), \
+                mock.patch('partner.dashboard_cache.LOCK_WAIT', 0.01):
+            self.assertEqual(self.section(), {'calls': 1})
+
+    def test_entry_expires_after_cache_ttl(self):
+        self.section()
+        self.clock += settings.CACHE_TTL - 1
+        self.assertEqual(self.section(), {'calls': 1})
+        self.clock += 2
+        self.assertEqual(self.section(), {'calls': 2})
+
+    def test_failed_recompute_falls_back_to_stale_data(self):
+        self.section()
+        dashboard_cache.bump_generation()
+
+        with self.assertLogs('partner.dashboard_cache', level='ERROR'):
+            self.assertEqual(self.section(self.fail), {'calls': 1})
+        # The lock is released so the next request retries
+        self.assertEqual(self.section(), {'calls': 2})
+
+    def test_failed_recompute_on_a_cold_cache_raises(self):
+        with self.assertRaises(RuntimeError):
+            self.section(self.fail)
+
+
+class ReferralMetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.partner = PartnerProfile.objects.create(
+            user=user, name='Partner', email='profile@example.com', phone='000', role='Owner'
+        )
+        self.start = timezone.now() - timedelta(days=10)
+
+    def referral(self, *entries, status='converted'):
+        """A referral with exactly the given (status, days after start) timeline"""
+        referral = Referral.objects.create(
+            user=self.partner.user, client_name='Client', client_email='c@example.com', client_phone='000'
+        )
+        Referral.objects.filter(pk=referral.pk).update(status=status)
+        ReferralTimeline.objects.filter(referral=referral).delete()
+        for entry_status, days in entries:
+            entry = ReferralTimeline.objects.create(referral=referral, status=entry_status)
+            ReferralTimeline.objects.filter(pk=entry.pk).update(timestamp=self.start + timedelta(days=days))
+        return referral
+
+    def per_referral_average(self):
+        """The per-referral loop the aggregate replaced"""
+        conversion_times = []
+        for referral in Referral.objects.filter(status='converted'):
+            timeline_entries = referral.status_changes.order_by('timestamp')
+            first_entry = timeline_entries.first()
+            converted_entry = timeline_entries.filter(status='converted').first()
+            if first_entry and converted_entry:
+                conversion_times.append((converted_entry.timestamp - first_entry.timestamp).total_seconds())
+        if not conversion_times:
+            return None
+        return sum(conversion_times) / len(conversion_times) / (60 * 60 * 24)
+
+    def test_avg_conversion_time_matches_the_per_referral_loop(self):
+        # Several entries: the first 'converted' one counts
+        self.referral(('pending', 0), ('contacted', 1), ('converted', 3), ('converted', 5))
+        self.referral(('pending', 0), ('converted', 1.5))
+        # Never reached 'converted' in the timeline, or has no timeline at all
+        self.referral(('pending', 0), ('contacted', 2))
+        self.referral()
+        # Not converted, so not counted
+        self.referral(('pending', 0), ('converted', 8), status='pending')
+
+        average = DashboardMetrics._get_avg_conversion_time_days()
+        self.assertAlmostEqual(average, 2.25)
+        self.assertAlmostEqual(average, self.per_referral_average())
+
+    def test_windows_and_daily_counts_read_the_rollups(self):
+        now = timezone.now()
+        for days_ago in (0, 0, 1, 3, 10, 40, 100, 400):
+            referral = Referral.objects.create(
+                user=self.partner.user, client_name='Client', client_email='c@example.com', client_phone='000'
+            )
+            Referral.objects.filter(pk=referral.pk).update(date_submitted=now - timedelta(days=days_ago))
+        rollups.rebuild_rollups()
+
+        metrics = DashboardMetrics.get_referral_metrics()
+        self.assertEqual(
+            [metrics[name] for name in (
+                'total_count', 'today_count', 'yesterday_count', 'weekly_count',
+                'monthly_count', 'quarterly_count', 'yearly_count',
+            )],
+            [8, 2, 1, 4, 5, 6, 7]
+        )
+        self.assertEqual(metrics['day_growth'], 100)
+
+        daily_counts = metrics['daily_counts']
+        self.assertEqual(len(daily_counts), 30)
+        self.assertEqual(daily_counts[0], {'date': now.strftime('%Y-%m-%d'), 'count': 2})
+        self.assertEqual(
+            {i: day['count'] for i, day in enumerate(daily_counts) if day['count']},
+            {0: 2, 1: 1, 3: 1, 10: 1}
+        )
+
+    def test_avg_conversion_time_is_none_without_qualifying_referrals(self):
+        self.assertIsNone(DashboardMetrics._get_avg_conversion_time_days())
+
+        self.referral(('pending', 0), ('contacted', 2))
+        self.referral()
+        self.assertIsNone(DashboardMetrics._get_avg_conversion_time_days())
+        self.assertIsNone(self.per_referral_average())
+
+
+class PartnerStatsQuerySetTest(TestCase):
+    stats = (
+        'total_referrals', 'pending_referrals', 'converted_referrals', 'conversion_rate',
+        'available_earnings', 'pending_earnings', 'total_earnings',
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.partners = []
+        for i in range(2):
+            user = User.objects.create_user(email=f'partner{i}@example.com', password='pass')
+            self.partners.append(PartnerProfile.objects.create(
+                user=user, name=f'Partner {i}', email=f'profile{i}@example.com', phone='000', role='Owner'
+            ))
+
+    def test_annotations_match_the_property_queries(self):
+        first, second = self.partners
+        for status in ('pending', 'converted', 'pending'):
+            Referral.objects.create(
+                user=first.user, client_name='Client', client_email='c@example.com', client_phone='000', status=status
+            )
+        # Counted for the user who submitted it, not the partner it is assigned to
+        Referral.objects.create(
+            user=first.user, partner=second, client_name='Client', client_email='c@example.com', client_phone='000'
+        )
+        for status, amount in (
+            ('available', '10.00'), ('available', '20.00'), ('pending', '5.00'), ('paid', '7.00'), ('cancelled', '100.00'),
+        ):
+            Earnings.objects.create(
+                partner=first, amount=Decimal(amount), date=date(2024, 3, 1),
+                source=Earnings.Source.BONUS, status=status,
+            )
+
+        annotated = PartnerProfile.objects.with_stats().order_by('pk')
+        # Several referrals and earnings per partner don't multiply the rows
+        self.assertEqual(len(annotated), 2)
+        for partner in annotated:
+            plain = PartnerProfile.objects.get(pk=partner.pk)
+            for name in self.stats:
+                self.assertEqual(getattr(partner, name), getattr(plain, name), name)
+
+        first, second = annotated
+        self.assertEqual((first.total_referrals, first.pending_referrals, first.converted_referrals), (4, 3, 1))
+        self.assertEqual(first.available_earnings, Decimal('30.00'))
+        self.assertEqual(first.pending_earnings, Decimal('5.00'))
+        self.assertEqual(first.total_earnings, Decimal('42.00'))
+        self.assertEqual(second.total_referrals, 0)
+
+    def test_partner_without_rows_reads_zero(self):
+        partner = PartnerProfile.objects.with_stats().get(pk=self.partners[0].pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [getattr(partner, name) for name in self.stats],
+                [0, 0, 0, 0, Decimal('0'), Decimal('0'), Decimal('0')]
+            )
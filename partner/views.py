@@ -5,6 +5,7 @@ from django.db.models import Count, Sum, Case, When, F, IntegerField
 from django.utils import timezone
 from datetime import timedelta
 from rest_framework import viewsets, status, permissions 
+import mimetypes
 import secrets
 from django.db.models import Prefetch
 from django.utils.text import slugify
@@ -16,14 +17,23 @@ from django.db.models import Count, Sum, Avg, F, Q, ExpressionWrapper, fields
 from django.utils import timezone
 from documents_management.models import Document
 from partner.dashboard_metrics import DashboardMetrics
+from affiliateos import files
+from partner import catalog, dashboard_cache
 from payouts.models import Earnings, Payout
 from referrals_management.models import Referral
 from resources.models import Resource
-from .models import PartnerOnboardingLink, PartnerProfile, Product, Testimonial
+from .models import (
+    PartnerOnboardingLink, PartnerProfile, Product, Testimonial,
+    ReferralDailyRollup, EarningsDailyRollup
+)
 from .serializers import PartnerOnboardingLinkSerializer,  PartnerProfileSerializer, PartnerDetailSerializer, PartnerProfileUpdateSerializer, ProductSerializer, TestimonialSerializer
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.pagination import CursorPagination
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from rest_framework.generics import get_object_or_404
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
     Custom permission to only allow owners of a profile to edit it.
@@ -55,7 +65,7 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         # Retrieve the products that are associated with the authenticated user's PartnerProfile
         partner_profile = self.request.user.partner_profile  # Access PartnerProfile via user
-        return partner_profile.selected_products.all()  # Access the products linked to the PartnerProfile
+        return partner_profile.selected_products.order_by('id')  # Access the products linked to the PartnerProfile
     
     def get_permissions(self):
         # For update, partial update, and destroy actions, check if the user is the owner
@@ -63,6 +73,37 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
             return [IsAuthenticated(), IsOwnerOrReadOnly()]
         return super().get_permissions()
 
+    def list(self, request, *args, **kwargs):
+        # Only ids and timestamps come from the database; the serialized
+        # products come from the catalog cache
+        rows = self.filter_queryset(self.get_queryset()).values_list('id', 'updated_at')
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            rows, count = list(page), self.paginator.page.paginator.count
+        else:
+            rows, count = list(rows), len(rows)
+
+        etag, last_modified = catalog.validators(rows, extra=count)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return catalog.set_validators(not_modified, etag, last_modified)
+
+        data = catalog.serialized_products([pk for pk, _ in rows], request)
+        response = self.get_paginated_response(data) if page is not None else Response(data)
+        return catalog.set_validators(response, etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        row = get_object_or_404(self.get_queryset().values_list('id', 'updated_at'), pk=lookup)
+
+        etag, last_modified = catalog.validators([row])
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return catalog.set_validators(not_modified, etag, last_modified)
+
+        data = catalog.serialized_products([row[0]], request)
+        return catalog.set_validators(Response(data[0]), etag, last_modified)
+
 
 
 
@@ -98,6 +139,15 @@ class TestimonialViewSet(viewsets.ModelViewSet):
 
         return super().create(request, *args, **kwargs)
 
+    @action(detail=True, methods=['get'])
+    def video(self, request, pk=None):
+        """Stream a video testimonial, with Range support for seeking"""
+        testimonial = self.get_object()
+        if testimonial.type != Testimonial.TestimonialType.VIDEO or not testimonial.video:
+            raise Http404
+        content_type = mimetypes.guess_type(testimonial.video.name)[0]
+        return files.serve(request, testimonial.video, content_type=content_type, as_attachment=False)
+
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
         testimonial = self.get_object()
@@ -119,10 +169,18 @@ class TestimonialViewSet(viewsets.ModelViewSet):
 
 
 
+class PartnerCursorPagination(CursorPagination):
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
 class PartnerViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = PartnerProfile.objects.all()
     serializer_class = PartnerProfileSerializer
+    pagination_class = PartnerCursorPagination
     parser_classes = [MultiPartParser, FormParser, JSONParser]
     permission_classes = [IsAuthenticatedOrReadOnly]  
 
@@ -177,46 +235,12 @@ class PartnerViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
 
-        # Optimized queryset with proper prefetching
+        # Referral and earnings stats come from correlated subqueries, so the
+        # to-many relations are never joined and partner rows are not multiplied
         queryset = PartnerProfile.objects.select_related('user').prefetch_related(
-            'user__referrals',
             Prefetch('selected_products', queryset=Product.objects.all()),
-            'testimonials'
-        ).annotate(
-            total_referrals_count=Count('user__referrals'),
-            converted_referrals_count=Count(
-                Case(
-                    When(user__referrals__status='converted', then=1),
-                    output_field=IntegerField()
-                )
-            )
-        )
-
-        # Add calculated fields for earnings if the model supports it
-        if hasattr(self, 'earnings'):
-            queryset = queryset.annotate(
-                total_earnings=Sum(
-                    Case(
-                        When(earnings__status__in=['available', 'paid'], then=F('earnings__amount')),
-                        default=0,
-                        output_field=IntegerField()
-                    )
-                ),
-                available_earnings=Sum(
-                    Case(
-                        When(earnings__status='available', then=F('earnings__amount')),
-                        default=0,
-                        output_field=IntegerField()
-                    )
-                ),
-                pending_earnings=Sum(
-                    Case(
-                        When(earnings__status='pending', then=F('earnings__amount')),
-                        default=0,
-                        output_field=IntegerField()
-                    )
-                )
-            )
+            self.approved_testimonials_prefetch()
+        ).with_stats()
 
         # Apply user-based access control
         if not (user.is_staff or user.is_superuser):
@@ -438,45 +462,49 @@ class PartnerViewSet(viewsets.ModelViewSet):
         # Add calculated fields for total earnings, available earnings, and pending earnings        
     def list(self, request):
         """
-        Override list method to return partner profiles in the format needed by the frontend
+        Return a cursor-paginated page of partner profiles.
+        Nested products and testimonials are only serialized (and prefetched)
+        when requested with ?expand=, and ?fields= limits the returned fields.
         """
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        
-        # Add conversion_rate calculation where needed
-        partners_data = serializer.data
-        for partner in partners_data:
-            total_referrals = partner.get('total_referrals', 0)
-            converted_referrals = partner.get('converted_referrals', 0)
-            
-            if total_referrals > 0:
-                partner['conversion_rate'] = round((converted_referrals / total_referrals) * 100)
-            else:
-                partner['conversion_rate'] = 0
-        
-        return Response(partners_data)
+        queryset = self.filter_queryset(self.get_queryset())
+
+        expanded = PartnerProfileSerializer.parse_field_list(request.query_params.get('expand'))
+        prefetches = []
+        if 'selected_products' in expanded:
+            prefetches.append('selected_products')
+        if expanded & {'text_testimonials', 'image_testimonials', 'video_testimonials'}:
+            prefetches.append(self.approved_testimonials_prefetch())
+        queryset = queryset.prefetch_related(None).prefetch_related(*prefetches)
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @staticmethod
+    def approved_testimonials_prefetch():
+        """Prefetch only the approved testimonials shown on partner profiles"""
+        return Prefetch(
+            'testimonials',
+            queryset=Testimonial.objects.filter(status=Testimonial.Status.APPROVED)
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list':
+            context['collapse_expandable'] = True
+        return context
     
     
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        print("Raw products:", list(instance.selected_products.all()))
         try:
             partner = self.get_object()
-        except:
+        except Http404:
             return Response({"error": "Partner not found"}, status=status.HTTP_404_NOT_FOUND)
         
         # Get basic partner profile data
         serializer = PartnerDetailSerializer(partner)
         partner_data = serializer.data
         
-        # Get all converted referrals (unsliced)
-        converted_referrals = partner.user.referrals.filter(status='converted')
-        
-        # Calculate total commission from all converted referrals
-        total_commission = converted_referrals.aggregate(
-            total=Sum('actual_commission')
-        )['total'] or 0
-        
         # Get all referrals for calculations (unsliced)
         all_referrals = partner.user.referrals.all()
         
@@ -486,13 +514,24 @@ class PartnerViewSet(viewsets.ModelViewSet):
             'status', 'potential_commission', 'actual_commission', 'product__name'
         ))
         
-        # Now, calculate the referrals by product and other details
+        # Referral counts and commission per selected product in one grouped query
+        selected_products = list(partner.selected_products.all())
+        product_stats = {
+            row['product']: row
+            for row in all_referrals.filter(
+                product__in=selected_products
+            ).order_by().values('product').annotate(
+                count=Count('id'),
+                converted=Count('id', filter=Q(status='converted')),
+                total_commission=Sum('actual_commission', filter=Q(status='converted')),
+            )
+        }
+
         referrals_by_product = []
-        for product in partner.selected_products.all():
-            # Work with unsliced querysets for calculations
-            product_referrals = all_referrals.filter(product=product)
-            converted_count = product_referrals.filter(status='converted').count()
-            total_count = product_referrals.count()
+        for product in selected_products:
+            stats = product_stats.get(product.id, {})
+            total_count = stats.get('count', 0)
+            converted_count = stats.get('converted', 0)
             conversion_rate = 0
             if total_count > 0:
                 conversion_rate = round((converted_count / total_count) * 100)
@@ -501,9 +540,7 @@ class PartnerViewSet(viewsets.ModelViewSet):
                 'product_name': product.name,
                 'count': total_count,
                 'conversion_rate': conversion_rate,
-                'total_commission': product_referrals.filter(status='converted').aggregate(
-                    total=Sum('actual_commission')
-                )['total'] or 0
+                'total_commission': stats.get('total_commission') or 0
             })
 
         # Get earnings data (adjust based on your models)
@@ -544,6 +581,13 @@ class PartnerViewSet(viewsets.ModelViewSet):
                     'referrals_count': month_data['referrals_count']
                 })
         
+        # Converted and pending totals in one conditional aggregate
+        status_totals = all_referrals.aggregate(
+            converted_commission=Sum('actual_commission', filter=Q(status='converted')),
+            pending_count=Count('id', filter=Q(status='pending')),
+            pending_commission=Sum('potential_commission', filter=Q(status='pending')),
+        )
+
         # Calculate metrics
         metrics = {
             'available_earnings': partner_data.get('available_earnings', 0),
@@ -553,15 +597,11 @@ class PartnerViewSet(viewsets.ModelViewSet):
             'referral_status_counts': {
                 'converted': {
                     'count': partner_data.get('converted_referrals', 0),
-                    'total_commission': converted_referrals.aggregate(  # Use the unsliced queryset
-                        total=Sum('actual_commission')
-                    )['total'] or 0
+                    'total_commission': status_totals['converted_commission'] or 0
                 },
                 'pending': {
-                    'count': all_referrals.filter(status='pending').count(),  # Use a direct filter
-                    'total_commission': all_referrals.filter(status='pending').aggregate(
-                        total=Sum('potential_commission')
-                    )['total'] or 0
+                    'count': status_totals['pending_count'],
+                    'total_commission': status_totals['pending_commission'] or 0
                 }
             }
         }
@@ -620,39 +660,31 @@ class PartnerViewSet(viewsets.ModelViewSet):
             created_at__year=current_year
         ).count()
         
-        # Average conversion rate
-        # This calculation depends on your specific data model
-        # This is a simplified version
-        partners_with_referrals = PartnerProfile.objects.annotate(
-            total_refs=Count('user__referrals'),
-            converted_refs=Count(
-                Case(
-                    When(user__referrals__status='converted', then=1),
-                    output_field=IntegerField()
-                )
-            )
+        # Average conversion rate across partners with referrals, from the daily rollup
+        partners_with_referrals = ReferralDailyRollup.objects.filter(
+            partner__isnull=False
+        ).values('partner_id').annotate(
+            total_refs=Sum('count'),
+            converted_refs=Sum('count', filter=Q(status='converted'), default=0)
         ).filter(total_refs__gt=0)
         
-        total_conversion_rate = 0
-        partners_count = partners_with_referrals.count()
+        partner_rates = [
+            (partner['converted_refs'] / partner['total_refs']) * 100
+            for partner in partners_with_referrals
+        ]
+        average_conversion_rate = round(sum(partner_rates) / len(partner_rates)) if partner_rates else 0
         
-        if partners_count > 0:
-            for partner in partners_with_referrals:
-                if partner.total_refs > 0:
-                    partner_rate = (partner.converted_refs / partner.total_refs) * 100
-                    total_conversion_rate += partner_rate
-                    
-            average_conversion_rate = round(total_conversion_rate / partners_count)
-        else:
-            average_conversion_rate = 0
-        
-        # Total earnings
-        # Adjust based on your data model
-        total_earnings = 0
+        # Total earnings (excluding cancelled) from the daily rollup
+        total_earnings = EarningsDailyRollup.objects.exclude(
+            status='cancelled'
+        ).aggregate(total=Sum('amount'))['total'] or 0
         
         # Status breakdown
+        status_counts = dict(
+            PartnerProfile.objects.values_list('status').annotate(count=Count('id')).order_by()
+        )
         status_breakdown = {
-            status_choice[0]: PartnerProfile.objects.filter(status=status_choice[0]).count()
+            status_choice[0]: status_counts.get(status_choice[0], 0)
             for status_choice in PartnerProfile.Status.choices
         }
         
@@ -1159,60 +1191,76 @@ class PartnerOnboardingLinkViewSet(viewsets.ModelViewSet):
 
 class DashboardViewSet(viewsets.ViewSet):
     """
-    API endpoint for dashboard metrics
+    API endpoint for dashboard metrics.
+    Sections are served from a versioned cache, see partner.dashboard_cache.
     """
     # permission_classes = [IsAdminUser]  # Only admin users can view dashboard metrics
+
+    SECTIONS = {
+        'overview': DashboardMetrics.get_overview_metrics,
+        'referrals': DashboardMetrics.get_referral_metrics,
+        'partners': DashboardMetrics.get_partner_metrics,
+        'earnings': DashboardMetrics.get_earnings_metrics,
+        'payouts': DashboardMetrics.get_payout_metrics,
+        'resources': DashboardMetrics.get_resource_metrics,
+        'documents': DashboardMetrics.get_document_metrics,
+        'products': DashboardMetrics.get_product_metrics,
+        'timeline': DashboardMetrics.get_timeline_metrics,
+    }
     
     @action(detail=False, methods=['get'])
     def metrics(self, request):
         """Get all dashboard metrics"""
-        metrics = DashboardMetrics.get_all_metrics()
+        metrics = {
+            name: dashboard_cache.get_section(name, compute)
+            for name, compute in self.SECTIONS.items()
+        }
         return Response(metrics)
     
     @action(detail=False, methods=['get'])
     def overview(self, request):
         """Get overview metrics"""
-        metrics = DashboardMetrics.get_overview_metrics()
+        metrics = dashboard_cache.get_section('overview', self.SECTIONS['overview'])
         return Response(metrics)
     
     @action(detail=False, methods=['get'])
     def referrals(self, request):
         """Get referral metrics"""
-        metrics = DashboardMetrics.get_referral_metrics()
+        metrics = dashboard_cache.get_section('referrals', self.SECTIONS['referrals'])
         return Response(metrics)
     
     @action(detail=False, methods=['get'])
     def partners(self, request):
         """Get partner metrics"""
-        metrics = DashboardMetrics.get_partner_metrics()
+        metrics = dashboard_cache.get_section('partners', self.SECTIONS['partners'])
         return Response(metrics)
     
     @action(detail=False, methods=['get'])
     def earnings(self, request):
         """Get earnings metrics"""
-        metrics = DashboardMetrics.get_earnings_metrics()
+        metrics = dashboard_cache.get_section('earnings', self.SECTIONS['earnings'])
         return Response(metrics)
     
     @action(detail=False, methods=['get'])
     def payouts(self, request):
         """Get payout metrics"""
-        metrics = DashboardMetrics.get_payout_metrics()
+        metrics = dashboard_cache.get_section('payouts', self.SECTIONS['payouts'])
         return Response(metrics)
     
     @action(detail=False, methods=['get'])
     def resources(self, request):
         """Get resource metrics"""
-        metrics = DashboardMetrics.get_resource_metrics()
+        metrics = dashboard_cache.get_section('resources', self.SECTIONS['resources'])
         return Response(metrics)
     
     @action(detail=False, methods=['get'])
     def documents(self, request):
         """Get document metrics"""
-        metrics = DashboardMetrics.get_document_metrics()
+        metrics = dashboard_cache.get_section('documents', self.SECTIONS['documents'])
         return Response(metrics)
     
     @action(detail=False, methods=['get'])
     def products(self, request):
         """Get product metrics"""
-        metrics = DashboardMetrics.get_product_metrics()
+        metrics = dashboard_cache.get_section('products', self.SECTIONS['products'])
         return Response(metrics)
\ No newline at end of file
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from payouts import statements
+
+
+class Command(BaseCommand):
+    help = "Render monthly partner statements to PDF, skipping months that haven't changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help="Month as YYYY-MM, defaults to last month")
+        parser.add_argument('--partner', type=int, action='append', dest='partners',
+                            help="Only this partner profile id; can be repeated")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Rendering processes, defaults to the number of CPUs")
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                period = datetime.strptime(options['month'], '%Y-%m')
+            except ValueError:
+                raise CommandError("--month must look like 2024-01")
+            year, month = period.year, period.month
+        else:
+            first_of_month = timezone.localdate().replace(day=1)
+            year, month = (first_of_month.year, first_of_month.month - 1) if first_of_month.month > 1 \
+                else (first_of_month.year - 1, 12)
+
+        rendered, skipped = statements.generate_statements(
+            year, month, partner_ids=options['partners'], workers=options['workers']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Statements for {statements.period_label(year, month)}: {rendered} rendered, {skipped} unchanged"
+        ))
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.17 on 2026-10-16 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payouts', '0004_earnings_paid_date'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='earnings',
+            index=models.Index(fields=['date', 'id'], name='payouts_ear_date_c572c7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='earnings',
+            index=models.Index(fields=['partner', 'date', 'id'], name='payouts_ear_partner_b50069_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payout',
+            index=models.Index(fields=['request_date', 'id'], name='payouts_pay_request_ff45fd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payout',
+            index=models.Index(fields=['partner', 'request_date', 'id'], name='payouts_pay_partner_4b7636_idx'),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from decimal import Decimal
+from affiliateos.mixins import TrackedFieldsMixin
 from partner.models import PartnerProfile
 from referrals_management.models import Referral
 import uuid
@@ -42,7 +43,7 @@ class PayoutTimeline(models.Model):
     def __str__(self):
         return f"{self.payout.id} - {self.status} at {self.timestamp}"
 
-class Payout(models.Model):
+class Payout(TrackedFieldsMixin, models.Model):
     class Status(models.TextChoices):
         PENDING = 'pending', _('Pending')
         PROCESSING = 'processing', _('Processing')
@@ -91,6 +92,9 @@ class Payout(models.Model):
         help_text="Admin who processed this payout"
     )
 
+    # Fields whose loaded values are kept to detect changes on save
+    tracked_fields = ('status', 'request_date', 'partner')
+
     class Meta:
         ordering = ['-request_date']
         verbose_name = _("Payout")
@@ -98,6 +102,9 @@ class Payout(models.Model):
         indexes = [
             models.Index(fields=['status', 'request_date']),
             models.Index(fields=['partner', 'status']),
+            # Keyset pagination, all payouts and per partner
+            models.Index(fields=['request_date', 'id']),
+            models.Index(fields=['partner', 'request_date', 'id']),
         ]
 
     def __str__(self):
@@ -112,23 +119,21 @@ class Payout(models.Model):
         if not self.id:
             self.id = f"PY-{uuid.uuid4().hex[:8].upper()}"
 
-        status_changed = False
-
-        if self.pk and Payout.objects.filter(pk=self.pk).exists():
-            old_instance = Payout.objects.get(pk=self.pk)
-            if old_instance.status != self.status:
-                status_changed = True
+        status_changed = self.has_changed('status')
 
-        super().save(*args, **kwargs)
+        # The post_save signal settles earnings on completion; a failure
+        # there rolls the status change back with them
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
-        # After saving, create a timeline record if the status changed
-        if status_changed:
-            PayoutTimeline.objects.create(
-                payout=self,
-                status=self.status,
-                note=f"Status changed to {self.status}",
-                changed_by=self.processed_by
-            )
+            # After saving, create a timeline record if the status changed
+            if status_changed:
+                PayoutTimeline.objects.create(
+                    payout=self,
+                    status=self.status,
+                    note=f"Status changed to {self.status}",
+                    changed_by=self.processed_by
+                )
 
 
     def process(self, user=None):
@@ -138,116 +143,60 @@ class Payout(models.Model):
         return self
         
     def complete(self, transaction_id=None, user=None):
-        """Mark payout as completed and update all related earnings to paid status"""
-        from .models import Earnings  # Local import to avoid circular imports
-        
-        # Update payout status
-        self.status = self.Status.COMPLETED
-        self.processed_date = timezone.now()
-        self.transaction_id = transaction_id
-        self.processed_by = user if user else self.processed_by
-        self.save()
-        
-        # Update all earnings associated with this payout
-        try:
-            with transaction.atomic():
-                # 1. Direct earnings linked to this payout
-                direct_earnings = Earnings.objects.filter(
-                    payout=self,
-                    status__in=[Earnings.Status.AVAILABLE, Earnings.Status.PROCESSING]
-                )
-                
-                update_count = 0
-                for earning in direct_earnings:
-                    earning.status = Earnings.Status.PAID
-                    earning.paid_date = timezone.now()
-                    earning.save(update_fields=['status', 'paid_date'])
-                    update_count += 1
-                
-                # 2. Find and update any available earnings for this partner that aren't linked yet
-                available_earnings = Earnings.objects.filter(
-                    partner=self.partner,
-                    status=Earnings.Status.AVAILABLE,
-                    payout__isnull=True
-                )
-                
-                for earning in available_earnings:
-                    earning.status = Earnings.Status.PAID
-                    earning.payout = self
-                    earning.paid_date = timezone.now()
-                    earning.save(update_fields=['status', 'payout', 'paid_date'])
-                    update_count += 1
-                
-                # 3. Update earnings linked via referrals
-                for payout_ref in self.referrals.all():
-                    if hasattr(payout_ref, 'referral') and hasattr(payout_ref.referral, 'earning'):
-                        earning = payout_ref.referral.earning
-                        if earning.status in [Earnings.Status.AVAILABLE, Earnings.Status.PROCESSING]:
-                            earning.status = Earnings.Status.PAID
-                            earning.payout = self
-                            earning.paid_date = timezone.now()
-                            earning.save(update_fields=['status', 'payout', 'paid_date'])
-                            update_count += 1
-                
-                logger.info(f"Payout {self.id} completed: Updated {update_count} earnings to PAID status")
-        
-        except Exception as e:
-            logger.error(f"Error updating earnings for payout {self.id}: {str(e)}")
-            # We don't raise the exception here to allow the payout to complete
-            # even if there are issues with updating some earnings
+        """
+        Mark payout as completed. The status transition settles the payout's
+        earnings (see settle_earnings) and records a single timeline entry.
+        """
+        with transaction.atomic():
+            self.status = self.Status.COMPLETED
+            self.processed_date = timezone.now()
+            self.transaction_id = transaction_id or self.transaction_id
+            self.processed_by = user if user else self.processed_by
+            self.save()
         
         return self
-    def _update_associated_earnings(self):
-        """Update all earnings associated with this payout to PAID status"""
-        try:
-            with transaction.atomic():
-                # Update earnings directly linked to this payout
-                updated_direct = 0
-                for earning in self.earnings_included.filter(
-                    status__in=['processing', 'available']
-                ):
-                    earning.status = 'paid'
-                    earning.paid_date = timezone.now()
-                    earning.save(update_fields=['status', 'paid_date'])
-                    updated_direct += 1
-                
-                # Update earnings linked through referrals
-                updated_referrals = 0
-                for payout_ref in self.referrals.select_related('referral__earning').all():
-                    if hasattr(payout_ref.referral, 'earning'):
-                        earning = payout_ref.referral.earning
-                        if earning.status in ['processing', 'available']:
-                            earning.status = 'paid'
-                            earning.payout = self
-                            earning.paid_date = timezone.now()
-                            earning.save(update_fields=['status', 'payout', 'paid_date'])
-                            updated_referrals += 1
-                
-                logger.info(
-                    f"Payout {self.id} completed: Updated {updated_direct} direct earnings and {updated_referrals} referral earnings to PAID"
-                )
-                
-                # Double-check for any missed earnings related to this payout
-                # This will find any earnings related to the payout that weren't caught by the direct linkage checks
-                from .models import Earnings  # Local import to avoid circular references
-                
-                # Look for available/processing earnings that should be paid
-                missed_earnings = Earnings.objects.filter(
+
+    def settle_earnings(self):
+        """
+        Move every earning covered by this payout to PAID using set-based
+        UPDATEs: earnings linked directly or through the payout's referrals,
+        then the partner's AVAILABLE or PROCESSING earnings not yet linked
+        to any payout. Unlinked PROCESSING earnings are the ones moved there
+        when the payout was requested; they are linked to this payout as
+        they are paid. Returns the number of earnings updated in each group.
+        """
+        from partner.rollups import update_earnings
+
+        now = timezone.now()
+        payable = [Earnings.Status.AVAILABLE, Earnings.Status.PROCESSING]
+
+        with transaction.atomic():
+            linked = update_earnings(
+                Earnings.objects.filter(
                     Q(payout=self) | Q(referral__payout_referrals__payout=self),
-                    status__in=['processing', 'available']
-                ).distinct()
-                
-                if missed_earnings.exists():
-                    logger.info(f"Found {missed_earnings.count()} additional earnings to update for payout {self.id}")
-                    for earning in missed_earnings:
-                        earning.status = 'paid'
-                        earning.paid_date = timezone.now()
-                        earning.save(update_fields=['status', 'paid_date'])
-                    
-        except Exception as e:
-            logger.error(f"Error updating earnings for payout {self.id}: {str(e)}")
-            # You can choose to re-raise the exception for critical errors
-            # raise
+                    status__in=payable
+                ),
+                status=Earnings.Status.PAID,
+                payout=self,
+                paid_date=now
+            )
+            unlinked = update_earnings(
+                Earnings.objects.filter(
+                    partner_id=self.partner_id,
+                    payout__isnull=True,
+                    status__in=payable
+                ),
+                status=Earnings.Status.PAID,
+                payout=self,
+                paid_date=now
+            )
+
+        counts = {'linked': linked, 'unlinked': unlinked, 'total': linked + unlinked}
+        logger.info(
+            f"Payout {self.id} completed: Updated {counts['total']} earnings to PAID "
+            f"(linked: {linked}, unlinked: {unlinked})"
+        )
+        return counts
     
     def cancel(self, reason=None, user=None):
         self.status = self.Status.CANCELLED
@@ -477,7 +426,7 @@ class PayoutSetting(models.Model):
 
 
 
-class Earnings(models.Model):
+class Earnings(TrackedFieldsMixin, models.Model):
     class Source(models.TextChoices):
         REFERRAL = 'referral', _('Referral')
         BONUS = 'bonus', _('Bonus')
@@ -530,6 +479,16 @@ class Earnings(models.Model):
         related_name='earnings_included'
     )
 
+    # Fields whose loaded values are kept to detect changes on save
+    tracked_fields = ('status', 'date', 'partner')
+
+    class Meta:
+        indexes = [
+            # Keyset pagination, all earnings and per partner
+            models.Index(fields=['date', 'id']),
+            models.Index(fields=['partner', 'date', 'id']),
+        ]
+
     def save(self, *args, **kwargs):
         """
         Override save to enforce business rules on status transitions
@@ -146,31 +146,17 @@ class PayoutUpdateSerializer(BasePayoutSerializer):
     def update(self, instance, validated_data):
         request = self.context.get('request')
         
-        # Track if status is being changed to COMPLETED
-        completing_payout = (
-            'status' in validated_data and 
-            validated_data['status'] == Payout.Status.COMPLETED and
-            instance.status != Payout.Status.COMPLETED
-        )
-        
         if 'status' in validated_data and validated_data['status'] != instance.status:
             validated_data['processed_by'] = request.user if request else None
             
             if validated_data['status'] == Payout.Status.COMPLETED:
                 validated_data['processed_date'] = timezone.now()
                 
-        # Update the instance
-        try:
-            with transaction.atomic():
-                instance = super().update(instance, validated_data)
-                
-                # After updating, if status changed to COMPLETED, update earnings
-                if completing_payout:
-                    instance._update_associated_earnings()
-        except Exception as e:
-  
-            raise
-            
+        # Completing the payout settles its earnings through
+        # Payout.settle_earnings() in the post_save signal, inside this transaction
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+
         return instance
 
     def _mark_all_earnings_as_paid(self, payout):
@@ -19,23 +19,11 @@ class PaymentProcessor:
         return payout
     
     @staticmethod
-    def complete_payment(payout, transaction_id=None):
+    def complete_payment(payout, transaction_id=None, user=None):
         """
-        Mark payment as completed
+        Mark payment as completed and settle the related earnings
         """
-        payout.status = payout.Status.COMPLETED
-        payout.processed_date = timezone.now()
-        if transaction_id:
-            payout.transaction_id = transaction_id
-        payout.save()
-        
-        # Mark related earnings as paid
-        for payout_ref in payout.referrals.all():
-            if hasattr(payout_ref.referral, 'earning'):
-                earning = payout_ref.referral.earning
-                earning.mark_as_paid()
-                
-        return payout
+        return payout.complete(transaction_id=transaction_id, user=user)
     
     @staticmethod
     def fail_payment(payout, error_message):
@@ -0,0 +1,309 @@
+# payouts/statements.py
+"""
+Monthly partner statements: earnings, payouts and the referrals each payout
+covered, rendered to PDF with WeasyPrint from ``payouts/statement.html``.
+
+Statement data is collected for every partner of a month with a handful of
+queries in the calling process. Each statement is stored as
+
+    statements/<partner id>/<YYYY-MM>-<hash>.pdf
+
+where the hash covers the statement data and the template, so a month whose
+numbers haven't changed is found in storage and never rendered again.
+Rendering, the slow part, runs in a process pool; workers only turn plain
+dicts into PDF bytes and never touch the database.
+
+Saving a month's statement takes a lock in the shared cache, so concurrent
+requests render it once. Outdated versions are kept for
+``OUTDATED_GRACE_SECONDS`` after they are replaced, so a response (or the
+front proxy) still serving one doesn't lose the file halfway.
+"""
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from functools import lru_cache
+import hashlib
+import json
+import logging
+import os
+import posixpath
+from time import monotonic, sleep
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.template.loader import get_template
+from django.utils import timezone
+
+from partner.models import PartnerProfile
+
+from .models import Earnings, Payout, PayoutReferral
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_TEMPLATE = 'payouts/statement.html'
+STATEMENT_DIR = 'statements'
+LOCK_KEY = 'statements:lock:{prefix}'
+LOCK_TIMEOUT = 120
+OUTDATED_GRACE_SECONDS = 10 * 60
+# Earnings listed on a statement but not counted towards what was earned
+VOIDED_EARNINGS = {Earnings.Status.CANCELLED, Earnings.Status.REJECTED}
+# month_bounds needs the following month to be a valid date too
+MIN_YEAR, MAX_YEAR = 1, 9998
+
+
+def month_bounds(year, month):
+    """First day of the month and first day of the next one"""
+    start = date(year, month, 1)
+    end = date(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+
+def period_label(year, month):
+    return f'{year}-{month:02d}'
+
+
+def _text(value):
+    """Stable text for hashing and display"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M') if timezone.is_aware(value) else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def collect_statements(year, month, partner_ids=None):
+    """
+    Return {partner_id: statement data} for partners with earnings or
+    payouts in the month. The data is plain strings, lists and dicts.
+    """
+    start, end = month_bounds(year, month)
+    start_at = timezone.make_aware(datetime.combine(start, time.min))
+    end_at = timezone.make_aware(datetime.combine(end, time.min))
+
+    earnings = Earnings.objects.filter(date__gte=start, date__lt=end)
+    payouts = Payout.objects.filter(request_date__gte=start_at, request_date__lt=end_at)
+    if partner_ids is not None:
+        earnings = earnings.filter(partner_id__in=partner_ids)
+        payouts = payouts.filter(partner_id__in=partner_ids)
+
+    earnings_by_partner = defaultdict(list)
+    for partner_id, day, source, status, amount, client_name in earnings.order_by('date', 'id').values_list(
+        'partner_id', 'date', 'source', 'status', 'amount', 'referral__client_name'
+    ):
+        earnings_by_partner[partner_id].append({
+            'date': _text(day), 'source': source, 'status': status,
+            'amount': amount, 'client': _text(client_name),
+        })
+
+    payouts_by_partner = defaultdict(list)
+    payouts_by_id = {}
+    for partner_id, payout_id, requested, processed, status, method, amount in payouts.order_by(
+        'request_date', 'id'
+    ).values_list('partner_id', 'id', 'request_date', 'processed_date', 'status', 'payment_method', 'amount'):
+        payout = {
+            'id': payout_id, 'requested': _text(requested), 'processed': _text(processed),
+            'status': status, 'method': method, 'amount': amount, 'referrals': [],
+        }
+        payouts_by_partner[partner_id].append(payout)
+        payouts_by_id[payout_id] = payout
+
+    for payout_id, client_name, amount in PayoutReferral.objects.filter(
+        payout__in=payouts.values('id')
+    ).order_by('created_at', 'id').values_list('payout_id', 'referral__client_name', 'amount'):
+        payouts_by_id[payout_id]['referrals'].append({'client': _text(client_name), 'amount': amount})
+
+    partner_ids = set(earnings_by_partner) | set(payouts_by_partner)
+    partners = PartnerProfile.objects.filter(id__in=partner_ids).values_list('id', 'name', 'email')
+
+    statements = {}
+    for partner_id, name, email in partners:
+        partner_earnings = earnings_by_partner[partner_id]
+        partner_payouts = payouts_by_partner[partner_id]
+        earned = sum(
+            (row['amount'] for row in partner_earnings if row['status'] not in VOIDED_EARNINGS),
+            Decimal('0')
+        )
+        paid = sum(
+            (row['amount'] for row in partner_payouts if row['status'] == Payout.Status.COMPLETED),
+            Decimal('0')
+        )
+        statement = {
+            'partner': {'id': partner_id, 'name': name, 'email': email},
+            'period': period_label(year, month),
+            'earnings': partner_earnings,
+            'payouts': partner_payouts,
+            'total_earned': earned,
+            'total_paid': paid,
+        }
+        # Decimals become strings here so the data hashes and pickles the same everywhere
+        statements[partner_id] = json.loads(json.dumps(statement, default=_text))
+    return statements
+
+
+@lru_cache(maxsize=None)
+def get_statement_template():
+    """The compiled template, loaded once per process"""
+    return get_template(STATEMENT_TEMPLATE)
+
+
+@lru_cache(maxsize=None)
+def template_digest():
+    return hashlib.sha256(get_statement_template().template.source.encode()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _font_config():
+    from weasyprint.text.fonts import FontConfiguration
+
+    return FontConfiguration()
+
+
+def statement_name(statement):
+    """Storage name of a statement, derived from its content"""
+    digest = hashlib.sha256(template_digest().encode())
+    digest.update(json.dumps(statement, sort_keys=True).encode())
+    return posixpath.join(
+        STATEMENT_DIR, str(statement['partner']['id']),
+        f"{statement['period']}-{digest.hexdigest()[:16]}.pdf"
+    )
+
+
+def render_pdf(statement):
+    """Render one statement to PDF bytes"""
+    from weasyprint import HTML
+
+    html = get_statement_template().render({
+        'statement': statement,
+        'generated_at': timezone.now(),
+    })
+    return HTML(string=html).write_pdf(font_config=_font_config())
+
+
+def _month_prefix(name):
+    """Storage name of a statement up to its hash: the partner and month"""
+    return name.rsplit('-', 1)[0] + '-'
+
+
+@contextmanager
+def _month_lock(name):
+    """
+    Serialize renders of one partner's month across processes. After
+    LOCK_TIMEOUT the caller goes ahead unlocked rather than fail.
+    """
+    store = getattr(cache, 'shared', cache)
+    key = LOCK_KEY.format(prefix=_month_prefix(name))
+    deadline = monotonic() + LOCK_TIMEOUT
+    while not store.add(key, True, timeout=LOCK_TIMEOUT):
+        if monotonic() > deadline:
+            logger.warning(f"Timed out waiting for the statement lock of {name}")
+            yield
+            return
+        sleep(0.05)
+    try:
+        yield
+    finally:
+        store.delete(key)
+
+
+def _save(name, pdf):
+    """
+    Store a rendered statement and drop versions of the same month that
+    were replaced more than OUTDATED_GRACE_SECONDS ago. Call with the
+    month's lock held.
+    """
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(pdf))
+
+    directory, filename = posixpath.split(name)
+    prefix = posixpath.basename(_month_prefix(name))
+    _, filenames = default_storage.listdir(directory)
+    versions = []
+    for version in filenames:
+        if version.startswith(prefix):
+            try:
+                versions.append((default_storage.get_modified_time(posixpath.join(directory, version)), version))
+            except FileNotFoundError:
+                # Removed by another process meanwhile
+                continue
+
+    # Each version was replaced when the next one was written
+    versions.sort()
+    outdated_before = timezone.now() - timedelta(seconds=OUTDATED_GRACE_SECONDS)
+    for (_, version), (replaced_at, _) in zip(versions, versions[1:]):
+        if version != filename and replaced_at < outdated_before:
+            default_storage.delete(posixpath.join(directory, version))
+
+
+def _render_job(name, statement):
+    return name, render_pdf(statement)
+
+
+def _init_worker():
+    # Under spawn the worker starts without Django configured
+    import django
+
+    django.setup()
+    get_statement_template()
+
+
+def generate_statements(year, month, partner_ids=None, workers=None):
+    """
+    Build the month's statements and store the ones that changed. Returns
+    (rendered, skipped) counts. ``workers=1`` renders in this process.
+    """
+    statements = collect_statements(year, month, partner_ids)
+
+    jobs = []
+    skipped = 0
+    for statement in statements.values():
+        name = statement_name(statement)
+        if default_storage.exists(name):
+            skipped += 1
+        else:
+            jobs.append((name, statement))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        for name, statement in jobs:
+            with _month_lock(name):
+                _save(name, render_pdf(statement))
+        return len(jobs), skipped
+
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+    rendered = 0
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_worker) as pool:
+        futures = [pool.submit(_render_job, name, statement) for name, statement in jobs]
+        for future in as_completed(futures):
+            try:
+                name, pdf = future.result()
+            except Exception:
+                logger.exception("Error rendering a partner statement")
+                continue
+            with _month_lock(name):
+                _save(name, pdf)
+            rendered += 1
+    return rendered, skipped
+
+
+def statement_for_partner(partner_id, year, month):
+    """
+    Return the storage name of a partner's up to date statement, rendering
+    it first if the month changed. None when the month has no activity.
+    """
+    statement = collect_statements(year, month, [partner_id]).get(partner_id)
+    if statement is None:
+        return None
+    name = statement_name(statement)
+    if not default_storage.exists(name):
+        with _month_lock(name):
+            # A concurrent request may have rendered it while we waited
+            if not default_storage.exists(name):
+                _save(name, render_pdf(statement))
+    return name
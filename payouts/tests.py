@@ -1,3 +1,336 @@
-from django.test import TestCase
+import csv
+from datetime import date, timedelta
+from decimal import Decimal
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from partner.models import PartnerProfile, Testimonial
+from partner.serializers import PartnerProfileSerializer
+from referrals_management.models import Referral
+
+from . import statements
+from .models import Earnings, Payout, PayoutReferral
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+User = get_user_model()
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class EarningsExportTest(TestCase):
+    url = '/api/payouts/earnings/export/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+        partner = PartnerProfile.objects.create(
+            user=self.user, name='Partner', email='profile@example.com',
+            phone='000', role='Consultant'
+        )
+        other_user = User.objects.create_user(email='other@example.com', password='pass')
+        other = PartnerProfile.objects.create(
+            user=other_user, name='Other', email='other-profile@example.com',
+            phone='000', role='Consultant'
+        )
+        for amount in ['5.00', '15.00', '25.00']:
+            Earnings.objects.create(partner=partner, amount=Decimal(amount), date=date(2024, 1, 10))
+        Earnings.objects.create(partner=other, amount=Decimal('15.00'), date=date(2024, 1, 10))
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.DictReader(content.splitlines()))
+
+    def test_export_applies_list_filters_and_scoping(self):
+        rows = self.export({'min_amount': '10', 'end_date': '2024-01-31', 'ordering': '-amount'})
+        self.assertEqual([row['Amount'] for row in rows], ['25.00', '15.00'])
+        self.assertEqual({row['Partner'] for row in rows}, {'Partner'})
+        self.assertEqual(rows[0]['Date'], '2024-01-10')
+
+
+def fake_pdf(statement):
+    return f"%PDF {statement['partner']['name']} {statement['total_earned']}".encode()
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], MEDIA_ROOT=MEDIA_ROOT)
+@mock.patch('payouts.statements.render_pdf', side_effect=fake_pdf)
+class StatementTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        shutil.rmtree(os.path.join(MEDIA_ROOT, 'statements'), ignore_errors=True)
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.partner = PartnerProfile.objects.create(
+            user=self.user, name='Partner', email='profile@example.com',
+            phone='000', role='Consultant'
+        )
+        Earnings.objects.create(partner=self.partner, amount=Decimal('15.00'), date=date(2024, 1, 10))
+        Earnings.objects.create(partner=self.partner, amount=Decimal('25.00'), date=date(2024, 2, 1))
+        Payout.objects.create(partner=self.partner, amount=Decimal('15.00'), payment_method='bank')
+
+    def test_statement_data(self, render):
+        statement = statements.collect_statements(2024, 1)[self.partner.pk]
+        self.assertEqual(statement['period'], '2024-01')
+        self.assertEqual([row['amount'] for row in statement['earnings']], ['15.00'])
+        self.assertEqual(statement['payouts'], [])
+        self.assertEqual(statement['total_earned'], '15.00')
+
+    def test_cancelled_and_rejected_earnings_are_not_earned(self, render):
+        for earning_status in (Earnings.Status.CANCELLED, Earnings.Status.REJECTED):
+            Earnings.objects.create(
+                partner=self.partner, amount=Decimal('40.00'), date=date(2024, 1, 12),
+                source=Earnings.Source.BONUS, status=earning_status,
+            )
+        statement = statements.collect_statements(2024, 1)[self.partner.pk]
+        self.assertEqual(len(statement['earnings']), 3)
+        self.assertEqual(statement['total_earned'], '15.00')
+
+    def stored_statements(self):
+        _, filenames = default_storage.listdir(os.path.join('statements', str(self.partner.pk)))
+        return sorted(filenames)
+
+    @mock.patch('payouts.statements.OUTDATED_GRACE_SECONDS', 0)
+    def test_unchanged_months_are_skipped(self, render):
+        self.assertEqual(statements.generate_statements(2024, 1, workers=1), (1, 0))
+        self.assertEqual(statements.generate_statements(2024, 1, workers=1), (0, 1))
+        self.assertEqual(render.call_count, 1)
+
+        Earnings.objects.create(partner=self.partner, amount=Decimal('5.00'), date=date(2024, 1, 20))
+        self.assertEqual(statements.generate_statements(2024, 1, workers=1), (1, 0))
+
+        # The outdated version of the month is replaced
+        filenames = self.stored_statements()
+        self.assertEqual(len(filenames), 1)
+        with default_storage.open(os.path.join('statements', str(self.partner.pk), filenames[0])) as pdf:
+            self.assertEqual(pdf.read(), b'%PDF Partner 20.00')
+
+    def test_replaced_versions_outlive_the_grace_period(self, render):
+        first = statements.statement_for_partner(self.partner.pk, 2024, 1)
+        Earnings.objects.create(partner=self.partner, amount=Decimal('5.00'), date=date(2024, 1, 20))
+        second = statements.statement_for_partner(self.partner.pk, 2024, 1)
+
+        # A response may still be serving the first version
+        self.assertEqual(self.stored_statements(), sorted([os.path.basename(first), os.path.basename(second)]))
+
+        long_ago = time.time() - statements.OUTDATED_GRACE_SECONDS - 60
+        for name in (first, second):
+            os.utime(default_storage.path(name), (long_ago, long_ago))
+        Earnings.objects.create(partner=self.partner, amount=Decimal('1.00'), date=date(2024, 1, 21))
+        third = statements.statement_for_partner(self.partner.pk, 2024, 1)
+
+        # The first was replaced long ago; the second only just now
+        self.assertEqual(self.stored_statements(), sorted([os.path.basename(second), os.path.basename(third)]))
+
+    def test_concurrent_requests_render_a_month_once(self, render):
+        statement = statements.collect_statements(2024, 1)[self.partner.pk]
+        name = statements.statement_name(statement)
+        rendering, release = threading.Event(), threading.Event()
+
+        def render_slowly(statement):
+            rendering.set()
+            release.wait(5)
+            return fake_pdf(statement)
+
+        render.side_effect = render_slowly
+        results = []
+
+        def request():
+            results.append(statements.statement_for_partner(self.partner.pk, 2024, 1))
+
+        # The threads only touch the cache and storage
+        with mock.patch('payouts.statements.collect_statements', return_value={self.partner.pk: statement}):
+            first = threading.Thread(target=request)
+            first.start()
+            rendering.wait(5)
+            second = threading.Thread(target=request)
+            second.start()
+            time.sleep(0.2)
+            release.set()
+            first.join(5)
+            second.join(5)
+
+        self.assertEqual(results, [name, name])
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(self.stored_statements(), [os.path.basename(name)])
+
+    @skipUnless(multiprocessing.get_start_method() == 'fork', "Workers inherit the mocked renderer only when forked")
+    def test_process_pool_renders_each_partner(self, render):
+        other_user = User.objects.create_user(email='other@example.com', password='pass')
+        other = PartnerProfile.objects.create(
+            user=other_user, name='Other', email='other-profile@example.com',
+            phone='000', role='Consultant'
+        )
+        Earnings.objects.create(partner=other, amount=Decimal('7.00'), date=date(2024, 1, 5))
+
+        self.assertEqual(statements.generate_statements(2024, 1, workers=2), (2, 0))
+        # Rendered in the workers, not here
+        render.assert_not_called()
+
+        for partner, expected in ((self.partner, b'%PDF Partner 15.00'), (other, b'%PDF Other 7.00')):
+            directory = os.path.join('statements', str(partner.pk))
+            _, filenames = default_storage.listdir(directory)
+            self.assertEqual(len(filenames), 1)
+            with default_storage.open(os.path.join(directory, filenames[0])) as pdf:
+                self.assertEqual(pdf.read(), expected)
+
+    def test_statement_api(self, render):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get('/api/payouts/statements/')
+        this_month = timezone.localdate().strftime('%Y-%m')
+        self.assertEqual(
+            [row['month'] for row in response.data], sorted({this_month, '2024-02', '2024-01'}, reverse=True)
+        )
+
+        response = client.get('/api/payouts/statements/2024-01/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF Partner 15.00')
+
+        response = client.get('/api/payouts/statements/2023-01/')
+        self.assertEqual(response.status_code, 404)
+        for month in ('0000-01', '9999-12', '2024-13'):
+            response = client.get(f'/api/payouts/statements/{month}/')
+            self.assertEqual(response.status_code, 404)
+
+    def test_staff_partner_id_is_validated(self, render):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser(email='admin@example.com', password='pass'))
+
+        for url in ('/api/payouts/statements/', '/api/payouts/statements/2024-01/'):
+            response = client.get(url, {'partner_id': 'abc'})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('partner_id', response.data)
+            response = client.get(url, {'partner_id': self.partner.pk + 100})
+            self.assertEqual(response.status_code, 404)
+            response = client.get(url, {'partner_id': self.partner.pk})
+            self.assertEqual(response.status_code, 200)
+
+
+class PayoutSettlementTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.partner = PartnerProfile.objects.create(
+            user=self.user, name='Partner', email='profile@example.com',
+            phone='000', role='Consultant'
+        )
+        other_user = User.objects.create_user(email='other@example.com', password='pass')
+        self.other = PartnerProfile.objects.create(
+            user=other_user, name='Other', email='other-profile@example.com',
+            phone='000', role='Consultant'
+        )
+
+    def earning(self, partner=None, status=Earnings.Status.AVAILABLE, **kwargs):
+        # Bonus earnings keep the status they are created with
+        return Earnings.objects.create(
+            partner=partner or self.partner, amount=Decimal('10.00'), date=date(2024, 1, 10),
+            source=Earnings.Source.BONUS, status=status, **kwargs
+        )
+
+    def test_completion_pays_linked_and_unlinked_earnings(self):
+        # Requesting the payout moves available earnings to processing
+        unlinked = self.earning()
+        payout = Payout.objects.create(partner=self.partner, amount=Decimal('40.00'), payment_method='bank')
+        unlinked.refresh_from_db()
+        self.assertEqual(unlinked.status, Earnings.Status.PROCESSING)
+
+        direct = self.earning(payout=payout)
+        referral = Referral.objects.create(
+            user=self.user, client_name='Client', client_email='c@example.com', client_phone='000'
+        )
+        through_referral = self.earning(referral=referral)
+        PayoutReferral.objects.create(payout=payout, referral=referral, amount=Decimal('10.00'))
+        pending = self.earning(status=Earnings.Status.PENDING_APPROVAL)
+        other = self.earning(partner=self.other)
+
+        payout = Payout.objects.get(pk=payout.pk)
+        payout.complete(transaction_id='TX-1')
+
+        self.assertEqual(payout.settled_earnings, {'linked': 2, 'unlinked': 1, 'total': 3})
+        for earning in (direct, through_referral, unlinked):
+            earning.refresh_from_db()
+            self.assertEqual(earning.status, Earnings.Status.PAID)
+            self.assertEqual(earning.payout_id, payout.pk)
+            self.assertIsNotNone(earning.paid_date)
+        for earning in (pending, other):
+            earning.refresh_from_db()
+            self.assertNotEqual(earning.status, Earnings.Status.PAID)
+            self.assertIsNone(earning.payout_id)
+
+    def test_later_saves_do_not_settle_again(self):
+        payout = Payout.objects.create(partner=self.partner, amount=Decimal('10.00'), payment_method='bank')
+        payout = Payout.objects.get(pk=payout.pk)
+        payout.complete()
+
+        later = self.earning()
+        payout.note = 'Sent'
+        payout.save()
+        later.refresh_from_db()
+        self.assertEqual(later.status, Earnings.Status.AVAILABLE)
+
+    def test_failed_save_leaves_earnings_unchanged(self):
+        payout = Payout.objects.create(partner=self.partner, amount=Decimal('10.00'), payment_method='bank')
+        earning = self.earning(payout=payout)
+        payout = Payout.objects.get(pk=payout.pk)
+
+        # A plain save, as the admin and the update serializer do
+        payout.status = Payout.Status.COMPLETED
+        with mock.patch('payouts.models.PayoutTimeline.objects.create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                payout.save()
+
+        earning.refresh_from_db()
+        self.assertEqual(earning.status, Earnings.Status.AVAILABLE)
+        self.assertEqual(Payout.objects.get(pk=payout.pk).status, Payout.Status.PENDING)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class PayoutDetailTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.partner = PartnerProfile.objects.create(
+            user=self.user, name='Partner', email='profile@example.com',
+            phone='000', role='Consultant'
+        )
+        self.partner.testimonials.add(
+            Testimonial.objects.create(author='A', content='Great', status=Testimonial.Status.APPROVED),
+            Testimonial.objects.create(author='B', content='Pending', status=Testimonial.Status.PENDING),
+        )
+        self.payout = Payout.objects.create(partner=self.partner, amount=Decimal('10.00'), payment_method='bank')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_partner_details_show_only_approved_testimonials(self):
+        response = self.client.get(f'/api/payouts/payouts/{self.payout.pk}/')
+        self.assertEqual(response.status_code, 200)
+        details = response.data['partner_details']
+        self.assertEqual([t['author'] for t in details['text_testimonials']], ['A'])
+
+    def test_testimonial_buckets_filter_with_or_without_a_prefetch(self):
+        plain = PartnerProfile.objects.get(pk=self.partner.pk)
+        prefetched = PartnerProfile.objects.prefetch_related('testimonials').get(pk=self.partner.pk)
+        for partner in (plain, prefetched):
+            data = PartnerProfileSerializer(partner).data
+            self.assertEqual([t['author'] for t in data['text_testimonials']], ['A'])
@@ -1,13 +1,16 @@
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from affiliateos import files
+from affiliateos.export import ExportMixin
+from affiliateos.pagination import OptionalKeysetPagination
+from authentication.roles import get_roles
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Count, Sum, Q, F, Case, When, IntegerField, DecimalField
 from django.db.models.functions import TruncMonth, TruncWeek, TruncDay
 from django.utils import timezone
 
-from partner.models import PartnerProfile
+from partner.models import PartnerProfile, EarningsDailyRollup, PayoutDailyRollup
 from .models import Payout, PayoutSetting, Earnings
 from datetime import datetime
 from rest_framework import serializers
@@ -23,11 +26,14 @@ from .serializers import (
 
 )
 from django.db.transaction import atomic
+from rest_framework.exceptions import NotFound
+from . import statements
 from .services import PaymentProcessor
 import logging
 
 logger = logging.getLogger(__name__)
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(OptionalKeysetPagination):
+    """Page numbers by default; ?pagination=keyset for keyset pages"""
     page_size = 25
     page_size_query_param = 'page_size'
     max_page_size = 100
@@ -46,14 +52,26 @@ from django_filters.rest_framework import DjangoFilterBackend
 
 logger = logging.getLogger(__name__)
 
-class PayoutViewSet(viewsets.ModelViewSet):
+class PayoutViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Payout.objects.all()
+    keyset_ordering_field = 'request_date'
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['status', 'payment_method']
     search_fields = ['id', 'partner__name', 'note', 'client_notes']
     ordering_fields = ['request_date', 'processed_date', 'amount']
+    export_filename = 'payouts'
+    export_fields = [
+        ('ID', 'id'),
+        ('Requested', 'request_date'),
+        ('Processed', 'processed_date'),
+        ('Partner', 'partner__name'),
+        ('Amount', 'amount'),
+        ('Payment method', 'payment_method'),
+        ('Status', 'status'),
+        ('Transaction ID', 'transaction_id'),
+    ]
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -64,11 +82,11 @@ class PayoutViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        user = self.request.user
+        roles = get_roles(self.request)
 
-        if not user.is_staff:
+        if not roles.is_staff:
             # Non-admins only see their own payouts
-            return queryset.filter(partner__user=user)
+            return queryset.filter(partner_id=roles.partner_profile_id)
 
         # Admins: optionally filter by partner_id
         partner_id = self.request.query_params.get('partner_id')
@@ -235,46 +253,67 @@ class PayoutViewSet(viewsets.ModelViewSet):
         
         return Response(summary_data)
 
+    def get_rollup_queryset(self):
+        """Daily payout rollups scoped the same way as get_queryset"""
+        queryset = PayoutDailyRollup.objects.all()
+        roles = get_roles(self.request)
+
+        if not roles.is_staff:
+            return queryset.filter(partner_id=roles.partner_profile_id)
+
+        partner_id = self.request.query_params.get('partner_id')
+        if partner_id:
+            queryset = queryset.filter(partner__id=partner_id)
+
+        return queryset
+
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        """Get detailed statistics for payouts"""
-        queryset = self.get_queryset()
+        """Get detailed statistics for payouts, read from the daily rollup"""
+        queryset = self.get_rollup_queryset()
         time_frame = request.query_params.get('time_frame', 'monthly')
         
         if time_frame == 'monthly':
-            truncate_func = TruncMonth('request_date')
+            truncate_func = TruncMonth('date')
         elif time_frame == 'weekly':
-            truncate_func = TruncWeek('request_date')
+            truncate_func = TruncWeek('date')
         else:  # default to daily
-            truncate_func = TruncDay('request_date')
+            truncate_func = TruncDay('date')
         
         # Get payment method distribution
         payment_methods = queryset.values('payment_method').annotate(
-            count=Count('id'),
+            count=Sum('count'),
             total_amount=Sum('amount')
         ).order_by('-count')
         
         # Get timeline data
         timeline_data = queryset.annotate(
-            date=truncate_func
-        ).values('date').annotate(
-            count=Count('id'),
+            period=truncate_func
+        ).values('period').annotate(
+            count=Sum('count'),
             total_amount=Sum('amount')
-        ).order_by('date')
+        ).order_by('period')
         
         # Get status distribution
         status_data = queryset.values('status').annotate(
-            count=Count('id'),
+            count=Sum('count'),
             total_amount=Sum('amount')
-        )
+        ).order_by()
+        
+        totals = queryset.aggregate(count=Sum('count'), amount=Sum('amount'))
+        total_payouts = totals['count'] or 0
+        total_amount = totals['amount'] or 0
         
         stats = {
-            'total_payouts': queryset.count(),
-            'total_amount': queryset.aggregate(total=Sum('amount'))['total'] or 0,
-            'average_amount': queryset.aggregate(avg=Sum('amount') / Count('id'))['avg'] if queryset.count() > 0 else 0,
+            'total_payouts': total_payouts,
+            'total_amount': total_amount,
+            'average_amount': total_amount / total_payouts if total_payouts > 0 else 0,
             'by_status': status_data,
             'by_payment_method': payment_methods,
-            'timeline': timeline_data
+            'timeline': [
+                {'date': item['period'], 'count': item['count'], 'total_amount': item['total_amount']}
+                for item in timeline_data
+            ]
         }
         
         return Response(stats)
@@ -285,8 +324,9 @@ class PayoutViewSet(viewsets.ModelViewSet):
         queryset = self.get_queryset()
         
         # For non-staff users, restrict to their own payouts
-        if not self.request.user.is_staff:
-            queryset = queryset.filter(partner__user=self.request.user)
+        roles = get_roles(self.request)
+        if not roles.is_staff:
+            queryset = queryset.filter(partner_id=roles.partner_profile_id)
         
         # Get partner filter if provided
         partner_id = self.request.query_params.get('partner_id')
@@ -393,9 +433,10 @@ class PayoutSettingViewSet(viewsets.ModelViewSet):
         queryset = super().get_queryset()
         
         # For non-staff users, only show their own settings
-        if not self.request.user.is_staff:
-            logger.debug(f"User is not staff. Filtering by partner {self.request.user.partner_profile}.")
-            queryset = queryset.filter(partner__user=self.request.user)
+        roles = get_roles(self.request)
+        if not roles.is_staff:
+            logger.debug(f"User is not staff. Filtering by partner {roles.partner_profile_id}.")
+            queryset = queryset.filter(partner_id=roles.partner_profile_id)
         
         return queryset
         
@@ -658,14 +699,27 @@ class PayoutSettingViewSet(viewsets.ModelViewSet):
         return {k: v.strip() if isinstance(v, str) else v for k, v in details.items()}
 
 
-class EarningsViewSet(viewsets.ModelViewSet):
+class EarningsViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Earnings.objects.all()
+    keyset_ordering_field = 'date'
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['status', 'source', 'partner']
     search_fields = ['partner__name', 'notes']
     ordering_fields = ['date', 'amount', 'created_at']
+    export_filename = 'earnings'
+    export_fields = [
+        ('ID', 'id'),
+        ('Date', 'date'),
+        ('Partner', 'partner__name'),
+        ('Amount', 'amount'),
+        ('Source', 'source'),
+        ('Status', 'status'),
+        ('Referral', 'referral_id'),
+        ('Payout', 'payout_id'),
+        ('Paid', 'paid_date'),
+    ]
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -678,8 +732,9 @@ class EarningsViewSet(viewsets.ModelViewSet):
         queryset = super().get_queryset()
 
         # For non-staff users, only show their own earnings
-        if not self.request.user.is_staff:
-            queryset = queryset.filter(partner__user=self.request.user)
+        roles = get_roles(self.request)
+        if not roles.is_staff:
+            queryset = queryset.filter(partner_id=roles.partner_profile_id)
 
         # Filter by date range
         start_date = self.request.query_params.get('start_date')
@@ -879,6 +934,39 @@ class EarningsViewSet(viewsets.ModelViewSet):
         
         return Response(summary_data)
 
+    def get_rollup_queryset(self):
+        """
+        Daily earnings rollups scoped and date-filtered the same way as get_queryset.
+        Returns None when row-level filters (amount range, payout status) are
+        requested, since those cannot be answered from the rollup.
+        """
+        params = self.request.query_params
+        if any(params.get(key) for key in ['min_amount', 'max_amount', 'payout_status']):
+            return None
+
+        queryset = EarningsDailyRollup.objects.all()
+
+        roles = get_roles(self.request)
+        if not roles.is_staff:
+            queryset = queryset.filter(partner_id=roles.partner_profile_id)
+
+        start_date = params.get('start_date')
+        end_date = params.get('end_date')
+
+        if start_date:
+            try:
+                queryset = queryset.filter(date__gte=datetime.fromisoformat(start_date))
+            except ValueError:
+                pass
+
+        if end_date:
+            try:
+                queryset = queryset.filter(date__lte=datetime.fromisoformat(end_date))
+            except ValueError:
+                pass
+
+        return queryset
+
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get monthly/weekly stats for earnings"""
@@ -891,6 +979,18 @@ class EarningsViewSet(viewsets.ModelViewSet):
         else:  # default to daily
             truncate_func = TruncDay('date')
         
+        rollups = self.get_rollup_queryset()
+        if rollups is not None:
+            stats = rollups.annotate(
+                period=truncate_func
+            ).values('period').annotate(
+                total_count=Sum('count'),
+                total_amount=Sum('amount'),
+                paid_count=Sum('count', filter=Q(status=Earnings.Status.PAID), default=0),
+                paid_amount=Sum('amount', filter=Q(status=Earnings.Status.PAID), default=0)
+            ).order_by('period')
+            return Response(list(stats))
+        
         stats = self.get_queryset().annotate(
             period=truncate_func
         ).values('period').annotate(
@@ -907,4 +1007,59 @@ class EarningsViewSet(viewsets.ModelViewSet):
             ))
         ).order_by('period')
         
-        return Response(list(stats))
\ No newline at end of file
+        return Response(list(stats))
+
+
+class StatementViewSet(viewsets.ViewSet):
+    """
+    Monthly PDF statements. list returns the months with activity;
+    retrieve (/statements/YYYY-MM/) serves the month's PDF, rendering it
+    first when the month's numbers changed. Staff pass ?partner_id=.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_value_regex = r'\d{4}-\d{2}'
+
+    def get_partner_id(self, request):
+        roles = get_roles(request)
+        if roles.is_staff and request.query_params.get('partner_id'):
+            try:
+                partner_id = int(request.query_params['partner_id'])
+            except ValueError:
+                raise serializers.ValidationError({'partner_id': 'A valid integer is required.'})
+            if not PartnerProfile.objects.filter(pk=partner_id).exists():
+                raise NotFound("Partner not found")
+            return partner_id
+        if roles.partner_profile_id is None:
+            raise NotFound("No partner profile")
+        return roles.partner_profile_id
+
+    def list(self, request):
+        partner_id = self.get_partner_id(request)
+        months = set(Earnings.objects.filter(partner_id=partner_id).dates('date', 'month'))
+        months.update(
+            timezone.localtime(month).date()
+            for month in Payout.objects.filter(partner_id=partner_id).datetimes('request_date', 'month')
+        )
+        return Response([
+            {'month': statements.period_label(month.year, month.month)}
+            for month in sorted(months, reverse=True)
+        ])
+
+    def retrieve(self, request, pk=None):
+        partner_id = self.get_partner_id(request)
+        year, month = (int(part) for part in pk.split('-'))
+        if not 1 <= month <= 12 or not statements.MIN_YEAR <= year <= statements.MAX_YEAR:
+            raise NotFound("Unknown month")
+
+        try:
+            name = statements.statement_for_partner(partner_id, year, month)
+        except ImportError:
+            logger.error("WeasyPrint is not installed, can't render statements")
+            return Response({'error': 'Statements are not available'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if name is None:
+            raise NotFound("No activity in this month")
+
+        return files.serve(
+            request, files.StoredFile(name), f'statement-{pk}.pdf',
+            content_type='application/pdf', as_attachment=False
+        )
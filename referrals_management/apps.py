@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ReferralsManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'referrals_management'
+
+    def ready(self):
+        from affiliateos import search
+
+        search.register(self.get_model('Referral'))
@@ -2,28 +2,65 @@
 import django_filters
 from .models import Referral
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+
+
+def start_of_day(day):
+    """Aware datetime at midnight, so date windows compare the raw indexed column"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
 
 class ReferralFilter(django_filters.FilterSet):
-    status = django_filters.CharFilter(field_name='status')
-    product = django_filters.CharFilter(field_name='product_name')
+    """
+    Every referral list filter in one place. ``all`` means "no filter" for
+    status, product and date, as the frontend sends it for its defaults.
+    Date windows are half-open ranges on date_submitted rather than
+    __date/__month lookups, so they can use the (date_submitted, id) index.
+    """
+    status = django_filters.CharFilter(method='filter_unless_all')
+    product = django_filters.CharFilter(method='filter_by_product')
+    product_name = django_filters.CharFilter(field_name='product_name')
+    user = django_filters.NumberFilter(field_name='user_id')
+    referral_code = django_filters.CharFilter(field_name='referral_code')
+    partner_id = django_filters.NumberFilter(field_name='partner_id')
     date = django_filters.CharFilter(method='filter_by_date')
-    
+    submitted = django_filters.DateFromToRangeFilter(field_name='date_submitted')
+    min_commission = django_filters.NumberFilter(field_name='potential_commission', lookup_expr='gte')
+    max_commission = django_filters.NumberFilter(field_name='potential_commission', lookup_expr='lte')
+
     class Meta:
         model = Referral
-        fields = ['status', 'product']
-    
+        fields = [
+            'status', 'product', 'product_name', 'user', 'referral_code', 'partner_id',
+            'date', 'submitted', 'min_commission', 'max_commission',
+        ]
+
+    def filter_unless_all(self, queryset, name, value):
+        if value == 'all':
+            return queryset
+        return queryset.filter(**{name: value})
+
+    def filter_by_product(self, queryset, name, value):
+        if value == 'all':
+            return queryset
+        if not value.isdigit():
+            return queryset.none()
+        return queryset.filter(product_id=value)
+
     def filter_by_date(self, queryset, name, value):
-        today = timezone.now().date()
-        
+        today = timezone.localdate()
+
         if value == 'today':
-            return queryset.filter(date_submitted__date=today)
+            return queryset.filter(
+                date_submitted__gte=start_of_day(today),
+                date_submitted__lt=start_of_day(today + timedelta(days=1)),
+            )
         elif value == 'thisWeek':
             start_of_week = today - timedelta(days=today.weekday())
-            return queryset.filter(date_submitted__date__gte=start_of_week)
+            return queryset.filter(date_submitted__gte=start_of_day(start_of_week))
         elif value == 'thisMonth':
-            return queryset.filter(date_submitted__month=today.month, date_submitted__year=today.year)
+            return queryset.filter(date_submitted__gte=start_of_day(today.replace(day=1)))
         elif value == 'last3Months':
             three_months_ago = today - timedelta(days=90)
-            return queryset.filter(date_submitted__date__gte=three_months_ago)
-        return queryset
\ No newline at end of file
+            return queryset.filter(date_submitted__gte=start_of_day(three_months_ago))
+        return queryset
@@ -0,0 +1,330 @@
+# referrals/importer.py
+from decimal import Decimal
+import csv
+import io
+import itertools
+import json
+import logging
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+
+from affiliateos import search
+from partner.commission import commission_for_product
+from partner.models import parse_decimal
+
+from .models import Referral, ReferralTimeline
+
+logger = logging.getLogger(__name__)
+
+# Only the first errors are reported back so a bad file can't blow up the response
+MAX_REPORTED_ERRORS = 100
+
+TIMELINE_CHOICES = set(Referral.TIMELINE_OFFSETS)
+STATUS_CHOICES = set(Referral.Status.values)
+COMMISSION_FIELD = Referral._meta.get_field('potential_commission')
+# Row columns stored in length-limited CharFields
+TEXT_MAX_LENGTHS = {
+    name: Referral._meta.get_field(name).max_length
+    for name in ('client_name', 'client_email', 'client_phone', 'company', 'budget_range')
+}
+
+
+def iter_rows(stream, file_format):
+    """
+    Yield one dict per row from a binary or text stream.
+    CSV needs a header row; JSON may be a list of objects or JSON Lines.
+    """
+    if isinstance(stream, (bytes, str)):
+        stream = io.BytesIO(stream) if isinstance(stream, bytes) else io.StringIO(stream)
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig')
+
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+
+    first_line = stream.readline()
+    if first_line.lstrip().startswith('['):
+        # A JSON array has to be parsed as a whole
+        rows = json.loads(first_line + stream.read())
+        yield from rows
+        return
+
+    # JSON Lines: one object per line
+    for line in itertools.chain([first_line], stream):
+        if line.strip():
+            yield json.loads(line)
+
+
+class ImportParseError(Exception):
+    """
+    The file stopped parsing partway. Chunks before ``row`` are already
+    committed; ``summary`` says how many.
+    """
+
+    def __init__(self, message, row, summary):
+        super().__init__(message)
+        self.row = row
+        self.summary = summary
+
+
+class ReferralImporter:
+    """
+    Validate and insert referrals in chunks with bulk_create.
+
+    Rows are validated as they are read. Products are loaded once, and
+    partners (staff imports may name one per row by referral code) are
+    resolved once per chunk. The work Referral.save does per row
+    (commission, expected date, earnings for converted referrals) is
+    applied in bulk instead, and an import entry is written to each
+    referral's timeline.
+    """
+
+    def __init__(self, user, chunk_size=1000, allow_partner_column=None):
+        from partner.models import Product
+
+        self.user = user
+        self.chunk_size = chunk_size
+        self.allow_partner_column = (
+            user.is_staff if allow_partner_column is None else allow_partner_column
+        )
+        self.default_partner = getattr(user, 'partner_profile', None)
+        self.now = timezone.now()
+
+        self.products_by_id = {}
+        self.products_by_name = {}
+        for product in Product.objects.only('id', 'name', 'commission_rate', 'price_amount'):
+            self.products_by_id[str(product.id)] = product
+            self.products_by_name[product.name.strip().lower()] = product
+
+        self.partners_by_code = {}
+        self.referral_keys = set()
+        self.earnings_keys = set()
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, rows):
+        """
+        Import an iterable of row dicts and return a summary. Each chunk
+        commits on its own; if the rows stop parsing partway, the chunks
+        already committed are kept and ImportParseError reports them.
+        """
+        rows = iter(rows)
+        chunk = []
+        line_number = 0
+        try:
+            while True:
+                line_number += 1
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    break
+                except (ValueError, csv.Error) as e:
+                    raise ImportParseError(str(e), line_number, self.summary()) from e
+
+                referral, errors = self.build_referral(row)
+                if errors:
+                    self.add_error(line_number, errors)
+                    continue
+                chunk.append((line_number, referral))
+                if len(chunk) >= self.chunk_size:
+                    self.flush(chunk)
+                    chunk = []
+            if chunk:
+                self.flush(chunk)
+        finally:
+            # Committed chunks count even when a later one fails
+            self.refresh_aggregates()
+
+        return self.summary()
+
+    def summary(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+    def refresh_aggregates(self):
+        """Refresh the rollup slices and dashboard cache touched by the import"""
+        from partner import dashboard_cache, rollups
+
+        if not self.created:
+            return
+        rollups.schedule_refresh(rollups.refresh_referral_rollup, self.referral_keys)
+        rollups.schedule_refresh(rollups.refresh_earnings_rollup, self.earnings_keys)
+        dashboard_cache.invalidate()
+
+    def add_error(self, line_number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line_number, 'errors': errors})
+
+    def build_referral(self, row):
+        """Return an unsaved Referral for a row, or the row's field errors"""
+        if not isinstance(row, dict):
+            return None, {'row': 'Expected an object with referral fields'}
+
+        errors = {}
+
+        def text(name, required=False):
+            """
+            A row value as stripped text, checked against the column's
+            max_length. Numbers are accepted as text; other types are errors.
+            """
+            raw = row.get(name)
+            if isinstance(raw, (int, float, Decimal)) and not isinstance(raw, bool):
+                raw = str(raw)
+            if raw is not None and not isinstance(raw, str):
+                errors[name] = 'Not a valid string.'
+                return None
+            raw = raw.strip() if raw else ''
+            if not raw:
+                if required:
+                    errors[name] = 'This field is required.'
+                return None
+            max_length = TEXT_MAX_LENGTHS.get(name)
+            if max_length and len(raw) > max_length:
+                errors[name] = f'Ensure this field has no more than {max_length} characters.'
+                return None
+            return raw
+
+        client_name = text('client_name', required=True)
+        client_email = text('client_email', required=True)
+        client_phone = text('client_phone', required=True)
+        company = text('company')
+        budget_range = text('budget_range')
+        notes = text('notes')
+
+        if client_email:
+            try:
+                validate_email(client_email)
+            except ValidationError:
+                errors['client_email'] = 'Enter a valid email address.'
+
+        timeline = text('timeline')
+        if timeline and timeline not in TIMELINE_CHOICES:
+            errors['timeline'] = f'"{timeline}" is not a valid choice.'
+
+        status = text('status') or Referral.Status.PENDING
+        if 'status' not in errors and status not in STATUS_CHOICES:
+            errors['status'] = f'"{status}" is not a valid choice.'
+
+        product = None
+        product_ref = text('product')
+        if product_ref:
+            product = (
+                self.products_by_id.get(product_ref)
+                or self.products_by_name.get(product_ref.lower())
+            )
+            if product is None:
+                errors['product'] = f'Unknown product "{product_ref}".'
+
+        potential_commission = None
+        if 'potential_commission' in row and text('potential_commission') is not None:
+            potential_commission = parse_decimal(row['potential_commission'], COMMISSION_FIELD)
+            if potential_commission is None:
+                errors['potential_commission'] = 'A valid number is required.'
+
+        partner_code = text('partner') if self.allow_partner_column else None
+
+        if errors:
+            return None, errors
+
+        referral = Referral(
+            user=self.user,
+            partner=self.default_partner,
+            client_name=client_name,
+            client_email=client_email,
+            client_phone=client_phone,
+            company=company,
+            product=product,
+            product_name=product.name if product else '',
+            timeline=timeline,
+            expected_implementation_date=Referral.expected_date_for(timeline, self.now),
+            status=status,
+            potential_commission=potential_commission or 0,
+            budget_range=budget_range,
+            notes=notes,
+            updated_by=self.user,
+        )
+        if not potential_commission and product:
+            referral.potential_commission = commission_for_product(product.id, product) or 0
+        if status == Referral.Status.CONVERTED:
+            referral.actual_commission = referral.potential_commission
+        referral._partner_code = partner_code
+        return referral, None
+
+    def resolve_partners(self, chunk):
+        """Look up the partners named in a chunk with a single query"""
+        from partner.models import PartnerProfile
+
+        codes = {
+            referral._partner_code for _, referral in chunk
+            if referral._partner_code and referral._partner_code not in self.partners_by_code
+        }
+        if codes:
+            for partner in PartnerProfile.objects.select_related('user').filter(referral_code__in=codes):
+                self.partners_by_code[partner.referral_code] = partner
+
+        resolved = []
+        for line_number, referral in chunk:
+            if referral._partner_code:
+                partner = self.partners_by_code.get(referral._partner_code)
+                if partner is None:
+                    self.add_error(line_number, {'partner': f'Unknown partner "{referral._partner_code}".'})
+                    continue
+                referral.partner = partner
+                referral.user = partner.user
+            if referral.partner:
+                referral.referral_code = referral.partner.referral_code
+            resolved.append(referral)
+        return resolved
+
+    def flush(self, chunk):
+        """Insert one chunk and apply its side effects in bulk"""
+        from payouts.models import Earnings
+        from partner import rollups
+
+        referrals = self.resolve_partners(chunk)
+        if not referrals:
+            return
+
+        with transaction.atomic():
+            referrals = Referral.objects.bulk_create(referrals)
+            search.index_objects(Referral, referrals, created=True)
+
+            ReferralTimeline.objects.bulk_create([
+                ReferralTimeline(
+                    referral=referral,
+                    status=referral.status,
+                    note='Imported via bulk upload',
+                    created_by=self.user,
+                )
+                for referral in referrals
+            ])
+
+            # Same earnings Referral.create_earning would add for converted referrals
+            earnings = Earnings.objects.bulk_create([
+                Earnings(
+                    partner=referral.partner,
+                    referral=referral,
+                    amount=referral.actual_commission,
+                    date=self.now.date(),
+                    source=Earnings.Source.REFERRAL,
+                    status=Earnings.Status.PENDING_APPROVAL,
+                )
+                for referral in referrals
+                if referral.status == Referral.Status.CONVERTED and referral.partner
+            ])
+
+        # bulk_create skips the save signals; the affected rollup slices are
+        # refreshed once at the end of the import
+        self.referral_keys.update(rollups.referral_rollup_key(referral) for referral in referrals)
+        self.earnings_keys.update(rollups.earnings_rollup_key(earning) for earning in earnings)
+        self.created += len(referrals)
+        logger.info(f"Imported {len(referrals)} referrals for user {self.user.pk}")
@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from referrals_management.importer import ImportParseError, ReferralImporter, iter_rows
+
+
+class Command(BaseCommand):
+    help = "Bulk import referrals from a CSV or JSON (array or JSON Lines) file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path to the file to import")
+        parser.add_argument(
+            '--user',
+            required=True,
+            help="Email of the user the referrals are submitted as"
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'json'],
+            help="File format, guessed from the extension when omitted"
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help="Number of referrals inserted per batch"
+        )
+        parser.add_argument(
+            '--partner-column',
+            action='store_true',
+            help="Assign each row to the partner named by its `partner` referral code"
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(email=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+
+        importer = ReferralImporter(
+            user,
+            chunk_size=options['chunk_size'],
+            allow_partner_column=bool(options['partner_column']),
+        )
+        try:
+            with open(path, 'rb') as stream:
+                summary = importer.run(iter_rows(stream, file_format))
+        except OSError as e:
+            raise CommandError(f"Could not read {path}: {str(e)}")
+        except ImportParseError as e:
+            self.write_errors(e.summary)
+            raise CommandError(
+                f"Could not parse {path} at row {e.row}: {str(e)}. "
+                f"{e.summary['created']} referrals were imported before it"
+            )
+
+        self.write_errors(summary)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['created']} referrals, {summary['failed']} rows failed"
+        ))
+
+    def write_errors(self, summary):
+        for error in summary['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
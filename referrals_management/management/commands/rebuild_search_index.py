@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from affiliateos import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for referrals, resources and support tickets"
+
+    def handle(self, *args, **options):
+        for model in search.registry:
+            count = search.rebuild_index(model)
+            if count is None:
+                self.stdout.write(f"{model._meta.label}: indexed by the database, nothing to rebuild")
+            else:
+                self.stdout.write(f"{model._meta.label}: {count} rows indexed")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
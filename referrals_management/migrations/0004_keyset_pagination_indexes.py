@@ -0,0 +1,21 @@
+# Generated by Django 4.2.17 on 2026-10-16 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals_management', '0003_alter_referral_referral_code'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='referral',
+            index=models.Index(fields=['date_submitted', 'id'], name='referrals_m_date_su_2a9876_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referral',
+            index=models.Index(fields=['user', 'date_submitted', 'id'], name='referrals_m_user_id_9a1f6e_idx'),
+        ),
+    ]
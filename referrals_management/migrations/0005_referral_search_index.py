@@ -0,0 +1,18 @@
+from django.db import migrations
+
+from affiliateos.search import create_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals_management', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        create_search_index(
+            'referrals_management', 'Referral',
+            ('client_name', 'client_email', 'client_phone', 'company', 'notes'),
+            index_name='referral_search_gin',
+        ),
+    ]
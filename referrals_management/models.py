@@ -5,6 +5,9 @@ from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from datetime import timedelta
 
+from affiliateos.mixins import TrackedFieldsMixin
+from partner.commission import commission_for_product
+
 
 class ReferralTimeline(models.Model):
     """Track status changes for referrals"""
@@ -30,7 +33,7 @@ class ReferralTimeline(models.Model):
     def __str__(self):
         return f"{self.referral.client_name} - {self.status} at {self.timestamp}"
 
-class Referral(models.Model):
+class Referral(TrackedFieldsMixin, models.Model):
     class Status(models.TextChoices):
         PENDING = 'pending', _('Pending')
         CONTACTED = 'contacted', _('Contacted')
@@ -116,6 +119,11 @@ class Referral(models.Model):
         related_name='updated_referrals'
     )
 
+    # Fields whose loaded values are kept to detect changes on save
+    tracked_fields = ('status', 'date_submitted', 'partner', 'product')
+    # Text columns behind ?search=, see affiliateos.search
+    search_index_fields = ('client_name', 'client_email', 'client_phone', 'company', 'notes')
+
     class Meta:
         ordering = ['-date_submitted']
         verbose_name = _("Referral")
@@ -126,11 +134,29 @@ class Referral(models.Model):
             models.Index(fields=['user', 'status']),
             models.Index(fields=['partner']),
             models.Index(fields=['product']),  # Added index for product FK
+            # Keyset pagination, all referrals and per user
+            models.Index(fields=['date_submitted', 'id']),
+            models.Index(fields=['user', 'date_submitted', 'id']),
         ]
 
     def __str__(self):
         return f"{self.client_name} ({self.client_email}) - {self.get_status_display()}"
 
+    TIMELINE_OFFSETS = {
+        'Immediate': timedelta(0),
+        '1-3 months': timedelta(weeks=4),
+        '3-6 months': timedelta(weeks=12),
+        '6+ months': timedelta(weeks=24),
+    }
+
+    @classmethod
+    def expected_date_for(cls, timeline, now=None):
+        """Expected implementation date for a timeline choice, or None"""
+        offset = cls.TIMELINE_OFFSETS.get(timeline)
+        if offset is None:
+            return None
+        return (now or timezone.now()) + offset
+
     def save(self, *args, **kwargs):
         # Set partner if not set and user has a partner_profile
         if not self.partner and hasattr(self.user, 'partner_profile'):
@@ -141,45 +167,25 @@ class Referral(models.Model):
             self.referral_code = self.partner.referral_code
 
         # Ensure product_name is synchronized with product FK
-        if self.product and not self.product_name:
+        if self.product_id and not self.product_name:
             self.product_name = self.product.name
         
         # Ensure potential_commission is set based on product if empty
-        if self.product and (self.potential_commission == 0 or self.potential_commission is None):
-            try:
-                # If commission is stored as a decimal/float value in string format
-                commission_value = float(self.product.commission.strip('%'))
-                # Calculate based on product price if available
-                if self.product.price:
-                    try:
-                        price = float(self.product.price)
-                        self.potential_commission = (commission_value / 100) * price
-                    except (ValueError, TypeError):
-                        # If price can't be converted to float, keep as is
-                        pass
-            except (ValueError, TypeError):
-                # If commission can't be parsed as a number, keep potential_commission as is
-                pass
+        if self.product_id and (self.potential_commission == 0 or self.potential_commission is None):
+            commission = commission_for_product(self.product_id)
+            if commission is not None:
+                self.potential_commission = commission
 
         # Set expected implementation date from timeline
         if isinstance(self.timeline, str):
-            now = timezone.now()
-            if self.timeline == "Immediate":
-                self.expected_implementation_date = now
-            elif self.timeline == "1-3 months":
-                self.expected_implementation_date = now + timedelta(weeks=4)
-            elif self.timeline == "3-6 months":
-                self.expected_implementation_date = now + timedelta(weeks=12)
-            elif self.timeline == "6+ months":
-                self.expected_implementation_date = now + timedelta(weeks=24)
+            expected_date = self.expected_date_for(self.timeline)
+            if expected_date:
+                self.expected_implementation_date = expected_date
 
         # Track status change
-        status_changed = False
-        if self.pk:
-            old_instance = Referral.objects.get(pk=self.pk)
-            if old_instance.status != self.status:
-                self.prev_status = old_instance.status
-                status_changed = True
+        status_changed = self.has_changed('status')
+        if status_changed:
+            self.prev_status = self.previous_value('status')
 
         # Set actual commission if status is converted
         if self.status == self.Status.CONVERTED and not self.actual_commission:
@@ -196,9 +202,12 @@ class Referral(models.Model):
                 created_by=self.updated_by if hasattr(self, 'updated_by') else None
             )
 
-        # Create earnings if applicable
-        if self.status == self.Status.CONVERTED:
-            self.create_earning()
+        # Create earnings if applicable, once the referral is committed. No
+        # idempotency key: the task skips referrals that already have an
+        # earning, and a referral whose partner is set later must still get one
+        if self.status == self.Status.CONVERTED and self.partner_id and not hasattr(self, 'earning'):
+            from .tasks import create_referral_earning
+            create_referral_earning.delay(self.pk)
 
     def create_earning(self):
         from payouts.models import Earnings
@@ -0,0 +1,13 @@
+# referrals/tasks.py
+from affiliateos.tasks import task
+
+from .models import Referral
+
+
+@task
+def create_referral_earning(referral_id):
+    """Create the earning for a converted referral, if it has none yet"""
+    referral = Referral.objects.select_related('partner').filter(pk=referral_id).first()
+    if referral is None or referral.status != Referral.Status.CONVERTED:
+        return
+    referral.create_earning()
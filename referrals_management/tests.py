@@ -1,3 +1,621 @@
-from django.test import TestCase
+import csv
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+import zipfile
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from affiliateos import search
+from partner import rollups
+from partner.models import PartnerProfile
+from partner.signals import _previous_key
+from payouts.models import Earnings
+
+from .importer import ImportParseError, ReferralImporter, iter_rows
+from .models import Referral, ReferralTimeline
+
+User = get_user_model()
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ReferralListFilterTest(TestCase):
+    url = '/api/referrals/partner/referrals/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        for i, commission in enumerate(['10.00', '20.00', '30.00', '40.00']):
+            Referral.objects.create(
+                user=self.user, client_name=f'Jane {i}', client_email=f'jane{i}@acme.com',
+                client_phone='000', potential_commission=Decimal(commission),
+                status='converted' if i == 3 else 'pending',
+            )
+        Referral.objects.create(
+            user=self.other, client_name='Jane Other', client_email='other@acme.com',
+            client_phone='000', potential_commission=Decimal('20.00'),
+        )
+
+    def get(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_filters_compose_into_one_query(self):
+        # Resolve and cache the user's roles first
+        self.get({})
+        response, queries = self.get({
+            'search': 'jane', 'status': 'pending', 'date': 'thisMonth',
+            'min_commission': '15', 'max_commission': '35', 'product': 'all',
+        })
+
+        # One COUNT for the paginator and one SELECT for the page
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            sorted(r['client_name'] for r in response.data['results']), ['Jane 1', 'Jane 2']
+        )
+
+        page_sql = queries[1]
+        self.assertEqual(page_sql.count('SELECT'), 1)
+        self.assertIn('"status" = \'pending\'', page_sql)
+        self.assertIn('"potential_commission" >=', page_sql)
+        self.assertIn('"potential_commission" <=', page_sql)
+        # The date window compares the raw column instead of casting each row
+        self.assertIn('"date_submitted" >=', page_sql)
+        self.assertNotIn('django_datetime_cast_date', page_sql)
+        self.assertNotIn('django_datetime_extract', page_sql)
+        # Search runs once, through the full-text index
+        self.assertNotIn('LIKE', page_sql)
+
+    def test_partner_and_date_range_filters(self):
+        response, _ = self.get({
+            'submitted_after': '2000-01-01', 'submitted_before': '2999-12-31',
+            'user': self.user.pk,
+        })
+        self.assertEqual(response.data['count'], 4)
+
+        response, _ = self.get({'partner_id': 0})
+        self.assertEqual(response.data['count'], 0)
+
+    def test_export_streams_filtered_rows(self):
+        response = self.client.get(
+            f'{self.url}export/', {'status': 'pending', 'min_commission': '15', 'search': 'jane'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('referrals-', response['Content-Disposition'])
+
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(rows[0][:3], ['ID', 'Submitted', 'Client'])
+        self.assertEqual(sorted(row[2] for row in rows[1:]), ['Jane 1', 'Jane 2'])
+
+    def test_export_xlsx(self):
+        response = self.client.get(f'{self.url}export/', {'export_format': 'xlsx', 'status': 'converted'})
+        self.assertEqual(response.status_code, 200)
+
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 2)
+        self.assertIn('Jane 3', sheet)
+        self.assertIn('<v>40.00</v>', sheet)
+
+        response = self.client.get(f'{self.url}export/', {'export_format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_support_agent_roles_are_resolved_once(self):
+        agent = User.objects.create_user(email='agent@example.com', password='pass', is_staff=True)
+        agent.groups.add(Group.objects.create(name='Support Agents'))
+        Referral.objects.create(user=agent, client_name='Agent lead', client_email='a@acme.com', client_phone='000')
+        self.client.force_authenticate(agent)
+
+        response, queries = self.get({})
+        self.assertEqual([r['client_name'] for r in response.data['results']], ['Agent lead'])
+        self.assertEqual(sum('"auth_group"."name"' in sql for sql in queries), 1)
+
+        # Later requests take the roles from the cache
+        response, queries = self.get({})
+        self.assertEqual([r['client_name'] for r in response.data['results']], ['Agent lead'])
+        self.assertFalse(any('auth_group' in sql for sql in queries))
+        self.assertEqual(len(queries), 2)
+
+
+@override_settings(TASK_BACKEND='eager')
+class ReferralEarningTaskTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.partner = PartnerProfile.objects.create(
+            user=self.user, name='Partner', email='profile@example.com',
+            phone='000', role='Consultant'
+        )
+
+    def test_earning_is_created_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            referral = Referral.objects.create(
+                user=self.user, client_name='Client', client_email='c@example.com',
+                client_phone='000', status='converted', potential_commission=Decimal('50.00'),
+            )
+            self.assertFalse(Earnings.objects.filter(referral=referral).exists())
+
+        earning = Earnings.objects.get(referral=referral)
+        self.assertEqual(earning.partner, self.partner)
+        self.assertEqual(earning.amount, Decimal('50.00'))
+
+    def test_repeated_saves_create_one_earning(self):
+        referral = Referral.objects.create(
+            user=self.user, client_name='Client', client_email='c@example.com',
+            client_phone='000', potential_commission=Decimal('50.00'),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            referral.status = 'converted'
+            referral.save()
+            referral.notes = 'Signed'
+            referral.save()
+
+        self.assertEqual(Earnings.objects.filter(referral=referral).count(), 1)
+
+    def test_partner_assigned_later_gets_an_earning(self):
+        user = User.objects.create_user(email='lead@example.com', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            referral = Referral.objects.create(
+                user=user, client_name='Client', client_email='c@example.com',
+                client_phone='000', status='converted', potential_commission=Decimal('50.00'),
+            )
+        self.assertFalse(Earnings.objects.filter(referral=referral).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            referral.partner = self.partner
+            referral.save()
+
+        earning = Earnings.objects.get(referral=referral)
+        self.assertEqual(earning.partner, self.partner)
+
+
+def has_fts5():
+    return connection.vendor == 'sqlite' and search._sqlite_has_fts5(connection)
+
+
+def create_referral(user, name, **kwargs):
+    return Referral.objects.create(
+        user=user, client_name=name, client_email=f'{name.split()[0].lower()}@example.org',
+        client_phone='000', **kwargs
+    )
+
+
+class SearchBackendTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+
+    def found(self, term):
+        return [r.client_name for r in search.search(Referral.objects.all(), term)]
+
+    def test_backend_follows_the_database_vendor(self):
+        fake = SimpleNamespace(alias='search-test', vendor='postgresql')
+        try:
+            backend = search.get_backend(fake)
+            self.assertIsInstance(backend, search.PostgresSearchBackend)
+            self.assertIs(search.get_backend(fake), backend)
+        finally:
+            search._backends.pop('search-test', None)
+
+        fake = SimpleNamespace(alias='search-test', vendor='oracle')
+        try:
+            self.assertEqual(search.get_backend(fake).name, search.IcontainsSearchBackend.name)
+        finally:
+            search._backends.pop('search-test', None)
+
+    def test_prefix_words_match_and_index_follows_writes(self):
+        jane = create_referral(self.user, 'Jane Doe', company='Acme Corp')
+        create_referral(self.user, 'John Smith')
+
+        self.assertEqual(self.found('ja do'), ['Jane Doe'])
+        self.assertEqual(self.found('acm'), ['Jane Doe'])
+        self.assertEqual(self.found('nobody'), [])
+
+        jane.client_name = 'Janet Roe'
+        jane.save()
+        self.assertEqual(self.found('roe'), ['Janet Roe'])
+        self.assertEqual(self.found('doe'), [])
+
+        jane.delete()
+        self.assertEqual(self.found('janet'), [])
+
+    @skipUnless(has_fts5(), "SQLite without FTS5")
+    def test_fts5_rank_and_rebuild(self):
+        self.assertEqual(search.get_backend(connection).name, search.SQLiteFTSSearchBackend.name)
+        create_referral(self.user, 'Jane Doe', notes='jane jane jane')
+        create_referral(self.user, 'Jane Smith')
+
+        results = list(search.search(Referral.objects.all(), 'jane'))
+        self.assertEqual(results[0].client_name, 'Jane Doe')
+        self.assertGreater(results[0].search_rank, results[1].search_rank)
+
+        # Rows written without signals are picked up by a rebuild
+        Referral.objects.filter(client_name='Jane Smith').update(client_name='Mary Smith')
+        self.assertEqual(self.found('mary'), [])
+        self.assertEqual(search.rebuild_index(Referral), 2)
+        self.assertEqual(self.found('mary'), ['Mary Smith'])
+
+    @skipUnless(connection.vendor == 'postgresql', "Postgres only")
+    def test_postgres_search_uses_the_gin_index(self):
+        create_referral(self.user, 'Jane Doe')
+        self.assertEqual(self.found('jan'), ['Jane Doe'])
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexdef FROM pg_indexes WHERE indexname = 'referral_search_gin'"
+            )
+            self.assertIn('to_tsvector', cursor.fetchone()[0])
+
+        sql = str(search.search(Referral.objects.all(), 'jan').query)
+        self.assertIn('to_tsvector', sql)
+        self.assertIn('@@', sql)
+
+
+class SearchBackendThreadTest(TransactionTestCase):
+    def run_in_thread(self, func):
+        errors = []
+
+        def target():
+            try:
+                func()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    def test_index_writes_from_another_thread(self):
+        user = User.objects.create_user(email='partner@example.com', password='pass')
+        # Resolve the backend on this thread first
+        self.assertEqual(list(search.search(Referral.objects.all(), 'jane')), [])
+
+        created = {}
+        self.run_in_thread(lambda: created.update(referral=create_referral(user, 'Jane Doe')))
+        self.assertEqual([r.pk for r in search.search(Referral.objects.all(), 'jane')], [created['referral'].pk])
+
+        def search_and_delete():
+            self.assertEqual(search.search(Referral.objects.all(), 'doe').count(), 1)
+            Referral.objects.get(pk=created['referral'].pk).delete()
+
+        self.run_in_thread(search_and_delete)
+        self.assertEqual(list(search.search(Referral.objects.all(), 'jane')), [])
+
+
+@skipUnless(has_fts5(), "SQLite without FTS5")
+class SearchIndexMigrationTest(TransactionTestCase):
+    def fts_tables(self):
+        return {name for name in connection.introspection.table_names() if name.endswith('_fts')}
+
+    def test_migration_creates_fills_and_drops_the_index(self):
+        user = User.objects.create_user(email='partner@example.com', password='pass')
+        create_referral(user, 'Jane Doe')
+        self.assertIn('referrals_management_referral_fts', self.fts_tables())
+
+        call_command('migrate', 'referrals_management', '0004', verbosity=0)
+        self.assertNotIn('referrals_management_referral_fts', self.fts_tables())
+
+        call_command('migrate', 'referrals_management', verbosity=0)
+        self.assertIn('referrals_management_referral_fts', self.fts_tables())
+        # Existing rows are indexed by the migration
+        self.assertEqual(search.search(Referral.objects.all(), 'jane').count(), 1)
+
+
+def referrals_csv(count, bad_row=None):
+    """CSV of ``count`` referral rows, with an unparseable line at ``bad_row``"""
+    lines = ['client_name,client_email,client_phone,status']
+    for i in range(1, count + 1):
+        if i == bad_row:
+            # Longer than the csv module accepts
+            lines.append('Broken ' + 'x' * csv.field_size_limit() + ',broken@example.org,000,pending')
+        else:
+            lines.append(f'Client {i},client{i}@example.org,000,{"converted" if i == 1 else "pending"}')
+    return ('\n'.join(lines) + '\n').encode()
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ReferralImportTest(TestCase):
+    url = '/api/referrals/bulk/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.partner = PartnerProfile.objects.create(
+            user=self.user, name='Partner', email='partner@example.com', phone='000', role='Owner',
+            referral_code='PARTNER1',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_importer_creates_referrals_and_side_effects(self):
+        rows = [
+            {'client_name': 'Jane Doe', 'client_email': 'jane@example.org', 'client_phone': '000',
+             'status': 'converted', 'potential_commission': '25.00'},
+            {'client_name': '', 'client_email': 'nope', 'client_phone': '000'},
+            {'client_name': 'John Smith', 'client_email': 'john@example.org', 'client_phone': '000'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            summary = ReferralImporter(self.user, chunk_size=1).run(rows)
+
+        self.assertEqual(summary['created'], 2)
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(summary['errors'][0]['row'], 2)
+        self.assertEqual(set(summary['errors'][0]['errors']), {'client_name', 'client_email'})
+
+        jane = Referral.objects.get(client_email='jane@example.org')
+        self.assertEqual(jane.partner, self.partner)
+        self.assertEqual(jane.referral_code, 'PARTNER1')
+        self.assertEqual(ReferralTimeline.objects.filter(note='Imported via bulk upload').count(), 2)
+        self.assertEqual(Earnings.objects.get(referral=jane).amount, Decimal('25.00'))
+
+    def test_bad_row_mid_file_keeps_committed_chunks(self):
+        with mock.patch('partner.dashboard_cache.invalidate') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(ImportParseError) as raised:
+                    ReferralImporter(self.user, chunk_size=2).run(
+                        iter_rows(referrals_csv(6, bad_row=5), 'csv')
+                    )
+
+        # Rows 1-4 went in two chunks; the aggregates still cover them
+        self.assertEqual(raised.exception.row, 5)
+        self.assertEqual(raised.exception.summary['created'], 4)
+        self.assertEqual(Referral.objects.count(), 4)
+        invalidate.assert_called_once()
+
+    def test_malformed_values_are_row_errors(self):
+        base = {'client_name': 'Jane Doe', 'client_email': 'jane@example.org', 'client_phone': '000'}
+        rows = [
+            {**base, 'client_name': 12345},
+            {**base, 'timeline': ['1_month']},
+            {**base, 'status': ['pending']},
+            {**base, 'potential_commission': '1e20'},
+            {**base, 'potential_commission': 'NaN'},
+            {**base, 'budget_range': 'x' * 51},
+            {**base, 'client_email': 'a' * 250 + '@example.org'},
+            {**base, 'client_name': {'first': 'Jane'}},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            summary = ReferralImporter(self.user).run(rows)
+
+        self.assertEqual(summary['created'], 1)
+        self.assertEqual(Referral.objects.get().client_name, '12345')
+        self.assertEqual(
+            [set(error['errors']) for error in summary['errors']],
+            [{'timeline'}, {'status'}, {'potential_commission'}, {'potential_commission'},
+             {'budget_range'}, {'client_email'}, {'client_name'}],
+        )
+
+    def test_endpoint_reports_malformed_json_values(self):
+        response = self.client.post(self.url, [
+            {'client_name': 'Jane Doe', 'client_email': 'jane@example.org', 'client_phone': '000',
+             'status': ['pending'], 'potential_commission': 'NaN'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(set(response.data['errors'][0]['errors']), {'status', 'potential_commission'})
+
+    def test_endpoint_imports_csv_upload(self):
+        upload = SimpleUploadedFile('referrals.csv', referrals_csv(3), content_type='text/csv')
+        response = self.client.post(self.url, {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(Referral.objects.filter(user=self.user).count(), 3)
+
+    def test_endpoint_reports_rows_imported_before_a_parse_error(self):
+        upload = SimpleUploadedFile('referrals.csv', referrals_csv(4, bad_row=3), content_type='text/csv')
+        with mock.patch('referrals_management.views.ReferralImporter', lambda user: ReferralImporter(user, chunk_size=1)):
+            response = self.client.post(self.url, {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['row'], 3)
+        self.assertEqual(response.data['created'], 2)
+        self.assertIn('row 3', response.data['error'])
+
+    def test_endpoint_rejects_an_empty_body(self):
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def write_file(self, content, suffix):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'wb') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_command_imports_file(self):
+        path = self.write_file(
+            b'{"client_name": "Jane Doe", "client_email": "jane@example.org", "client_phone": "000"}\n'
+            b'{"client_name": "John Smith", "client_email": "john@example.org", "client_phone": "000"}\n',
+            '.jsonl'
+        )
+        out = StringIO()
+        call_command('import_referrals', path, user='partner@example.com', stdout=out)
+
+        self.assertIn('Imported 2 referrals, 0 rows failed', out.getvalue())
+        self.assertEqual(Referral.objects.count(), 2)
+
+    def test_command_fails_on_a_bad_row_with_the_imported_count(self):
+        path = self.write_file(referrals_csv(4, bad_row=4), '.csv')
+        with self.assertRaisesMessage(CommandError, 'at row 4') as raised:
+            call_command('import_referrals', path, user='partner@example.com', chunk_size=2, stderr=StringIO())
+
+        self.assertIn('2 referrals were imported', str(raised.exception))
+        self.assertEqual(Referral.objects.count(), 2)
+
+
+    def test_command_ignores_the_partner_column_without_the_flag(self):
+        self.user.is_staff = True
+        self.user.save()
+        PartnerProfile.objects.create(
+            user=User.objects.create_user(email='other@example.com', password='pass'),
+            name='Other', email='other@example.com', phone='000', role='Owner', referral_code='OTHER1',
+            referral_link='/ref/OTHER1',
+        )
+        path = self.write_file(
+            b'{"client_name": "Jane Doe", "client_email": "jane@example.org", "client_phone": "000", '
+            b'"partner": "OTHER1"}\n',
+            '.jsonl'
+        )
+        call_command('import_referrals', path, user='partner@example.com', stdout=StringIO())
+        self.assertEqual(Referral.objects.get().partner, self.partner)
+
+        call_command('import_referrals', path, user='partner@example.com', partner_column=True, stdout=StringIO())
+        self.assertEqual(Referral.objects.latest('id').partner.referral_code, 'OTHER1')
+
+class TrackedFieldsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.partners = [
+            PartnerProfile.objects.create(
+                user=User.objects.create_user(email=f'p{i}@example.com', password='pass'),
+                name=f'Partner {i}', email=f'profile{i}@example.com', phone='000', role='Owner',
+            )
+            for i in range(2)
+        ]
+        self.referral = create_referral(self.user, 'Jane Doe', partner=self.partners[0])
+
+    def test_new_instances_have_no_snapshot(self):
+        referral = Referral(user=self.user, client_name='New', status=Referral.Status.PENDING)
+        referral.status = Referral.Status.CONVERTED
+        self.assertFalse(referral.has_changed('status'))
+        self.assertIsNone(referral.previous_value('status'))
+
+    def test_changes_are_measured_against_the_loaded_values(self):
+        referral = Referral.objects.get(pk=self.referral.pk)
+        self.assertFalse(referral.has_changed('status'))
+
+        referral.status = Referral.Status.CONVERTED
+        referral.partner = self.partners[1]
+        self.assertTrue(referral.has_changed('status'))
+        self.assertTrue(referral.has_changed('partner'))
+        self.assertEqual(referral.previous_value('status'), Referral.Status.PENDING)
+        self.assertEqual(referral.previous_value('partner'), self.partners[0].pk)
+
+        # Saving only some fields refreshes only their snapshot
+        referral.save(update_fields=['status'])
+        self.assertFalse(referral.has_changed('status'))
+        self.assertTrue(referral.has_changed('partner'))
+
+        referral.save()
+        self.assertFalse(referral.has_changed('partner'))
+        self.assertEqual(referral.previous_value('partner'), self.partners[1].pk)
+
+    def test_deferred_fields_are_snapshotted_when_loaded(self):
+        referral = Referral.objects.only('id', 'client_name').get(pk=self.referral.pk)
+        self.assertNotIn('status', referral.loaded_values)
+        self.assertIsNone(referral.previous_value('status'))
+        self.assertFalse(referral.has_changed('status'))
+
+        # Reading the deferred field loads it through refresh_from_db
+        self.assertEqual(referral.status, Referral.Status.PENDING)
+        self.assertEqual(referral.previous_value('status'), Referral.Status.PENDING)
+        referral.status = Referral.Status.REJECTED
+        self.assertTrue(referral.has_changed('status'))
+
+    def test_refresh_from_db_resets_the_snapshot(self):
+        referral = Referral.objects.get(pk=self.referral.pk)
+        Referral.objects.filter(pk=referral.pk).update(status=Referral.Status.CONVERTED)
+        referral.refresh_from_db()
+        self.assertEqual(referral.previous_value('status'), Referral.Status.CONVERTED)
+        self.assertFalse(referral.has_changed('status'))
+
+        Referral.objects.filter(pk=referral.pk).update(status=Referral.Status.REJECTED)
+        referral.status = Referral.Status.PENDING
+        referral.refresh_from_db(fields=['status'])
+        self.assertEqual(referral.previous_value('status'), Referral.Status.REJECTED)
+
+    def test_previous_rollup_key_with_deferred_fields(self):
+        referral = Referral.objects.only('id', 'partner').get(pk=self.referral.pk)
+        referral.partner = self.partners[1]
+
+        self.assertEqual(
+            _previous_key(referral, rollups.referral_rollup_key),
+            (timezone.localdate(self.referral.date_submitted), self.partners[0].pk, None)
+        )
+        # Saving the deferred instance moves the referral between slices
+        referral.save()
+        self.assertEqual(Referral.objects.get(pk=referral.pk).partner_id, self.partners[1].pk)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ReferralKeysetPaginationTest(TestCase):
+    url = '/api/referrals/partner/referrals/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        # Three referrals share a timestamp; the pk breaks the tie
+        now = timezone.now()
+        for i, age in enumerate([0, 1, 1, 1, 2]):
+            referral = create_referral(self.user, f'Client {i}')
+            Referral.objects.filter(pk=referral.pk).update(date_submitted=now - timedelta(days=age))
+        self.expected = list(Referral.objects.order_by('-date_submitted', '-pk').values_list('pk', flat=True))
+
+    def page(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data, [row['id'] for row in response.data['results']]
+
+    def test_pages_walk_ties_forward_and_back(self):
+        data, ids = self.page(self.url, {'pagination': 'keyset', 'page_size': 2})
+        self.assertNotIn('count', data)
+        self.assertIsNone(data['previous'])
+        pages = [ids]
+        while data['next']:
+            data, ids = self.page(data['next'])
+            pages.append(ids)
+
+        self.assertEqual(pages, [self.expected[0:2], self.expected[2:4], self.expected[4:]])
+
+        # Walk back from the last page
+        backwards = []
+        while data['previous']:
+            data, ids = self.page(data['previous'])
+            backwards.append(ids)
+        self.assertEqual(backwards, [self.expected[2:4], self.expected[0:2]])
+        self.assertIsNotNone(data['next'])
+
+    def test_ordering_param_is_ignored_and_count_is_optional(self):
+        data, ids = self.page(self.url, {'pagination': 'keyset', 'ordering': 'client_name', 'count': 'true'})
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(data['count'], 5)
+        self.assertIsNone(data['next'])
+
+    def test_bad_cursor_is_not_found(self):
+        for cursor in ('not-base64!', 'eyJ2IjogMX0=', ''):
+            response = self.client.get(self.url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404 if cursor else 200, cursor)
+
+    def test_page_numbers_remain_the_default(self):
+        data, ids = self.page(self.url, {'page_size': 2, 'page': 2})
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(len(ids), 2)
@@ -1,11 +1,12 @@
 # referrals/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ReferralViewSet
+from .views import ReferralViewSet, ReferralBulkImportView
 
 router = DefaultRouter()
 router.register(r'partner/referrals', ReferralViewSet)
 
 urlpatterns = [
+    path('bulk/', ReferralBulkImportView.as_view(), name='referral-bulk-import'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
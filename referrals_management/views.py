@@ -1,13 +1,18 @@
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from affiliateos.export import ExportMixin
+from affiliateos.pagination import OptionalKeysetPagination
+from authentication.roles import get_roles
+from affiliateos.search import FullTextSearchFilter
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Count, Sum, Q
 from django.db.models.functions import TruncDay
 from .models import Referral, ReferralTimeline
-from django.utils import timezone
-from datetime import timedelta
+from .filters import ReferralFilter
+from .importer import ImportParseError, ReferralImporter, iter_rows
 
 from .serializers import (
     ReferralSerializer, ReferralCreateSerializer, 
@@ -15,19 +20,36 @@ from .serializers import (
     ReferralTimelineSerializer
 )
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(OptionalKeysetPagination):
+    """Page numbers by default; ?pagination=keyset for keyset pages"""
     page_size = 25
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class ReferralViewSet(viewsets.ModelViewSet):
+class ReferralViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Referral.objects.all()
+    keyset_ordering_field = 'date_submitted'
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['status', 'user', 'product', 'referral_code']
-    search_fields = ['client_name', 'client_email', 'company', 'notes']
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
+    filterset_class = ReferralFilter
     ordering_fields = ['date_submitted', 'updated_at', 'potential_commission', 'actual_commission']
+    export_filename = 'referrals'
+    export_fields = [
+        ('ID', 'id'),
+        ('Submitted', 'date_submitted'),
+        ('Client', 'client_name'),
+        ('Email', 'client_email'),
+        ('Phone', 'client_phone'),
+        ('Company', 'company'),
+        ('Product', 'product__name'),
+        ('Partner', 'partner__name'),
+        ('Referral code', 'referral_code'),
+        ('Status', 'status'),
+        ('Potential commission', 'potential_commission'),
+        ('Actual commission', 'actual_commission'),
+        ('Updated', 'updated_at'),
+    ]
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -61,85 +83,17 @@ class ReferralViewSet(viewsets.ModelViewSet):
             return ReferralListSerializer
         return ReferralSerializer
     
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        
-              # Check if user is a support agent (in 'Support Agents' group)
-        is_support_agent = user.groups.filter(name='Support Agents').exists()
-
-        # Filter if: non-staff OR staff who are support agents
-        if not user.is_staff or (user.is_staff and is_support_agent):
-            queryset = queryset.filter(user=user)
-            
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-            
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
     def get_queryset(self):
         queryset = super().get_queryset()
-        user = self.request.user
-
-        # Check if user is a support agent (in 'Support Agents' group)
-        is_support_agent = user.groups.filter(name='Support Agents').exists()
+        roles = get_roles(self.request)
 
         # Filter if: non-staff OR staff who are support agents
-        if not user.is_staff or (user.is_staff and is_support_agent):
-            queryset = queryset.filter(user=user)
-        # Apply search filter if provided
-        search_term = self.request.query_params.get('search')
-        if search_term:
-            queryset = queryset.filter(
-                Q(client_name__icontains=search_term) |
-                Q(client_email__icontains=search_term) |
-                Q(client_phone__icontains=search_term) |
-                Q(company__icontains=search_term) |
-                Q(notes__icontains=search_term)
-            )
-        
-        # Apply status filter if provided
-        status_filter = self.request.query_params.get('status')
-        if status_filter and status_filter != 'all':
-            queryset = queryset.filter(status=status_filter)
-        
-        # Apply product filter if provided
-        product_filter = self.request.query_params.get('product')
-        if product_filter and product_filter != 'all':
-            queryset = queryset.filter(product_id=product_filter)
-        
-        # Apply date filter if provided
-        date_filter = self.request.query_params.get('date')
-        if date_filter and date_filter != 'all':
-            today = timezone.now().date()
-            if date_filter == 'today':
-                queryset = queryset.filter(date_submitted__date=today)
-            elif date_filter == 'thisWeek':
-                start_of_week = today - timedelta(days=today.weekday())
-                queryset = queryset.filter(date_submitted__date__gte=start_of_week)
-            elif date_filter == 'thisMonth':
-                queryset = queryset.filter(date_submitted__month=today.month, date_submitted__year=today.year)
-            elif date_filter == 'last3Months':
-                three_months_ago = today - timedelta(days=90)
-                queryset = queryset.filter(date_submitted__date__gte=three_months_ago)
-
-        # ✅ Move partner filter above the return
-        partner_id = self.request.query_params.get('partner_id')
-        if partner_id:
-            queryset = queryset.filter(user__partner_profile__id=partner_id)
-
-        # Optional: commission filters can stay here too
-        min_commission = self.request.query_params.get('min_commission')
-        max_commission = self.request.query_params.get('max_commission')
-
-        if min_commission:
-            queryset = queryset.filter(potential_commission__gte=float(min_commission))
-        if max_commission:
-            queryset = queryset.filter(potential_commission__lte=float(max_commission))
+        if not roles.is_staff or roles.is_support_agent:
+            queryset = queryset.filter(user=self.request.user)
 
+        # status, product, date windows, commission range and partner come
+        # from ReferralFilter; ?search= from FullTextSearchFilter
         return queryset.order_by('-date_submitted')
-        
 
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
@@ -156,23 +110,30 @@ class ReferralViewSet(viewsets.ModelViewSet):
         """Return referral statistics"""
         queryset = self.filter_queryset(self.get_queryset())
         
+        totals = queryset.aggregate(
+            total=Count('id'),
+            converted=Count('id', filter=Q(status='converted'))
+        )
+        # Grouped queries drop the default ordering so it doesn't join the GROUP BY
+        grouped = queryset.order_by()
+
         stats = {
-            'total_referrals': queryset.count(),
-            'by_status': queryset.values('status').annotate(
+            'total_referrals': totals['total'],
+            'by_status': grouped.values('status').annotate(
                 count=Count('id'),
                 total_potential=Sum('potential_commission'),
                 total_actual=Sum('actual_commission')
             ),
-            'by_product': queryset.values(
+            'by_product': grouped.values(
                 'product__name'
             ).annotate(
                 count=Count('id')
             ).filter(product__isnull=False),
             'conversion_rate': {
-                'all': queryset.filter(status='converted').count() / queryset.count() * 100 
-                if queryset.count() > 0 else 0
+                'all': totals['converted'] / totals['total'] * 100
+                if totals['total'] > 0 else 0
             },
-            'timeline': queryset.annotate(
+            'timeline': grouped.annotate(
                 date=TruncDay('date_submitted')
             ).values('date').annotate(
                 count=Count('id')
@@ -209,3 +170,42 @@ class ReferralViewSet(viewsets.ModelViewSet):
         # Serialize and return the timeline entries
         serializer = ReferralTimelineSerializer(timeline_entries, many=True)
         return Response(serializer.data)
+
+
+class ReferralBulkImportView(APIView):
+    """
+    Import many referrals in one request.
+    Accepts an uploaded CSV/JSON file in `file`, or a JSON list of referrals
+    as the request body. Staff may set a `partner` referral code per row.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload:
+            file_format = request.data.get('format') or (
+                'csv' if upload.name.lower().endswith('.csv') else 'json'
+            )
+            if file_format not in ('csv', 'json'):
+                return Response({'error': 'Format must be csv or json'}, status=status.HTTP_400_BAD_REQUEST)
+            rows = iter_rows(upload, file_format)
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            return Response(
+                {'error': 'Upload a CSV/JSON file or send a list of referrals'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            summary = ReferralImporter(request.user).run(rows)
+        except ImportParseError as e:
+            # Rows before the bad one may already be imported; say how many
+            return Response(
+                {'error': f'Could not parse file at row {e.row}: {str(e)}', 'row': e.row, **e.summary},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        response_status = status.HTTP_201_CREATED if summary['created'] else status.HTTP_400_BAD_REQUEST
+        return Response(summary, status=response_status)
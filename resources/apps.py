@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ResourcesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'resources'
+
+    def ready(self):
+        from affiliateos import counters, search
+
+        search.register(self.get_model('Resource'))
+        counters.register(self.get_model('Resource'))
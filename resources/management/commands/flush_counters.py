@@ -0,0 +1,42 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from affiliateos import counters
+
+
+class Command(BaseCommand):
+    help = "Write buffered download and view counters to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=None,
+            help="Keep running and flush every INTERVAL seconds until stopped"
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if not interval:
+            self.flush()
+            return
+
+        stopping = []
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stopping.append(True))
+
+        while not stopping:
+            self.flush()
+            # Sleep in short steps so a stop request is handled promptly
+            deadline = time.monotonic() + interval
+            while not stopping and time.monotonic() < deadline:
+                time.sleep(0.5)
+        # Final flush on shutdown
+        self.flush()
+
+    def flush(self):
+        updated = counters.flush()
+        if updated is None:
+            self.stdout.write("Another process is flushing counters, skipped")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Flushed {updated} counter updates"))
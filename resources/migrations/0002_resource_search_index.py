@@ -0,0 +1,18 @@
+from django.db import migrations
+
+from affiliateos.search import create_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0001_initial'),
+    ]
+
+    operations = [
+        create_search_index(
+            'resources', 'Resource',
+            ('title', 'description'),
+            index_name='resource_search_gin',
+        ),
+    ]
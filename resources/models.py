@@ -53,6 +53,11 @@ class Resource(models.Model):
     download_count = models.PositiveIntegerField(default=0)
     view_count = models.PositiveIntegerField(default=0)
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='uploaded_resources')
+
+    # Text columns behind ?search=, see affiliateos.search
+    search_index_fields = ('title', 'description')
+    # Hit counters, buffered and flushed in bulk, see affiliateos.counters
+    counter_fields = ('download_count', 'view_count')
     
     class Meta:
         ordering = ['-update_date']
@@ -1,3 +1,136 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from affiliateos import counters
+
+from .models import Resource, ResourceCategory
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], MEDIA_ROOT=MEDIA_ROOT)
+class ResourceCounterTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='partner@example.com', password='pass')
+        self.resource = Resource.objects.create(
+            title='Brochure', description='-', resource_type='pdf',
+            category=ResourceCategory.objects.create(name='Sales', slug='sales'),
+            file=SimpleUploadedFile('brochure.pdf', b'%PDF-1.4 brochure'),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/resources/{self.resource.pk}/'
+
+    def test_hits_are_buffered_until_flushed(self):
+        update_date = self.resource.update_date
+        for _ in range(3):
+            self.client.post(f'{self.url}increment_view/')
+        self.client.get(f'{self.url}download/')
+        # Further ranges of the same download aren't counted again
+        self.client.get(f'{self.url}download/', HTTP_RANGE='bytes=4-')
+
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.view_count, 0)
+        self.assertEqual(counters.pending(Resource, self.resource.pk, 'view_count'), 3)
+
+        self.assertEqual(counters.flush(), 2)
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.view_count, 3)
+        self.assertEqual(self.resource.download_count, 1)
+        self.assertEqual(self.resource.update_date, update_date)
+        self.assertEqual(counters.pending(Resource, self.resource.pk, 'view_count'), 0)
+
+    def test_flush_adds_to_the_stored_count(self):
+        Resource.objects.filter(pk=self.resource.pk).update(view_count=10)
+        counters.incr(Resource, self.resource.pk, 'view_count', 2)
+
+        out = StringIO()
+        call_command('flush_counters', stdout=out)
+        self.assertIn('Flushed 1 counter updates', out.getvalue())
+
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.view_count, 12)
+        # Nothing left to write
+        self.assertEqual(counters.flush(), 0)
+
+    def test_only_registered_fields_are_counted(self):
+        with self.assertRaises(ValueError):
+            counters.incr(Resource, self.resource.pk, 'file_size')
+
+    @override_settings(FILE_DELIVERY_BACKEND='x-accel-redirect')
+    def test_proxied_downloads_are_counted_once(self):
+        # The proxy answers the range; Django's response is a plain 200
+        for header in (None, 'bytes=0-3', 'bytes=4-', 'bytes=5-3'):
+            extra = {'HTTP_RANGE': header} if header else {}
+            response = self.client.get(f'{self.url}download/', **extra)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('X-Accel-Redirect', response)
+
+        # Whole file, first range and the ignored malformed range
+        self.assertEqual(counters.pending(Resource, self.resource.pk, 'download_count'), 3)
+
+    def index(self):
+        return counters._store().get(counters._index_key(Resource)) or set()
+
+    def test_flushed_rows_leave_the_index_until_hit_again(self):
+        counters.incr(Resource, self.resource.pk, 'view_count')
+        self.assertEqual(self.index(), {self.resource.pk})
+
+        self.assertEqual(counters.flush(), 1)
+        self.assertEqual(self.index(), set())
+        self.assertEqual(counters.flush(), 0)
+
+        # The zeroed counter is counted into again and the row re-indexed
+        counters.incr(Resource, self.resource.pk, 'view_count', 4)
+        self.assertEqual(self.index(), {self.resource.pk})
+        self.assertEqual(counters.flush(), 1)
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.view_count, 5)
+
+    def test_idle_counters_expire(self):
+        counters.incr(Resource, self.resource.pk, 'view_count')
+        counters.flush()
+        key = counters._value_key(Resource, self.resource.pk, 'view_count')
+        self.assertEqual(counters._store().get(key), 0)
+
+        counters._store().touch(key, timeout=-1)
+        counters.incr(Resource, self.resource.pk, 'view_count', 2)
+        self.assertEqual(counters.pending(Resource, self.resource.pk, 'view_count'), 2)
+        self.assertEqual(self.index(), {self.resource.pk})
+
+    def test_counter_lost_during_a_flush_is_written_once(self):
+        counters.incr(Resource, self.resource.pk, 'download_count', 3)
+        store = counters._store()
+
+        def evicted(key, delta):
+            store.delete(key)
+            raise ValueError(f"Key '{key}' not found")
+
+        with mock.patch.object(store, 'decr', side_effect=evicted):
+            self.assertEqual(counters.flush(), 1)
+
+        self.assertEqual(self.index(), set())
+        self.assertEqual(counters.flush(), 0)
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.download_count, 3)
+
+    def test_deploy_check_warns_about_a_per_process_store(self):
+        warnings = counters.check_shared_store(None)
+        self.assertEqual([warning.id for warning in warnings], ['affiliateos.W001'])
@@ -8,8 +8,8 @@ from .serializers import (
     ResourceSerializer, ResourceCategorySerializer, 
     ResourceTagSerializer, ResourceUploadSerializer
 )
-from django.http import FileResponse
 from django.shortcuts import get_object_or_404
+from affiliateos import counters, files, search as search_index
 
 class ResourceCategoryViewSet(viewsets.ModelViewSet):
     queryset = ResourceCategory.objects.all()
@@ -57,10 +57,7 @@ class ResourceViewSet(viewsets.ModelViewSet):
         
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | 
-                Q(description__icontains=search)
-            )
+            queryset = search_index.search(queryset, search)
         
         tags = self.request.query_params.getlist('tags')
         if tags:
@@ -85,17 +82,17 @@ class ResourceViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
         resource = self.get_object()
-        resource.download_count += 1
-        resource.save()
-        
-        file_handle = resource.file.open()
-        response = FileResponse(file_handle, content_type='application/octet-stream')
-        response['Content-Disposition'] = f'attachment; filename="{resource.file.name}"'
+        response = files.serve(request, resource.file)
+
+        # Seeking and resuming send further ranges; count each download once.
+        # Proxy backends answer ranges with a 200 here, so go by the range.
+        byte_range = response.byte_range
+        if response.status_code in (200, 206) and (byte_range is None or byte_range[0] == 0):
+            counters.incr(Resource, resource.pk, 'download_count')
         return response
     
     @action(detail=True, methods=['post'])
     def increment_view(self, request, pk=None):
         resource = self.get_object()
-        resource.view_count += 1
-        resource.save()
+        counters.incr(Resource, resource.pk, 'view_count')
         return Response({'status': 'view count incremented'})
\ No newline at end of file
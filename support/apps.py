@@ -5,4 +5,7 @@ class SupportConfig(AppConfig):
     name = 'support'
 
     def ready(self):
-        import support.signals
\ No newline at end of file
+        import support.signals
+        from affiliateos import search
+
+        search.register(self.get_model('SupportTicket'))
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+from affiliateos.search import create_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('support', '0002_activitylog'),
+    ]
+
+    operations = [
+        create_search_index(
+            'support', 'SupportTicket',
+            ('subject', 'description', 'name', 'email', 'affiliate_id'),
+            index_name='supportticket_search_gin',
+        ),
+    ]
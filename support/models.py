@@ -49,6 +49,9 @@ class SupportTicket(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Text columns behind ?search=, see affiliateos.search
+    search_index_fields = ('subject', 'description', 'name', 'email', 'affiliate_id')
+
     def __str__(self):
         return f"{self.subject} - {self.get_status_display()}"
 
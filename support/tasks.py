@@ -0,0 +1,24 @@
+# support/tasks.py
+from affiliateos.tasks import task
+
+from .models import ActivityLog
+
+
+@task
+def record_activity(ticket_id, activity_type, description, performed_by_id=None, metadata=None):
+    ActivityLog.objects.create(
+        ticket_id=ticket_id,
+        activity_type=activity_type,
+        description=description,
+        performed_by_id=performed_by_id,
+        metadata=metadata,
+    )
+
+
+def log_activity(ticket, activity_type, description, performed_by=None, metadata=None):
+    """Write a ticket activity log entry after the request's transaction commits"""
+    record_activity.delay(
+        ticket.pk, activity_type, description,
+        performed_by_id=getattr(performed_by, 'pk', None),
+        metadata=metadata,
+    )
@@ -7,9 +7,13 @@ from rest_framework.exceptions import NotFound
 from authentication.models import User
 from rest_framework.views import APIView
 
+from affiliateos.search import FullTextSearchFilter
+from authentication.roles import get_roles
+
 from django.db import models
 
-from .models import SupportTicket, Comment, SupportTicketAttachment, ActivityLog
+from .models import SupportTicket, Comment, SupportTicketAttachment
+from .tasks import log_activity
 from .serializers import (
     SupportTicketSerializer, 
     CreateSupportTicketSerializer,
@@ -27,12 +31,8 @@ class IsAdminOrSupportAgent(permissions.BasePermission):
     """
     def has_permission(self, request, view):
         # Check if user is authenticated and is either admin or support agent
-        return (
-            request.user and 
-            request.user.is_authenticated and 
-            request.user.is_staff and 
-            request.user.user_type in ['admin', 'support_agent']
-        )
+        roles = get_roles(request)
+        return roles.is_admin or roles.is_support_agent
 
 class IsSupportAgentAssignedToTicket(permissions.BasePermission):
     """
@@ -40,19 +40,21 @@ class IsSupportAgentAssignedToTicket(permissions.BasePermission):
     """
     def has_object_permission(self, request, view, obj):
         user = request.user
+        roles = get_roles(request)
         # Admin can access any ticket
-        if user.is_staff and user.user_type == 'admin':
+        if roles.is_admin:
             return True
         # Support agent can access tickets assigned to them OR created by them
-        elif user.is_staff and user.user_type == 'support_agent':
-            return obj.assigned_to == user or obj.submitted_by == user
+        elif roles.is_support_agent:
+            return obj.assigned_to_id == user.pk or obj.submitted_by_id == user.pk
         # Regular users can access their own tickets
-        return obj.submitted_by == user
+        return obj.submitted_by_id == user.pk
 
 class SupportTicketViewSet(viewsets.ModelViewSet):
     queryset = SupportTicket.objects.all().order_by('-created_at')
     serializer_class = SupportTicketSerializer
     permission_classes = [permissions.IsAuthenticated, IsSupportAgentAssignedToTicket]
+    filter_backends = [FullTextSearchFilter]
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -65,7 +67,7 @@ class SupportTicketViewSet(viewsets.ModelViewSet):
         ticket = serializer.save(submitted_by=self.request.user)
         
         # Log ticket creation activity
-        ActivityLog.objects.create(
+        log_activity(
             ticket=ticket,
             activity_type='created',
             description=f"Ticket '{ticket.subject}' has been created",
@@ -88,7 +90,7 @@ class SupportTicketViewSet(viewsets.ModelViewSet):
         
         # Log status change
         if old_status != ticket.status:
-            ActivityLog.objects.create(
+            log_activity(
                 ticket=ticket,
                 activity_type='status_change',
                 description=f"Status changed from '{old_status}' to '{ticket.status}'",
@@ -101,7 +103,7 @@ class SupportTicketViewSet(viewsets.ModelViewSet):
         
         # Log priority change
         if old_priority != ticket.priority:
-            ActivityLog.objects.create(
+            log_activity(
                 ticket=ticket,
                 activity_type='priority_change',
                 description=f"Priority changed from '{old_priority}' to '{ticket.priority}'",
@@ -117,7 +119,7 @@ class SupportTicketViewSet(viewsets.ModelViewSet):
             new_assignee = ticket.assigned_to.get_full_name() if ticket.assigned_to else "No one"
             old_assignee = old_assigned_to.get_full_name() if old_assigned_to else "No one"
             
-            ActivityLog.objects.create(
+            log_activity(
                 ticket=ticket,
                 activity_type='assignment',
                 description=f"Ticket reassigned from {old_assignee} to {new_assignee}",
@@ -131,11 +133,12 @@ class SupportTicketViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        roles = get_roles(self.request)
         # Admins can see all tickets
-        if user.is_staff and user.user_type == 'admin':
+        if roles.is_admin:
             return self.queryset
         # Support agents can see tickets assigned to them OR created by them
-        elif user.is_staff and user.user_type == 'support_agent':
+        elif roles.is_support_agent:
             return self.queryset.filter(
                 models.Q(assigned_to=user) | 
                 models.Q(submitted_by=user)
@@ -153,7 +156,7 @@ class SupportTicketViewSet(viewsets.ModelViewSet):
         )
         
         # Log comment activity
-        ActivityLog.objects.create(
+        log_activity(
             ticket=ticket,
             activity_type='comment',
             description=f"Comment added by {request.user.get_full_name() or request.user.email}",
@@ -175,7 +178,7 @@ class SupportTicketViewSet(viewsets.ModelViewSet):
         )
         
         # Log file upload activity
-        ActivityLog.objects.create(
+        log_activity(
             ticket=ticket,
             activity_type='file_upload',
             description=f"File '{request.FILES['file'].name}' uploaded",
@@ -211,7 +214,7 @@ class SupportTicketViewSet(viewsets.ModelViewSet):
         attachment.delete()
         
         # Log file deletion activity
-        ActivityLog.objects.create(
+        log_activity(
             ticket=ticket,
             activity_type='file_delete',
             description=f"File '{filename}' deleted",
@@ -326,7 +329,7 @@ class SupportTicketViewSet(viewsets.ModelViewSet):
         ticket.save()
         
         # Log status change
-        ActivityLog.objects.create(
+        log_activity(
             ticket=ticket,
             activity_type='status_change',
             description=f"Status changed from '{old_status}' to '{new_status}'",
@@ -408,7 +411,7 @@ class SupportTicketViewSet(viewsets.ModelViewSet):
         # Log assignment change
         old_assignee = old_assigned_to.get_full_name() if old_assigned_to else "No one"
         
-        ActivityLog.objects.create(
+        log_activity(
             ticket=ticket,
             activity_type='assignment',
             description=f"Ticket reassigned from {old_assignee} to {new_assignee}",
@@ -432,12 +435,13 @@ class CommentViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        roles = get_roles(self.request)
         
         # Admins can see all comments
-        if user.is_staff and user.user_type == 'admin':
+        if roles.is_admin:
             return self.queryset
         # Support agents can only see comments on tickets assigned to them
-        elif user.is_staff and user.user_type == 'support_agent':
+        elif roles.is_support_agent:
             return self.queryset.filter(
                 models.Q(ticket__assigned_to=user) | 
                 models.Q(ticket__assigned_to__isnull=True) |
@@ -451,10 +455,11 @@ class CommentViewSet(viewsets.ModelViewSet):
         
         # Check if user has permission to comment on this ticket
         user = self.request.user
-        if user.is_staff and user.user_type == 'admin':
+        roles = get_roles(self.request)
+        if roles.is_admin:
             # Admin can comment on any ticket
             pass
-        elif user.is_staff and user.user_type == 'support_agent':
+        elif roles.is_support_agent:
             # Support agent can only comment on assigned tickets or unassigned tickets
             ticket = SupportTicket.objects.get(id=ticket_id)
             if ticket.assigned_to != user and ticket.assigned_to is not None:
@@ -468,7 +473,7 @@ class CommentViewSet(viewsets.ModelViewSet):
         comment = serializer.save(author=self.request.user)
         
         # Log comment activity
-        ActivityLog.objects.create(
+        log_activity(
             ticket=comment.ticket,
             activity_type='comment',
             description=f"Comment added by {self.request.user.get_full_name() or self.request.user.email}",